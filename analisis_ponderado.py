@@ -10,10 +10,46 @@ Este script implementa exactamente lo que describiste:
 """
 
 import automatizacion.calcularf1_score as cf1
+from automatizacion.registro_modelos import RegistroModelos
+from automatizacion.almacen_predicciones import AlmacenPredicciones
+from automatizacion.mezcla_predicciones import mezclar
+from automatizacion.memoria_compartida import DataFramePublicado, leer_dataframe
+from automatizacion.servidor_trabajos import ServidorTrabajos, ejecutar_worker, HOST, PUERTO
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import os
 from datetime import datetime
 
+# Registro y almacén se crean la primera vez que se usan (no al importar el
+# módulo): así importarlo no crea directorios ni bases de datos
+_REGISTRO = None
+_ALMACEN = None
+_lock_recursos = threading.Lock()
+
+def registro():
+    """Registro compartido: reutiliza modelos ya entrenados con los mismos datos"""
+    global _REGISTRO
+    with _lock_recursos:
+        if _REGISTRO is None:
+            _REGISTRO = RegistroModelos()
+    return _REGISTRO
+
+def almacen():
+    """Histórico de predicciones de todas las ejecuciones (columnar y comprimido)"""
+    global _ALMACEN
+    with _lock_recursos:
+        if _ALMACEN is None:
+            _ALMACEN = AlmacenPredicciones()
+    return _ALMACEN
+
+# Entornos de análisis: archivo de entrenamiento y peso en el ensemble
+ENTORNOS = {
+    'local': {'archivo_train': 'train_local.csv', 'peso': 0.3},
+    'colab': {'archivo_train': 'train_colab.csv', 'peso': 0.7}
+}
+
 def analisis_local():
     """
     Análisis a ejecutar en el entorno LOCAL
@@ -24,7 +60,7 @@ def analisis_local():
     try:
         # Entrenar modelo con dataset local
         print("🚀 Entrenando modelo con train_local.csv...")
-        modelo_local = cf1.entrenar_modelo_completo('train_local.csv')
+        modelo_local, _ = registro().entrenar_o_reutilizar('train_local.csv', 'local')
         
         # Evaluar en test_public
         print("📊 Evaluando en test_public.csv...")
@@ -49,20 +85,24 @@ def analisis_local():
         df_resultado = pd.DataFrame([resultado_local])
         df_resultado.to_csv(f'resultado_local_{timestamp}.csv', index=False)
         
-        # Guardar predicciones
-        pred_public_local.to_csv(f'predicciones_public_local_{timestamp}.csv', index=False)
-        pred_private_local.to_csv(f'predicciones_private_local_{timestamp}.csv', index=False)
+        # Archivar predicciones
+        metadatos = {'dataset_entrenamiento': 'train_local.csv', 'f1_score': f1_local, 'timestamp': timestamp}
+        ejecucion_public = almacen().guardar(pred_public_local, 'public_local', modelo_local.threshold_optimo, metadatos)
+        ejecucion_private = almacen().guardar(pred_private_local, 'private_local', modelo_local.threshold_optimo, metadatos)
         
         print(f"✅ RESULTADO LOCAL:")
         print(f"   🎯 F1-Score: {f1_local:.4f}")
         print(f"   📊 Muestras entrenamiento: {len(pd.read_csv('train_local.csv')):,}")
-        print(f"   💾 Archivos guardados con timestamp: {timestamp}")
+        print(f"   💾 Resultado guardado con timestamp: {timestamp}")
+        print(f"   🗃️ Predicciones archivadas: ejecuciones {ejecucion_public} y {ejecucion_private}")
         
         return {
             'f1_score': f1_local,
             'timestamp': timestamp,
             'predicciones_public': pred_public_local,
-            'predicciones_private': pred_private_local
+            'predicciones_private': pred_private_local,
+            'ejecucion_public': ejecucion_public,
+            'ejecucion_private': ejecucion_private
         }
         
     except Exception as e:
@@ -81,7 +121,7 @@ def analisis_colab():
     try:
         # Entrenar modelo con dataset de Colab
         print("🚀 Entrenando modelo con train_colab.csv...")
-        modelo_colab = cf1.entrenar_modelo_completo('train_colab.csv')
+        modelo_colab, _ = registro().entrenar_o_reutilizar('train_colab.csv', 'colab')
         
         # Evaluar en test_public
         print("📊 Evaluando en test_public.csv...")
@@ -106,29 +146,246 @@ def analisis_colab():
         df_resultado = pd.DataFrame([resultado_colab])
         df_resultado.to_csv(f'resultado_colab_{timestamp}.csv', index=False)
         
-        # Guardar predicciones
-        pred_public_colab.to_csv(f'predicciones_public_colab_{timestamp}.csv', index=False)
-        pred_private_colab.to_csv(f'predicciones_private_colab_{timestamp}.csv', index=False)
+        # Archivar predicciones
+        metadatos = {'dataset_entrenamiento': 'train_colab.csv', 'f1_score': f1_colab, 'timestamp': timestamp}
+        ejecucion_public = almacen().guardar(pred_public_colab, 'public_colab', modelo_colab.threshold_optimo, metadatos)
+        ejecucion_private = almacen().guardar(pred_private_colab, 'private_colab', modelo_colab.threshold_optimo, metadatos)
         
         print(f"✅ RESULTADO COLAB:")
         print(f"   🎯 F1-Score: {f1_colab:.4f}")
         print(f"   📊 Muestras entrenamiento: {len(pd.read_csv('train_colab.csv')):,}")
-        print(f"   💾 Archivos guardados con timestamp: {timestamp}")
+        print(f"   💾 Resultado guardado con timestamp: {timestamp}")
+        print(f"   🗃️ Predicciones archivadas: ejecuciones {ejecucion_public} y {ejecucion_private}")
         
         return {
             'f1_score': f1_colab,
             'timestamp': timestamp,
             'predicciones_public': pred_public_colab,
-            'predicciones_private': pred_private_colab
+            'predicciones_private': pred_private_colab,
+            'ejecucion_public': ejecucion_public,
+            'ejecucion_private': ejecucion_private
         }
         
     except Exception as e:
         print(f"❌ Error en análisis Colab: {e}")
         return None
 
-def combinar_resultados(f1_local, f1_colab, pred_local=None, pred_colab=None):
+def _analisis_worker(entorno, archivo_train, descriptores, n_jobs):
+    """
+    Análisis de un entorno dentro de un proceso del pool
+    
+    Los tests llegan ya limpios en shared memory; aquí se entrena (o reutiliza)
+    el modelo, se imputan con sus valores de entrenamiento y se hace una pasada
+    de predicción.
+    """
+    
+    cf1.N_JOBS = n_jobs
+    
+    inicio = datetime.now()
+    modelo, modelo_hash = registro().entrenar_o_reutilizar(archivo_train, entorno)
+    
+    datasets = {nombre: leer_dataframe(descriptor) for nombre, descriptor in descriptores.items()}
+    scores = modelo.predecir_lote(datasets, calcular_f1=True, verbose=False, limpios=True)
+    
+    return {
+        'entorno': entorno,
+        'modelo_hash': modelo_hash,
+        'threshold': modelo.threshold_optimo,
+        'n_train': len(modelo.huellas_train) if modelo.huellas_train is not None else None,
+        'f1_score': scores['public'][1],
+        'predicciones_public': scores['public'][0],
+        'predicciones_private': scores['private'][0],
+        'duracion': (datetime.now() - inicio).total_seconds()
+    }
+
+def ejecutar_analisis_paralelo(entornos=None, max_procesos=None):
+    """
+    Análisis de varios entornos en paralelo, en un pool de procesos
+    
+    test_public.csv y test_private.csv se leen y limpian una sola vez en
+    este proceso y se pasan a los workers por shared memory. Los cores se
+    reparten entre los workers (cf1.N_JOBS), así que el tiempo total se acerca
+    al del entorno más lento en lugar de a la suma.
+    
+    Args:
+        entornos (list): Entornos de ENTORNOS a analizar (por defecto los que tengan archivo)
+        max_procesos (int): Procesos simultáneos (por defecto uno por entorno, hasta los cores)
+    
+    Returns:
+        dict: {entorno: resultado como el de analisis_local()}
+    """
+    
+    if entornos is None:
+        entornos = [e for e, config in ENTORNOS.items() if os.path.exists(config['archivo_train'])]
+    if not entornos:
+        print("⚠️ No hay archivos de entrenamiento para analizar")
+        return {}
+    
+    cores = os.cpu_count() or 1
+    procesos = max(1, min(len(entornos), max_procesos or cores))
+    n_jobs = max(1, cores // procesos)
+    
+    print(f"⚡ ANÁLISIS PARALELO: {', '.join(entornos)} ({procesos} procesos × {n_jobs} cores)")
+    print("="*50)
+    
+    # Limpieza de los tests compartidos: una sola vez para todos los entornos
+    # (la imputación depende de cada modelo y se hace en el worker)
+    preprocesador = cf1.ModeloCoronario()
+    publicados = {
+        nombre: DataFramePublicado(preprocesador.limpiar_datos(pd.read_csv(archivo)))
+        for nombre, archivo in (('public', 'test_public.csv'), ('private', 'test_private.csv'))
+    }
+    descriptores = {nombre: publicado.descriptor for nombre, publicado in publicados.items()}
+    
+    resultados = {}
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    try:
+        # spawn: los workers no heredan las conexiones SQLite abiertas de este proceso
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futuros = {
+                entorno: pool.submit(
+                    _analisis_worker, entorno, ENTORNOS[entorno]['archivo_train'], descriptores, n_jobs
+                )
+                for entorno in entornos
+            }
+            
+            for entorno, futuro in futuros.items():
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    print(f"❌ Error en análisis {entorno}: {e}")
+                    continue
+                
+                # Guardar resultado y archivar predicciones (en el padre: un solo escritor)
+                pd.DataFrame([{
+                    'entorno': entorno,
+                    'dataset_entrenamiento': ENTORNOS[entorno]['archivo_train'],
+                    'f1_score': resultado['f1_score'],
+                    'timestamp': timestamp,
+                    'peso': ENTORNOS[entorno]['peso']
+                }]).to_csv(f'resultado_{entorno}_{timestamp}.csv', index=False)
+                
+                metadatos = {
+                    'dataset_entrenamiento': ENTORNOS[entorno]['archivo_train'],
+                    'f1_score': resultado['f1_score'],
+                    'modelo_hash': resultado['modelo_hash'],
+                    'timestamp': timestamp
+                }
+                resultado['timestamp'] = timestamp
+                resultado['ejecucion_public'] = almacen().guardar(
+                    resultado['predicciones_public'], f'public_{entorno}', resultado['threshold'], metadatos
+                )
+                resultado['ejecucion_private'] = almacen().guardar(
+                    resultado['predicciones_private'], f'private_{entorno}', resultado['threshold'], metadatos
+                )
+                
+                print(f"✅ RESULTADO {entorno.upper()}: F1 {resultado['f1_score']:.4f} "
+                      f"({resultado['duracion']:.1f}s)")
+                resultados[entorno] = resultado
+    finally:
+        for publicado in publicados.values():
+            publicado.liberar()
+    
+    return resultados
+
+def ejecutar_analisis_distribuido(entornos=None, workers_locales=1, host=HOST, puerto=PUERTO,
+                                  token=None, timeout=None):
+    """
+    Análisis de cada entorno como trabajo del servidor de trabajos
+    
+    Publica una partición de entrenamiento por entorno junto con los tests;
+    los workers (locales y/o remotos, p.ej. Colab con
+    `python -m automatizacion.servidor_trabajos --url ...`) entrenan y
+    devuelven modelo y probabilidades, que llegan registradas y archivadas.
+    
+    Args:
+        entornos (list): Entornos de ENTORNOS (por defecto los que tengan archivo)
+        workers_locales (int): Workers a lanzar en esta máquina (0 = solo remotos)
+        host, puerto: Dirección del coordinador ('0.0.0.0' para aceptar otras máquinas, exige token)
+        token (str): Secreto compartido con los workers
+        timeout (float): Segundos máximos de espera
+    
+    Returns:
+        dict: {entorno: resultado como el de ejecutar_analisis_paralelo()}
+    """
+    
+    if entornos is None:
+        entornos = [e for e, config in ENTORNOS.items() if os.path.exists(config['archivo_train'])]
+    if not entornos:
+        print("⚠️ No hay archivos de entrenamiento para analizar")
+        return {}
+    
+    servidor = ServidorTrabajos(host, puerto, token=token, registro=registro(), almacen=almacen())
+    servidor.iniciar()
+    
+    workers = []
+    try:
+        tests = {'public': 'test_public.csv', 'private': 'test_private.csv'}
+        trabajos = {
+            servidor.publicar(entorno, ENTORNOS[entorno]['archivo_train'], tests, peso=ENTORNOS[entorno]['peso']): entorno
+            for entorno in entornos
+        }
+        
+        # Workers locales: repartir los cores entre ellos
+        contexto = multiprocessing.get_context('spawn')
+        n_jobs = max(1, (os.cpu_count() or 1) // max(workers_locales, 1))
+        url_local = f"http://127.0.0.1:{servidor.httpd.server_address[1]}"
+        for i in range(workers_locales):
+            worker = contexto.Process(
+                target=ejecutar_worker,
+                args=(url_local, f'local-{i}', token, n_jobs, True),
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        
+        print(f"⏳ Esperando {len(trabajos)} trabajos ({workers_locales} workers locales)...")
+        terminados = servidor.esperar(trabajos, timeout)
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+        servidor.detener()
+    
+    resultados = {}
+    for trabajo_id, trabajo in terminados.items():
+        entorno = trabajos[trabajo_id]
+        if trabajo['estado'] != 'completado':
+            print(f"❌ Trabajo {entorno} fallido: {trabajo['error']}")
+            continue
+        
+        resultado = trabajo['resultado']
+        resultados[entorno] = {
+            'entorno': entorno,
+            'modelo_hash': resultado['modelo_hash'],
+            'threshold': resultado['threshold'],
+            'f1_score': resultado['f1'].get('public'),
+            'predicciones_public': almacen().leer(resultado['ejecuciones']['public']),
+            'predicciones_private': almacen().leer(resultado['ejecuciones']['private']),
+            'ejecucion_public': resultado['ejecuciones']['public'],
+            'ejecucion_private': resultado['ejecuciones']['private'],
+            'duracion': resultado['duracion']
+        }
+    
+    return resultados
+
+def cargar_etiquetas(archivo_csv='test_public.csv'):
+    """ID y Condición de un archivo de test con target (None si no existe o no tiene target)"""
+    
+    if not os.path.exists(archivo_csv):
+        return None
+    
+    etiquetas = pd.read_csv(archivo_csv, usecols=lambda col: col in ('ID', 'Condición'))
+    return etiquetas if 'Condición' in etiquetas.columns else None
+
+def combinar_resultados(f1_local, f1_colab, pred_local=None, pred_colab=None,
+                        public_local=None, public_colab=None, etiquetas_public=None):
     """
     Combina los resultados de local y Colab con ponderación
+    
+    Las predicciones se alinean por ID (no por posición de fila). Si se pasan
+    las predicciones de test_public de ambos entornos y sus etiquetas, el
+    threshold del ensemble se reoptimiza sobre la mezcla de public.
     """
     print("🧮 COMBINANDO RESULTADOS LOCAL + COLAB")
     print("="*50)
@@ -174,15 +431,23 @@ def combinar_resultados(f1_local, f1_colab, pred_local=None, pred_colab=None):
     if pred_local is not None and pred_colab is not None:
         print("🤖 Creando ensemble de predicciones...")
         
-        # Combinar predicciones con ponderación en las probabilidades
-        pred_ensemble = pred_local.copy()
+        pesos = [peso_local, peso_colab]
+        
+        # Threshold reoptimizado sobre la mezcla de test_public
+        threshold = None
+        if public_local is not None and public_colab is not None and etiquetas_public is not None:
+            mezcla_public = mezclar([public_local, public_colab], pesos, etiquetas=etiquetas_public)
+            threshold = mezcla_public['threshold']
+            resultado_final['f1_ensemble_public'] = mezcla_public['f1']
+            print(f"🎚️ Threshold reoptimizado: {threshold:.3f} (F1 ensemble public: {mezcla_public['f1']:.4f})")
         
-        # Ponderar probabilidades
-        prob_ponderada = (pred_local['Probabilidad'] * peso_local) + (pred_colab['Probabilidad'] * peso_colab)
+        # Ponderar probabilidades alineadas por ID
+        mezcla = mezclar([pred_local, pred_colab], pesos, threshold=threshold)
+        pred_ensemble = mezcla['predicciones']
+        resultado_final['threshold_ensemble'] = mezcla['threshold']
         
-        # Nueva predicción basada en probabilidad ponderada
-        pred_ensemble['Condición'] = (prob_ponderada >= 0.5).astype(int)
-        pred_ensemble['Probabilidad'] = prob_ponderada
+        if mezcla['filas_descartadas']:
+            print(f"⚠️ {mezcla['filas_descartadas']:,} IDs no están en ambas fuentes y se descartan")
         
         # Guardar submission ensemble
         submission_ensemble = pred_ensemble[['ID', 'Condición']]
@@ -192,35 +457,86 @@ def combinar_resultados(f1_local, f1_colab, pred_local=None, pred_colab=None):
         print(f"📝 Submission ensemble: {archivo_submission}")
         
         resultado_final['archivo_submission'] = archivo_submission
+        resultado_final['ejecucion_ensemble'] = almacen().guardar(
+            pred_ensemble, 'private_ensemble', mezcla['threshold'],
+            {'peso_local': peso_local, 'peso_colab': peso_colab, 'f1_ponderado': f1_ponderado}
+        )
     
     return resultado_final
 
-def ejecutar_analisis_completo():
+def mezclar_archivadas(entornos, pesos=None, archivo_etiquetas='test_public.csv'):
+    """
+    Ensemble de las últimas predicciones archivadas de cualquier número de entornos
+    
+    Args:
+        entornos (list): Nombres de entorno archivados (p.ej. ['local', 'colab', 'auto'])
+        pesos (list): Peso de cada entorno (por defecto iguales)
+        archivo_etiquetas (str): Test con target para reoptimizar el threshold
+    
+    Returns:
+        dict: Resultado de mezclar() sobre test_private, con 'f1_public' si hubo etiquetas
+    """
+    
+    ejecuciones = {}
+    for particion in ('public', 'private'):
+        ejecuciones[particion] = [almacen().ultima(f'{particion}_{entorno}') for entorno in entornos]
+        faltan = [e for e, ejecucion in zip(entornos, ejecuciones[particion]) if ejecucion is None]
+        if faltan:
+            raise KeyError(f"❌ Sin predicciones {particion} archivadas para: {', '.join(faltan)}")
+    
+    # Threshold reoptimizado sobre la mezcla de public, aplicado a private
+    threshold = None
+    f1_public = None
+    etiquetas = cargar_etiquetas(archivo_etiquetas)
+    if etiquetas is not None:
+        mezcla_public = mezclar([almacen().leer(e) for e in ejecuciones['public']], pesos, etiquetas=etiquetas)
+        threshold = mezcla_public['threshold']
+        f1_public = mezcla_public['f1']
+        print(f"🎚️ Threshold reoptimizado: {threshold:.3f} (F1 ensemble public: {f1_public:.4f})")
+    
+    mezcla = mezclar([almacen().leer(e) for e in ejecuciones['private']], pesos, threshold=threshold)
+    mezcla['f1_public'] = f1_public
+    
+    print(f"🤖 Ensemble de {len(entornos)} entornos: {mezcla['filas']:,} predicciones")
+    
+    return mezcla
+
+def ejecutar_analisis_completo(paralelo=True, distribuido=False, **opciones_distribuido):
     """
     Ejecuta el análisis completo en el entorno actual
+    
+    Args:
+        paralelo (bool): Analizar local y Colab a la vez (ejecutar_analisis_paralelo)
+        distribuido (bool): Repartir los entornos entre workers (ejecutar_analisis_distribuido)
+        **opciones_distribuido: workers_locales, host, puerto, token, timeout
     """
     print("🚀 ANÁLISIS PONDERADO COMPLETO")
     print("="*60)
     
     resultados = {}
     
-    # Análisis local
-    if os.path.exists('train_local.csv'):
-        print("\n🏠 EJECUTANDO ANÁLISIS LOCAL:")
-        resultado_local = analisis_local()
-        if resultado_local:
-            resultados['local'] = resultado_local
-    else:
-        print("⚠️ train_local.csv no encontrado - saltando análisis local")
-    
-    # Análisis Colab (solo si estamos en un entorno que lo permita)
-    if os.path.exists('train_colab.csv'):
-        print("\n☁️ EJECUTANDO ANÁLISIS COLAB:")
-        resultado_colab = analisis_colab()
-        if resultado_colab:
-            resultados['colab'] = resultado_colab
+    for entorno, config in ENTORNOS.items():
+        if not os.path.exists(config['archivo_train']):
+            print(f"⚠️ {config['archivo_train']} no encontrado - saltando análisis {entorno}")
+    
+    if distribuido:
+        resultados.update(ejecutar_analisis_distribuido(**opciones_distribuido))
+    elif paralelo:
+        resultados.update(ejecutar_analisis_paralelo())
     else:
-        print("⚠️ train_colab.csv no encontrado - saltando análisis Colab")
+        # Análisis local
+        if os.path.exists('train_local.csv'):
+            print("\n🏠 EJECUTANDO ANÁLISIS LOCAL:")
+            resultado_local = analisis_local()
+            if resultado_local:
+                resultados['local'] = resultado_local
+        
+        # Análisis Colab (solo si estamos en un entorno que lo permita)
+        if os.path.exists('train_colab.csv'):
+            print("\n☁️ EJECUTANDO ANÁLISIS COLAB:")
+            resultado_colab = analisis_colab()
+            if resultado_colab:
+                resultados['colab'] = resultado_colab
     
     # Combinar si tenemos ambos
     if 'local' in resultados and 'colab' in resultados:
@@ -229,7 +545,10 @@ def ejecutar_analisis_completo():
             f1_local=resultados['local']['f1_score'],
             f1_colab=resultados['colab']['f1_score'],
             pred_local=resultados['local']['predicciones_private'],
-            pred_colab=resultados['colab']['predicciones_private']
+            pred_colab=resultados['colab']['predicciones_private'],
+            public_local=resultados['local']['predicciones_public'],
+            public_colab=resultados['colab']['predicciones_public'],
+            etiquetas_public=cargar_etiquetas('test_public.csv')
         )
         resultados['final'] = resultado_final
     else:
@@ -253,6 +572,10 @@ def generar_codigo_colab():
 #    - test_private.csv
 
 # 2. Ejecutar este código en Colab:
+#
+#    (Alternativa sin descargar CSVs: con el coordinador en marcha en local,
+#     opción 5 de analisis_ponderado.py, conectar Colab como worker)
+#    !python -m automatizacion.servidor_trabajos --url http://<coordinador>:8766 --token <token>
 
 import calcularf1_score as cf1
 import pandas as pd
@@ -314,8 +637,9 @@ if __name__ == "__main__":
     print("2. Generar código para Google Colab")
     print("3. Solo análisis local")
     print("4. Solo combinar resultados existentes")
+    print("5. Análisis distribuido (servidor de trabajos + workers)")
     
-    opcion = input("\nSelecciona opción (1-4): ").strip()
+    opcion = input("\nSelecciona opción (1-5): ").strip()
     
     if opcion == "1":
         resultados = ejecutar_analisis_completo()
@@ -334,8 +658,35 @@ if __name__ == "__main__":
     elif opcion == "4":
         f1_local = float(input("Ingresa F1-Score local: "))
         f1_colab = float(input("Ingresa F1-Score Colab: "))
-        resultado = combinar_resultados(f1_local, f1_colab)
+        
+        # Últimas predicciones archivadas de cada entorno, si las hay
+        historico = almacen()
+        ejecuciones = {
+            nombre: historico.ultima(nombre)
+            for nombre in ('private_local', 'private_colab', 'public_local', 'public_colab')
+        }
+        faltan = [nombre for nombre, ejecucion in ejecuciones.items() if ejecucion is None]
+        if faltan:
+            print(f"⚠️ No hay predicciones archivadas de: {', '.join(faltan)}")
+        predicciones = {
+            nombre: historico.leer(ejecucion) if ejecucion is not None else None
+            for nombre, ejecucion in ejecuciones.items()
+        }
+        
+        resultado = combinar_resultados(
+            f1_local, f1_colab, predicciones['private_local'], predicciones['private_colab'],
+            predicciones['public_local'], predicciones['public_colab'], cargar_etiquetas('test_public.csv')
+        )
         print(f"✅ F1 ponderado: {resultado['f1_ponderado']:.4f}")
         
+    elif opcion == "5":
+        workers_locales = int(input("Workers locales (0 = solo remotos): ") or 1)
+        token = input("Token para workers remotos (vacío = solo workers en esta máquina): ").strip() or None
+        host = '0.0.0.0' if token else HOST    # Solo se escucha fuera de localhost con token
+        resultados = ejecutar_analisis_completo(
+            distribuido=True, workers_locales=workers_locales, host=host, token=token
+        )
+        print(f"\n✅ Análisis distribuido completado. Resultados: {list(resultados.keys())}")
+        
     else:
         print("❌ Opción no válida")
@@ -0,0 +1,236 @@
+# ================================
+# 🗃️ ALMACÉN COLUMNAR DE PREDICCIONES
+# ================================
+# Cada ejecución se guarda como una columna float32 de probabilidades, ordenada
+# por ID y comprimida por bloques, en un único archivo append-only + índice SQLite
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from automatizacion.base_datos import ConexionSQLite
+
+DIRECTORIO_ALMACEN = 'predicciones_store'
+FILAS_POR_BLOQUE = 65536
+NIVEL_COMPRESION = 1
+
+def _comprimir(valores):
+    """float32 -> bytes comprimidos (byte shuffle: agrupa los bytes de igual peso, comprime mejor)"""
+    return zlib.compress(valores.view(np.uint8).reshape(-1, 4).T.tobytes(), NIVEL_COMPRESION)
+
+def _descomprimir(datos, n_filas):
+    return np.frombuffer(zlib.decompress(datos), dtype=np.uint8).reshape(4, n_filas).T.copy().view(np.float32).ravel()
+
+class AlmacenPredicciones:
+    """
+    Archivo de predicciones de todas las ejecuciones
+
+    En disco:
+      <directorio>/columnas.dat   bloques comprimidos, solo se añaden al final
+      <directorio>/indice.db      ejecuciones (metadatos + posición de sus bloques)
+                                  y conjuntos de IDs (guardados una sola vez)
+
+    Leer una ejecución es una búsqueda por clave primaria y una lectura
+    contigua; leer varias devuelve una matriz (filas, ejecuciones) alineada por ID.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_ALMACEN):
+        self.directorio = directorio
+        self.ruta_datos = os.path.join(directorio, 'columnas.dat')
+        os.makedirs(directorio, exist_ok=True)
+
+        self.db = ConexionSQLite.compartida(os.path.join(directorio, 'indice.db'))
+        self._cache_ids = {}
+        self._lock = threading.Lock()
+
+        with self.db.transaccion() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ejecuciones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    hash_ids TEXT NOT NULL,
+                    n_filas INTEGER NOT NULL,
+                    threshold REAL,
+                    bloques TEXT NOT NULL,
+                    metadatos TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conjuntos_ids (
+                    hash_ids TEXT PRIMARY KEY,
+                    n_filas INTEGER NOT NULL,
+                    ids BLOB NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ejecuciones_nombre ON ejecuciones(nombre, fecha)')
+
+    def guardar(self, predicciones, nombre, threshold=None, metadatos=None):
+        """
+        Añadir una ejecución al almacén
+
+        Args:
+            predicciones (pd.DataFrame): Columnas 'ID' y 'Probabilidad'
+            nombre (str): Origen de la ejecución (p.ej. 'public_local', 'private_colab')
+            threshold (float): Threshold usado para las etiquetas (opcional)
+            metadatos (dict): Información adicional (modelo, F1, archivo...)
+
+        Returns:
+            int: ID de la ejecución
+        """
+
+        ids = predicciones['ID'].to_numpy().astype(np.int64)
+        orden = np.argsort(ids, kind='stable')
+        ids = ids[orden]
+        proba = predicciones['Probabilidad'].to_numpy()[orden].astype(np.float32)
+        hash_ids = hashlib.sha256(ids.tobytes()).hexdigest()
+
+        bloques_comprimidos = [
+            (min(FILAS_POR_BLOQUE, len(proba) - inicio), _comprimir(proba[inicio:inicio + FILAS_POR_BLOQUE]))
+            for inicio in range(0, len(proba), FILAS_POR_BLOQUE)
+        ]
+
+        # BEGIN IMMEDIATE serializa a los escritores (también entre procesos):
+        # el offset leído al final del archivo no puede cambiar hasta el commit
+        with self.db.transaccion() as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO conjuntos_ids (hash_ids, n_filas, ids) VALUES (?, ?, ?)',
+                (hash_ids, len(ids), zlib.compress(ids.tobytes(), NIVEL_COMPRESION))
+            )
+
+            bloques = []
+            with open(self.ruta_datos, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                for n_filas, datos in bloques_comprimidos:
+                    f.write(datos)
+                    bloques.append([offset, len(datos), n_filas])
+                    offset += len(datos)
+                f.flush()
+                os.fsync(f.fileno())
+
+            cursor = conn.execute('''
+                INSERT INTO ejecuciones (nombre, fecha, hash_ids, n_filas, threshold, bloques, metadatos)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                nombre,
+                datetime.now().isoformat(),
+                hash_ids,
+                len(ids),
+                threshold,
+                json.dumps(bloques),
+                json.dumps(metadatos or {}, default=str)
+            ))
+
+        return cursor.lastrowid
+
+    def _ids(self, hash_ids):
+        with self._lock:
+            if hash_ids not in self._cache_ids:
+                n_filas, datos = self.db.consultar_uno(
+                    'SELECT n_filas, ids FROM conjuntos_ids WHERE hash_ids = ?', (hash_ids,)
+                )
+                self._cache_ids[hash_ids] = np.frombuffer(zlib.decompress(datos), dtype=np.int64, count=n_filas)
+            return self._cache_ids[hash_ids]
+
+    def _info(self, ejecucion_id):
+        fila = self.db.consultar_uno(
+            'SELECT hash_ids, n_filas, bloques FROM ejecuciones WHERE id = ?', (ejecucion_id,)
+        )
+        if fila is None:
+            raise KeyError(f"❌ Ejecución no encontrada: {ejecucion_id}")
+        return fila[0], fila[1], json.loads(fila[2])
+
+    def _leer_columna(self, f, bloques):
+        partes = []
+        for offset, longitud, n_filas in bloques:
+            f.seek(offset)
+            partes.append(_descomprimir(f.read(longitud), n_filas))
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.float32)
+
+    def leer(self, ejecucion_id):
+        """
+        Probabilidades de una ejecución
+
+        Returns:
+            tuple: (ids ordenados int64, probabilidades float32)
+        """
+
+        hash_ids, _, bloques = self._info(ejecucion_id)
+        with open(self.ruta_datos, 'rb') as f:
+            proba = self._leer_columna(f, bloques)
+        return self._ids(hash_ids), proba
+
+    def leer_varios(self, ejecucion_ids):
+        """
+        Varias ejecuciones como matriz alineada por ID
+
+        Se alinean a los IDs de la primera ejecución; las filas que falten en
+        otra ejecución quedan como NaN.
+
+        Returns:
+            tuple: (ids int64, matriz float32 de forma (n_filas, n_ejecuciones))
+        """
+
+        infos = [self._info(ejecucion_id) for ejecucion_id in ejecucion_ids]
+        ids_ref = self._ids(infos[0][0])
+        matriz = np.full((len(ids_ref), len(infos)), np.nan, dtype=np.float32)
+
+        with open(self.ruta_datos, 'rb') as f:
+            for j, (hash_ids, _, bloques) in enumerate(infos):
+                proba = self._leer_columna(f, bloques)
+                if hash_ids == infos[0][0]:
+                    matriz[:, j] = proba
+                    continue
+
+                ids = self._ids(hash_ids)
+                pos = np.minimum(np.searchsorted(ids, ids_ref), len(ids) - 1)
+                coincide = ids[pos] == ids_ref
+                matriz[coincide, j] = proba[pos[coincide]]
+
+        return ids_ref, matriz
+
+    def como_dataframe(self, ejecucion_id, threshold=None):
+        """Ejecución en el formato de predicciones habitual (ID, Condición, Probabilidad)"""
+
+        ids, proba = self.leer(ejecucion_id)
+        if threshold is None:
+            (threshold,) = self.db.consultar_uno('SELECT threshold FROM ejecuciones WHERE id = ?', (ejecucion_id,))
+        if threshold is None:
+            threshold = 0.5
+
+        return pd.DataFrame({
+            'ID': ids,
+            'Condición': (proba >= threshold).astype(int),
+            'Probabilidad': proba
+        })
+
+    def listar(self, nombre=None):
+        """Índice de ejecuciones (más recientes primero)"""
+
+        consulta = 'SELECT id, nombre, fecha, n_filas, threshold, metadatos FROM ejecuciones'
+        parametros = ()
+        if nombre is not None:
+            consulta += ' WHERE nombre = ?'
+            parametros = (nombre,)
+        consulta += ' ORDER BY id DESC'
+
+        df = pd.DataFrame(
+            self.db.consultar(consulta, parametros),
+            columns=['id', 'nombre', 'fecha', 'n_filas', 'threshold', 'metadatos']
+        )
+        df['metadatos'] = df['metadatos'].map(json.loads)
+        return df
+
+    def ultima(self, nombre):
+        """ID de la ejecución más reciente con ese nombre (o None)"""
+
+        fila = self.db.consultar_uno(
+            'SELECT id FROM ejecuciones WHERE nombre = ? ORDER BY id DESC LIMIT 1', (nombre,)
+        )
+        return fila[0] if fila else None
@@ -3,8 +3,9 @@
 # ================================
 # Sistema completo de entrenamiento continuo y submissions automáticas
 
-import requests
-import sqlite3
+import asyncio
+import httpx
+import random
 import pandas as pd
 import numpy as np
 import json
@@ -12,17 +13,19 @@ import time
 import logging
 import schedule
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import hashlib
-import pickle
 from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
 # Imports de ML
 import automatizacion.calcularf1_score as calcularf1_score
-from mejora_iterativa import mejorar_modelo_automatico
+from automatizacion.registro_modelos import RegistroModelos
+from automatizacion.base_datos import ConexionSQLite
+from automatizacion.almacen_predicciones import AlmacenPredicciones
+from automatizacion.trazas import span
 
 # ================================
 # 🔧 CONFIGURACIÓN
@@ -38,6 +41,7 @@ class Config:
     # Límites de submissions
     MAX_SUBMISSIONS_PER_DAY = 7
     MIN_MEJORA_REQUERIDA = 0.001  # Mejora mínima para subir
+    MIN_DIFERENCIA_SUBMISSION = 0.002  # Fracción mínima de etiquetas distintas vs submissions anteriores
     
     # Archivos de configuración
     DB_FILE = "submissions_db.sqlite"
@@ -45,6 +49,9 @@ class Config:
     LOG_FILE = "submissions.log"
     CREDENTIALS_FILE = "kaggle_credentials.json"
     
+    # Entrenamiento (crece entre ciclos: las filas nuevas se añaden en modo incremental)
+    ARCHIVO_TRAIN = "train_local.csv"
+    
     # Intervalos de tiempo
     ENTRENAMIENTO_INTERVALO_HORAS = 4
     VERIFICACION_INTERVALO_MINUTOS = 30
@@ -52,36 +59,227 @@ class Config:
     # Directorios
     MODELS_DIR = "models_backup"
     SUBMISSIONS_DIR = "submissions_backup"
+    PREDICTIONS_DIR = "predicciones_store"
+    
+    # Cliente HTTP
+    MAX_CONEXIONES_API = 10
+    PETICIONES_POR_SEGUNDO_API = 5
+    MAX_REINTENTOS_API = 4
+    BACKOFF_BASE_API = 0.5      # Segundos
+    BACKOFF_MAX_API = 30
+    CACHE_INFO_COMPETENCIA_SEGUNDOS = 300
+    TIMEOUTS_API = {            # Segundos por endpoint
+        'default': 10,
+        'verificacion': 5,
+        'info': 10,
+        'resultados': 10,
+        'submission': 120
+    }
 
-class NeuroKupAPI:
-    """Cliente API para interactuar con NeuroKup II"""
+class LimitadorTokens:
+    """
+    Token bucket para asyncio
+
+    `capacidad` tokens como máximo, recargados a `tokens_por_segundo`.
+    """
     
-    def __init__(self, username, api_key):
-        self.username = username
-        self.api_key = api_key
-        self.session = requests.Session()
-        self.session.auth = (username, api_key)
+    def __init__(self, capacidad, tokens_por_segundo):
+        self.capacidad = capacidad
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens = capacidad
+        self.ultima_recarga = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultima_recarga) * self.tokens_por_segundo)
+        self.ultima_recarga = ahora
+    
+    def intentar_adquirir(self):
+        """Tomar un token si hay uno disponible (sin esperar)"""
         
-        # Configurar logging
-        logging.basicConfig(
-            filename=Config.LOG_FILE,
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
+        self._recargar()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    async def adquirir(self):
+        """Esperar hasta tener un token"""
+        
+        async with self._lock:
+            while not self.intentar_adquirir():
+                await asyncio.sleep((1 - self.tokens) / self.tokens_por_segundo)
+
+class CupoDiario:
+    """
+    Límite de submissions por día UTC guardado en la base de datos
+
+    El contador se reinicia a medianoche UTC, igual que el de Kaggle, y
+    sobrevive a reinicios del proceso. Reservar y liberar son sentencias
+    atómicas, así que varios procesos sobre la misma base no se pasan del límite.
+    """
+    
+    def __init__(self, db_file=Config.DB_FILE, limite=None):
+        self.db = ConexionSQLite.compartida(db_file)
+        self.limite = Config.MAX_SUBMISSIONS_PER_DAY if limite is None else limite
+        
+        self.db.ejecutar('''
+            CREATE TABLE IF NOT EXISTS cupo_submissions (
+                dia TEXT PRIMARY KEY,
+                usadas INTEGER NOT NULL
+            )
+        ''')
+    
+    @staticmethod
+    def dia_actual():
+        """Fecha UTC de hoy (YYYY-MM-DD)"""
+        return datetime.now(timezone.utc).date().isoformat()
+    
+    def usadas_hoy(self):
+        fila = self.db.consultar_uno('SELECT usadas FROM cupo_submissions WHERE dia = ?', (self.dia_actual(),))
+        return fila[0] if fila else 0
+    
+    def restantes(self):
+        return max(self.limite - self.usadas_hoy(), 0)
+    
+    def reservar(self):
+        """
+        Tomar una submission del cupo de hoy
+        
+        Returns:
+            str o None: Día reservado (para `liberar`) o None si no queda cupo
+        """
+        
+        dia = self.dia_actual()
+        with self.db.transaccion() as conn:
+            conn.execute('INSERT OR IGNORE INTO cupo_submissions (dia, usadas) VALUES (?, 0)', (dia,))
+            cursor = conn.execute(
+                'UPDATE cupo_submissions SET usadas = usadas + 1 WHERE dia = ? AND usadas < ?',
+                (dia, self.limite)
+            )
+        return dia if cursor.rowcount else None
+    
+    def liberar(self, dia):
+        """Devolver una reserva no consumida (nunca por encima del límite)"""
+        
+        self.db.ejecutar(
+            'UPDATE cupo_submissions SET usadas = MAX(usadas - 1, 0) WHERE dia = ?', (dia,)
         )
+    
+    def sincronizar(self, usadas):
+        """Ajustar el contador de hoy a otro mayor (p.ej. el del servidor)"""
+        
+        dia = self.dia_actual()
+        with self.db.transaccion() as conn:
+            conn.execute('INSERT OR IGNORE INTO cupo_submissions (dia, usadas) VALUES (?, 0)', (dia,))
+            conn.execute(
+                'UPDATE cupo_submissions SET usadas = MAX(usadas, MIN(?, ?)) WHERE dia = ?',
+                (int(usadas), self.limite, dia)
+            )
+
+class ClienteNeuroKupAsync:
+    """
+    Cliente asyncio para la API de NeuroKup II
+    
+    - Pool de conexiones acotado y reutilizado (httpx.AsyncClient)
+    - Timeouts por endpoint (Config.TIMEOUTS_API)
+    - Reintentos con backoff exponencial y jitter para errores de red, 429 y 5xx
+    - Token bucket general de peticiones
+    - Cupo de submissions por día UTC persistido en `db_file` (CupoDiario)
+    
+    `base_url` permite apuntarlo a un servidor mock local.
+    """
+    
+    def __init__(self, username, api_key, base_url=None, submissions_hoy=0,
+                 max_conexiones=None, max_reintentos=None, db_file=Config.DB_FILE):
+        self.auth = (username, api_key)
+        self.base_url = base_url or Config.API_BASE_URL
+        self.max_conexiones = max_conexiones or Config.MAX_CONEXIONES_API
+        self.max_reintentos = Config.MAX_REINTENTOS_API if max_reintentos is None else max_reintentos
         self.logger = logging.getLogger(__name__)
         
-        # Crear directorios
-        Path(Config.MODELS_DIR).mkdir(exist_ok=True)
-        Path(Config.SUBMISSIONS_DIR).mkdir(exist_ok=True)
+        self.limitador = LimitadorTokens(Config.PETICIONES_POR_SEGUNDO_API, Config.PETICIONES_POR_SEGUNDO_API)
+        self.cupo = CupoDiario(db_file)
+        if submissions_hoy:
+            self.cupo.sincronizar(submissions_hoy)
         
-        self.logger.info("🚀 NeuroKupAPI inicializada")
+        self._client = None
+        self._info_competencia = None
+        self._info_competencia_ts = 0
     
-    def verificar_conexion(self):
+    async def __aenter__(self):
+        await self.abrir()
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+    
+    async def abrir(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=self.auth,
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones,
+                    max_keepalive_connections=self.max_conexiones
+                )
+            )
+    
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _peticion(self, metodo, ruta, endpoint, idempotente=True, **kwargs):
+        """
+        Petición con rate limiting, timeout del endpoint y reintentos
+        
+        Las peticiones no idempotentes (subir submission) solo se reintentan si
+        no llegaron al servidor: error de conexión o 429.
+        """
+        
+        await self.abrir()
+        timeout = httpx.Timeout(Config.TIMEOUTS_API.get(endpoint, Config.TIMEOUTS_API['default']))
+        
+        with span(f'api.{endpoint}', metodo=metodo, ruta=ruta) as s:
+            for intento in range(self.max_reintentos + 1):
+                await self.limitador.adquirir()
+                espera = None
+                
+                try:
+                    response = await self._client.request(metodo, ruta, timeout=timeout, **kwargs)
+                    s.atributos.update(status=response.status_code, intentos=intento + 1)
+                    
+                    reintentable = response.status_code == 429 or (idempotente and response.status_code >= 500)
+                    if not reintentable or intento == self.max_reintentos:
+                        return response
+                    
+                    retry_after = response.headers.get('Retry-After')
+                    if retry_after and retry_after.isdigit():
+                        espera = float(retry_after)
+                    self.logger.warning(f"⚠️ {endpoint}: HTTP {response.status_code}, reintento {intento + 1}/{self.max_reintentos}")
+                    
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                    if intento == self.max_reintentos:
+                        raise
+                    self.logger.warning(f"⚠️ {endpoint}: {type(e).__name__}, reintento {intento + 1}/{self.max_reintentos}")
+                except httpx.TransportError as e:
+                    if not idempotente or intento == self.max_reintentos:
+                        raise
+                    self.logger.warning(f"⚠️ {endpoint}: {type(e).__name__}, reintento {intento + 1}/{self.max_reintentos}")
+                
+                # Backoff exponencial con jitter completo
+                if espera is None:
+                    espera = random.uniform(0, min(Config.BACKOFF_MAX_API, Config.BACKOFF_BASE_API * 2 ** intento))
+                await asyncio.sleep(espera)
+    
+    async def verificar_conexion(self):
         """Verificar conexión con la API de Kaggle"""
         
         try:
             # Endpoint de verificación (ajustar según API real)
-            response = self.session.get(f"{Config.API_BASE_URL}/competitions/list")
+            response = await self._peticion('GET', '/competitions/list', 'verificacion')
             
             if response.status_code == 200:
                 self.logger.info("✅ Conexión con API verificada")
@@ -94,22 +292,31 @@ class NeuroKupAPI:
             self.logger.error(f"❌ Error verificando conexión: {e}")
             return False
     
-    def obtener_info_competencia(self):
-        """Obtener información de la competencia"""
+    async def obtener_info_competencia(self, usar_cache=True):
+        """Obtener información de la competencia (cacheada Config.CACHE_INFO_COMPETENCIA_SEGUNDOS)"""
+        
+        if usar_cache and self._info_competencia is not None and \
+                time.monotonic() - self._info_competencia_ts < Config.CACHE_INFO_COMPETENCIA_SEGUNDOS:
+            return self._info_competencia
         
         try:
             # Endpoint específico de la competencia (ajustar según API real)
-            url = f"{Config.API_BASE_URL}/competitions/neuro-kup-ii-beta-acm-ai"
-            response = self.session.get(url)
+            response = await self._peticion('GET', '/competitions/neuro-kup-ii-beta-acm-ai', 'info')
             
             if response.status_code == 200:
                 data = response.json()
-                return {
+                self._info_competencia = {
                     'deadline': data.get('deadline'),
                     'submissions_today': data.get('submissions_today', 0),
                     'max_submissions_per_day': data.get('maxDailySubmissions', 7),
                     'leaderboard_position': data.get('userRank', None)
                 }
+                self._info_competencia_ts = time.monotonic()
+                
+                # Sincronizar el cupo diario con el contador del servidor
+                self.cupo.sincronizar(self._info_competencia['submissions_today'] or 0)
+                
+                return self._info_competencia
             else:
                 self.logger.warning(f"⚠️ No se pudo obtener info de competencia: {response.status_code}")
                 return None
@@ -118,7 +325,7 @@ class NeuroKupAPI:
             self.logger.error(f"❌ Error obteniendo info de competencia: {e}")
             return None
     
-    def subir_submission(self, archivo_csv, mensaje="Submission automática"):
+    async def subir_submission(self, archivo_csv, mensaje="Submission automática"):
         """Subir submission a la competencia"""
         
         self.logger.info(f"📤 Intentando subir submission: {archivo_csv}")
@@ -127,29 +334,28 @@ class NeuroKupAPI:
             self.logger.error(f"❌ Archivo no encontrado: {archivo_csv}")
             return False, "Archivo no encontrado"
         
+        # Verificar límite de submissions diarias (cupo en la DB, sin llamada extra)
+        dia_reservado = self.cupo.reservar()
+        if dia_reservado is None:
+            mensaje_error = f"❌ Límite diario alcanzado: {self.cupo.limite}/{self.cupo.limite}"
+            self.logger.warning(mensaje_error)
+            return False, mensaje_error
+        
         try:
-            # Verificar límite de submissions diarias
-            info_comp = self.obtener_info_competencia()
-            if info_comp and info_comp['submissions_today'] >= Config.MAX_SUBMISSIONS_PER_DAY:
-                mensaje_error = f"❌ Límite diario alcanzado: {info_comp['submissions_today']}/{Config.MAX_SUBMISSIONS_PER_DAY}"
-                self.logger.warning(mensaje_error)
-                return False, mensaje_error
-            
-            # Preparar archivos para upload
-            files = {
-                'file': open(archivo_csv, 'rb')
-            }
+            # Lectura en un thread: no bloquear el event loop mientras se lee el CSV
+            contenido = await asyncio.to_thread(Path(archivo_csv).read_bytes)
             
+            files = {'file': (os.path.basename(archivo_csv), contenido, 'text/csv')}
             data = {
                 'competitionId': 'neuro-kup-ii-beta-acm-ai',
                 'submissionDescription': mensaje
             }
             
             # Endpoint de submission (ajustar según API real)
-            url = f"{Config.API_BASE_URL}/competitions/submissions/submit"
-            response = self.session.post(url, files=files, data=data)
-            
-            files['file'].close()
+            response = await self._peticion(
+                'POST', '/competitions/submissions/submit', 'submission',
+                idempotente=False, files=files, data=data
+            )
             
             if response.status_code == 200:
                 result = response.json()
@@ -158,6 +364,8 @@ class NeuroKupAPI:
                 self.logger.info(f"✅ Submission exitosa: ID {submission_id}")
                 return True, submission_id
             else:
+                # Rechazada por el servidor: la submission no cuenta para el límite
+                self.cupo.liberar(dia_reservado)
                 error_msg = f"❌ Error en submission: {response.status_code} - {response.text}"
                 self.logger.error(error_msg)
                 return False, error_msg
@@ -167,12 +375,11 @@ class NeuroKupAPI:
             self.logger.error(error_msg)
             return False, error_msg
     
-    def obtener_resultados_submission(self, submission_id):
+    async def obtener_resultados_submission(self, submission_id):
         """Obtener resultados de una submission"""
         
         try:
-            url = f"{Config.API_BASE_URL}/competitions/submissions/{submission_id}"
-            response = self.session.get(url)
+            response = await self._peticion('GET', f'/competitions/submissions/{submission_id}', 'resultados')
             
             if response.status_code == 200:
                 data = response.json()
@@ -191,72 +398,166 @@ class NeuroKupAPI:
         except Exception as e:
             self.logger.error(f"❌ Error obteniendo resultados: {e}")
             return None
+    
+    async def obtener_resultados_pendientes(self, submission_ids):
+        """Consultar varias submissions en paralelo -> {submission_id: resultados o None}"""
+        
+        resultados = await asyncio.gather(*(self.obtener_resultados_submission(sid) for sid in submission_ids))
+        return dict(zip(submission_ids, resultados))
+
+class NeuroKupAPI:
+    """
+    Cliente API para interactuar con NeuroKup II
+    
+    Fachada síncrona sobre ClienteNeuroKupAsync: un event loop en un thread
+    propio mantiene vivo el pool de conexiones entre llamadas.
+    """
+    
+    def __init__(self, username, api_key, base_url=None, submissions_hoy=0):
+        self.username = username
+        self.api_key = api_key
+        
+        # Configurar logging
+        logging.basicConfig(
+            filename=Config.LOG_FILE,
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+        self.logger = logging.getLogger(__name__)
+        
+        # Crear directorios
+        Path(Config.MODELS_DIR).mkdir(exist_ok=True)
+        Path(Config.SUBMISSIONS_DIR).mkdir(exist_ok=True)
+        
+        self.cliente = ClienteNeuroKupAsync(username, api_key, base_url=base_url, submissions_hoy=submissions_hoy)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        
+        self.logger.info("🚀 NeuroKupAPI inicializada")
+    
+    def _ejecutar(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+    
+    def cerrar(self):
+        """Cerrar el pool de conexiones y el event loop"""
+        
+        self._ejecutar(self.cliente.cerrar())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+    
+    def verificar_conexion(self):
+        """Verificar conexión con la API de Kaggle"""
+        return self._ejecutar(self.cliente.verificar_conexion())
+    
+    def obtener_info_competencia(self):
+        """Obtener información de la competencia"""
+        return self._ejecutar(self.cliente.obtener_info_competencia())
+    
+    def submissions_restantes(self):
+        """Submissions que quedan hoy (día UTC)"""
+        return self.cliente.cupo.restantes()
+    
+    def subir_submission(self, archivo_csv, mensaje="Submission automática"):
+        """Subir submission a la competencia"""
+        return self._ejecutar(self.cliente.subir_submission(archivo_csv, mensaje))
+    
+    def obtener_resultados_submission(self, submission_id):
+        """Obtener resultados de una submission"""
+        return self._ejecutar(self.cliente.obtener_resultados_submission(submission_id))
+    
+    def obtener_resultados_pendientes(self, submission_ids):
+        """Obtener resultados de varias submissions en paralelo"""
+        return self._ejecutar(self.cliente.obtener_resultados_pendientes(submission_ids))
 
 class DatabaseManager:
     """Gestor de base de datos para submissions"""
     
     def __init__(self, db_file=Config.DB_FILE):
         self.db_file = db_file
+        self.db = ConexionSQLite.compartida(db_file)
         self.init_database()
     
     def init_database(self):
         """Inicializar base de datos"""
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # Tabla de submissions
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                submission_id TEXT UNIQUE,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                archivo_csv TEXT,
-                f1_score_local REAL,
-                f1_score_publico REAL,
-                f1_score_privado REAL,
-                posicion_leaderboard INTEGER,
-                mensaje TEXT,
-                hash_archivo TEXT,
-                status TEXT DEFAULT 'pending',
-                modelo_usado TEXT,
-                parametros_modelo TEXT
-            )
-        ''')
-        
-        # Tabla de entrenamientos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS entrenamientos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                f1_score REAL,
-                archivo_modelo TEXT,
-                estrategia_usada TEXT,
-                tiempo_entrenamiento REAL,
-                mejora_sobre_anterior REAL,
-                parametros TEXT
-            )
-        ''')
-        
-        # Tabla de configuración
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS configuracion (
-                clave TEXT PRIMARY KEY,
-                valor TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self.db.transaccion() as conn:
+            # Tabla de submissions
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS submissions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    submission_id TEXT UNIQUE,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    archivo_csv TEXT,
+                    f1_score_local REAL,
+                    f1_score_publico REAL,
+                    f1_score_privado REAL,
+                    posicion_leaderboard INTEGER,
+                    mensaje TEXT,
+                    hash_archivo TEXT,
+                    status TEXT DEFAULT 'pending',
+                    modelo_usado TEXT,
+                    parametros_modelo TEXT
+                )
+            ''')
+            
+            # Tabla de entrenamientos
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entrenamientos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    f1_score REAL,
+                    archivo_modelo TEXT,
+                    estrategia_usada TEXT,
+                    tiempo_entrenamiento REAL,
+                    mejora_sobre_anterior REAL,
+                    parametros TEXT
+                )
+            ''')
+            
+            # Tabla de configuración
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS configuracion (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Índices para las consultas de estadísticas
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions(timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_status ON submissions(status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_f1_publico ON submissions(f1_score_publico)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entrenamientos_timestamp ON entrenamientos(timestamp)')
+            
+            # Contadores mantenidos por triggers: COUNT(*) recorre toda la tabla en SQLite
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS contadores (
+                    tabla TEXT PRIMARY KEY,
+                    total INTEGER NOT NULL
+                )
+            ''')
+            for tabla in ('submissions', 'entrenamientos'):
+                conn.execute(
+                    f"INSERT OR IGNORE INTO contadores (tabla, total) SELECT '{tabla}', COUNT(*) FROM {tabla}"
+                )
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{tabla}_insert AFTER INSERT ON {tabla}
+                    BEGIN
+                        UPDATE contadores SET total = total + 1 WHERE tabla = '{tabla}';
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{tabla}_delete AFTER DELETE ON {tabla}
+                    BEGIN
+                        UPDATE contadores SET total = total - 1 WHERE tabla = '{tabla}';
+                    END
+                ''')
     
     def registrar_submission(self, submission_data):
         """Registrar nueva submission"""
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.db.ejecutar('''
             INSERT INTO submissions (
                 submission_id, archivo_csv, f1_score_local, mensaje, 
                 hash_archivo, modelo_usado, parametros_modelo
@@ -271,18 +572,12 @@ class DatabaseManager:
             submission_data.get('parametros_modelo')
         ))
         
-        conn.commit()
-        conn.close()
-        
         logging.info(f"📝 Submission registrada en DB: {submission_data.get('submission_id')}")
     
     def actualizar_resultados_submission(self, submission_id, resultados):
         """Actualizar resultados de submission"""
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.db.ejecutar('''
             UPDATE submissions SET
                 f1_score_publico = ?,
                 f1_score_privado = ?,
@@ -296,35 +591,48 @@ class DatabaseManager:
             resultados.get('status'),
             submission_id
         ))
+    
+    def actualizar_resultados_submissions(self, resultados_por_id):
+        """Actualizar resultados de varias submissions en una sola transacción"""
         
-        conn.commit()
-        conn.close()
+        self.db.ejecutar_muchos('''
+            UPDATE submissions SET
+                f1_score_publico = ?,
+                f1_score_privado = ?,
+                posicion_leaderboard = ?,
+                status = ?
+            WHERE submission_id = ?
+        ''', [
+            (
+                resultados.get('public_score'),
+                resultados.get('private_score'),
+                resultados.get('leaderboard_position'),
+                resultados.get('status'),
+                submission_id
+            )
+            for submission_id, resultados in resultados_por_id.items()
+        ])
+    
+    def obtener_submissions_pendientes(self):
+        """IDs de submissions sin resultados"""
+        
+        filas = self.db.consultar("SELECT submission_id FROM submissions WHERE status = 'pending'")
+        return [submission_id for (submission_id,) in filas]
     
     def obtener_mejor_submission(self):
         """Obtener la mejor submission hasta ahora"""
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        return self.db.consultar_uno('''
             SELECT * FROM submissions 
             WHERE f1_score_publico IS NOT NULL 
             ORDER BY f1_score_publico DESC 
             LIMIT 1
         ''')
-        
-        resultado = cursor.fetchone()
-        conn.close()
-        
-        return resultado
     
     def registrar_entrenamiento(self, entrenamiento_data):
         """Registrar nuevo entrenamiento"""
         
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        self.db.ejecutar('''
             INSERT INTO entrenamientos (
                 f1_score, archivo_modelo, estrategia_usada, 
                 tiempo_entrenamiento, mejora_sobre_anterior, parametros
@@ -337,47 +645,172 @@ class DatabaseManager:
             entrenamiento_data.get('mejora_sobre_anterior'),
             entrenamiento_data.get('parametros')
         ))
-        
-        conn.commit()
-        conn.close()
     
-    def obtener_estadisticas(self):
-        """Obtener estadísticas generales"""
-        
-        conn = sqlite3.connect(self.db_file)
+    def obtener_estadisticas(self, n_entrenamientos=10, n_submissions=5):
+        """
+        Obtener estadísticas generales con consultas agregadas sobre índices
+        
+        El coste no depende del tamaño del historial: los totales salen de la
+        tabla de contadores y el resto son búsquedas por índice.
+        
+        Returns:
+            dict:
+                total_submissions (int), total_entrenamientos (int), submissions_hoy (int),
+                mejor_score_publico (float o None), submissions_pendientes (int),
+                ultimas_submissions (DataFrame, n_submissions filas),
+                entrenamientos (DataFrame, n_entrenamientos filas)
+        """
+        
+        totales = dict(self.db.consultar('SELECT tabla, total FROM contadores'))
+        
+        # Día UTC (CURRENT_TIMESTAMP es UTC), el mismo que usa CupoDiario; como rango usa el índice
+        hoy = datetime.now(timezone.utc).date()
+        (submissions_hoy,) = self.db.consultar_uno(
+            'SELECT COUNT(*) FROM submissions WHERE timestamp >= ? AND timestamp < ?',
+            (hoy.isoformat(), (hoy + timedelta(days=1)).isoformat())
+        )
+        (mejor_score,) = self.db.consultar_uno('SELECT MAX(f1_score_publico) FROM submissions')
+        (pendientes,) = self.db.consultar_uno("SELECT COUNT(*) FROM submissions WHERE status = 'pending'")
         
-        # Submissions
+        conn = self.db.conexion()
         df_submissions = pd.read_sql_query(
-            "SELECT * FROM submissions ORDER BY timestamp DESC", 
-            conn
+            "SELECT * FROM submissions ORDER BY timestamp DESC LIMIT ?",
+            conn, params=(n_submissions,)
         )
-        
-        # Entrenamientos
         df_entrenamientos = pd.read_sql_query(
-            "SELECT * FROM entrenamientos ORDER BY timestamp DESC LIMIT 10", 
-            conn
+            "SELECT * FROM entrenamientos ORDER BY timestamp DESC LIMIT ?",
+            conn, params=(n_entrenamientos,)
         )
         
-        conn.close()
-        
         return {
-            'submissions': df_submissions,
-            'entrenamientos': df_entrenamientos,
-            'total_submissions': len(df_submissions),
-            'mejor_score_publico': df_submissions['f1_score_publico'].max() if len(df_submissions) > 0 else None,
-            'submissions_hoy': len(df_submissions[df_submissions['timestamp'].str.startswith(datetime.now().strftime('%Y-%m-%d'))])
+            'total_submissions': int(totales.get('submissions', 0)),
+            'total_entrenamientos': int(totales.get('entrenamientos', 0)),
+            'submissions_hoy': int(submissions_hoy),
+            'mejor_score_publico': float(mejor_score) if mejor_score is not None else None,
+            'submissions_pendientes': int(pendientes),
+            'ultimas_submissions': df_submissions,
+            'entrenamientos': df_entrenamientos
+        }
+
+class ControlSubmissions:
+    """
+    Filtro previo a subir: evita gastar submissions diarias en predicciones
+    casi idénticas a otras ya enviadas
+    
+    Cada submission enviada se guarda como vector de etiquetas empaquetado en
+    bits (np.packbits) ordenado por ID, junto con un hash del conjunto de IDs.
+    Una candidata se compara contra todas las anteriores del mismo conjunto de
+    IDs de una vez: XOR de los bytes + popcount por tabla.
+    """
+    
+    # Bits a 1 de cada valor de byte
+    _BITS_POR_BYTE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+    
+    def __init__(self, db_file=Config.DB_FILE, min_diferencia=None):
+        self.db = ConexionSQLite.compartida(db_file)
+        self.min_diferencia = Config.MIN_DIFERENCIA_SUBMISSION if min_diferencia is None else min_diferencia
+        self.logger = logging.getLogger(__name__)
+        
+        self.db.ejecutar('''
+            CREATE TABLE IF NOT EXISTS etiquetas_submission (
+                submission_id TEXT PRIMARY KEY,
+                hash_ids TEXT NOT NULL,
+                n_filas INTEGER NOT NULL,
+                etiquetas BLOB NOT NULL
+            )
+        ''')
+        self.db.ejecutar('CREATE INDEX IF NOT EXISTS idx_etiquetas_hash_ids ON etiquetas_submission(hash_ids)')
+    
+    @staticmethod
+    def _vectorizar(submission):
+        """DataFrame/CSV con ID y Condición -> (hash_ids, n_filas, etiquetas empaquetadas)"""
+        
+        df = pd.read_csv(submission) if isinstance(submission, (str, Path)) else submission
+        ids = df['ID'].to_numpy()
+        orden = np.argsort(ids, kind='stable')
+        
+        hash_ids = hashlib.sha256(pd.util.hash_array(ids[orden]).tobytes()).hexdigest()
+        etiquetas = np.packbits(df['Condición'].to_numpy()[orden].astype(bool))
+        
+        return hash_ids, len(df), etiquetas
+    
+    def evaluar(self, submission):
+        """
+        Decidir si vale la pena subir una submission
+        
+        Se bloquea si difiere en menos de `min_diferencia` (fracción de filas)
+        de alguna submission anterior con score público o todavía pendiente.
+        
+        Args:
+            submission: Ruta al CSV o DataFrame con columnas 'ID' y 'Condición'
+        
+        Returns:
+            dict: permitido, diferencia_minima (fracción), etiquetas_distintas,
+                  submission_mas_cercana, comparadas
+        """
+        
+        hash_ids, n_filas, etiquetas = self._vectorizar(submission)
+        
+        filas = self.db.consultar('''
+            SELECT e.submission_id, e.etiquetas
+            FROM etiquetas_submission e
+            JOIN submissions s ON s.submission_id = e.submission_id
+            WHERE e.hash_ids = ? AND (s.f1_score_publico IS NOT NULL OR s.status = 'pending')
+        ''', (hash_ids,))
+        
+        resultado = {
+            'permitido': True,
+            'diferencia_minima': None,
+            'etiquetas_distintas': None,
+            'submission_mas_cercana': None,
+            'comparadas': len(filas)
         }
+        
+        if not filas:
+            return resultado
+        
+        anteriores = np.frombuffer(b''.join(blob for _, blob in filas), dtype=np.uint8).reshape(len(filas), -1)
+        distintas = self._BITS_POR_BYTE[np.bitwise_xor(anteriores, etiquetas)].sum(axis=1)
+        
+        i = int(np.argmin(distintas))
+        resultado.update({
+            'diferencia_minima': float(distintas[i]) / n_filas,
+            'etiquetas_distintas': int(distintas[i]),
+            'submission_mas_cercana': filas[i][0]
+        })
+        resultado['permitido'] = resultado['diferencia_minima'] >= self.min_diferencia
+        
+        if not resultado['permitido']:
+            self.logger.info(
+                f"🚫 Submission casi idéntica a {resultado['submission_mas_cercana']}: "
+                f"{resultado['etiquetas_distintas']} etiquetas distintas ({resultado['diferencia_minima']:.4%})"
+            )
+        
+        return resultado
+    
+    def registrar(self, submission_id, submission):
+        """Guardar el vector de etiquetas de una submission enviada"""
+        
+        hash_ids, n_filas, etiquetas = self._vectorizar(submission)
+        self.db.ejecutar(
+            'INSERT OR REPLACE INTO etiquetas_submission (submission_id, hash_ids, n_filas, etiquetas) VALUES (?, ?, ?, ?)',
+            (submission_id, hash_ids, n_filas, etiquetas.tobytes())
+        )
 
 class AutoTrainingSystem:
     """Sistema de entrenamiento automático y submissions"""
     
     def __init__(self, username, api_key):
-        self.api = NeuroKupAPI(username, api_key)
         self.db = DatabaseManager()
+        self.control_submissions = ControlSubmissions()
+        self.api = NeuroKupAPI(username, api_key, submissions_hoy=self.db.obtener_estadisticas()['submissions_hoy'])
+        self.registro = RegistroModelos(Config.MODELS_DIR)
+        self.almacen = AlmacenPredicciones(Config.PREDICTIONS_DIR)
         self.logger = logging.getLogger(__name__)
         self.running = False
         
         # Estado del sistema
+        self.modelo_actual = None      # ModeloCoronario que se actualiza de forma incremental
         self.mejor_score_local = 0
         self.ultimo_entrenamiento = None
         self.submissions_hoy = 0
@@ -392,69 +825,111 @@ class AutoTrainingSystem:
         return hash_md5.hexdigest()
     
     def entrenar_nuevo_modelo(self):
-        """Entrenar nuevo modelo con mejoras"""
+        """
+        Entrenar o actualizar el modelo con el train actual
+        
+        El primer ciclo entrena completo; los siguientes solo añaden las filas
+        nuevas (entrenar_incremental, que vuelve a completo si hay drift). El F1
+        es out-of-fold en ambos modos, así que es comparable entre ciclos.
+        """
         
         self.logger.info("🤖 Iniciando entrenamiento de nuevo modelo")
         
         try:
             inicio = datetime.now()
             
-            # Usar sistema de mejora iterativa
-            mejor_modelo, score, historial = mejorar_modelo_automatico(
-                'train_local.csv',  # Ajustar según archivo disponible
-                score_base=self.mejor_score_local
-            )
-            
-            tiempo_entrenamiento = (datetime.now() - inicio).total_seconds()
+            if self.modelo_actual is None:
+                self.modelo_actual = calcularf1_score.entrenar_modelo_completo(Config.ARCHIVO_TRAIN)
+            else:
+                calcularf1_score.actualizar_modelo_incremental(Config.ARCHIVO_TRAIN, self.modelo_actual)
             
-            # Guardar modelo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            archivo_modelo = f"{Config.MODELS_DIR}/modelo_{timestamp}.pkl"
+            score = self.modelo_actual.f1_entrenamiento
+            actualizacion = self.modelo_actual.ultima_actualizacion or {}
             
-            with open(archivo_modelo, 'wb') as f:
-                pickle.dump(mejor_modelo, f)
+            tiempo_entrenamiento = (datetime.now() - inicio).total_seconds()
             
-            # Registrar entrenamiento
-            mejora = score - self.mejor_score_local
+            # Registrar modelo (artefacto direccionado por contenido)
+            archivo_modelo = self.registro.registrar(
+                self.modelo_actual, 'auto_training',
+                f1_cv=score,
+                tiempo_entrenamiento=tiempo_entrenamiento,
+                metadatos=actualizacion
+            )
             
-            entrenamiento_data = {
-                'f1_score': score,
-                'archivo_modelo': archivo_modelo,
-                'estrategia_usada': 'mejora_iterativa_automatica',
+            return self.registrar_modelo_entrenado({
+                'score': score,
+                'modelo_hash': archivo_modelo,
                 'tiempo_entrenamiento': tiempo_entrenamiento,
-                'mejora_sobre_anterior': mejora,
-                'parametros': json.dumps(historial[-1] if historial else {})
-            }
-            
-            self.db.registrar_entrenamiento(entrenamiento_data)
-            
-            # Actualizar mejor score si hay mejora
-            if score > self.mejor_score_local:
-                self.logger.info(f"🎉 Mejora encontrada: {score:.4f} (+{mejora:.4f})")
-                self.mejor_score_local = score
-                self.ultimo_entrenamiento = archivo_modelo
-                return True, score, archivo_modelo
-            else:
-                self.logger.info(f"❌ Sin mejora: {score:.4f} (actual: {self.mejor_score_local:.4f})")
-                return False, score, archivo_modelo
+                'actualizacion': actualizacion
+            })
                 
         except Exception as e:
             self.logger.error(f"❌ Error en entrenamiento: {e}")
             return False, 0, None
     
+    def registrar_modelo_entrenado(self, entrenamiento):
+        """
+        Anotar un modelo ya registrado como entrenamiento y comparar con el mejor
+        
+        Lo usa entrenar_nuevo_modelo y también el pipeline de producción, que
+        entrena el modelo en un proceso vigilado (entrenamiento_protegido).
+        
+        Args:
+            entrenamiento (dict): score, modelo_hash, tiempo_entrenamiento, actualizacion
+        
+        Returns:
+            tuple: (hay_mejora, score, modelo_hash)
+        """
+        
+        score = entrenamiento['score']
+        archivo_modelo = entrenamiento['modelo_hash']
+        actualizacion = entrenamiento.get('actualizacion') or {}
+        mejora = score - self.mejor_score_local
+        
+        entrenamiento_data = {
+            'f1_score': score,
+            'archivo_modelo': archivo_modelo,
+            'estrategia_usada': f"modelo_coronario_{actualizacion.get('modo', 'completo')}",
+            'tiempo_entrenamiento': entrenamiento.get('tiempo_entrenamiento'),
+            'mejora_sobre_anterior': mejora,
+            'parametros': json.dumps(actualizacion, default=str)
+        }
+        
+        self.db.registrar_entrenamiento(entrenamiento_data)
+        
+        # Actualizar mejor score si hay mejora
+        if score > self.mejor_score_local:
+            self.logger.info(f"🎉 Mejora encontrada: {score:.4f} (+{mejora:.4f})")
+            self.mejor_score_local = score
+            self.ultimo_entrenamiento = archivo_modelo
+            return True, score, archivo_modelo
+        else:
+            self.logger.info(f"❌ Sin mejora: {score:.4f} (actual: {self.mejor_score_local:.4f})")
+            return False, score, archivo_modelo
+    
     def generar_submission(self, modelo_archivo):
         """Generar archivo de submission"""
         
         self.logger.info(f"📝 Generando submission con modelo: {modelo_archivo}")
         
         try:
-            # Cargar modelo
-            with open(modelo_archivo, 'rb') as f:
-                modelo = pickle.load(f)
+            # Obtener modelo del registro (pool en memoria o artefacto mapeado)
+            modelo = self.registro.obtener(modelo_hash=modelo_archivo)
             
-            # Hacer predicciones
-            pred_public, f1_public = calcularf1_score.obtenerscore('test_public.csv', modelo)
-            pred_private, _ = calcularf1_score.obtenerscore('test_private.csv', modelo)            # Crear submission
+            # Hacer predicciones (una sola pasada para ambos archivos)
+            scores = calcularf1_score.obtener_scores_lote(['test_public.csv', 'test_private.csv'], modelo)
+            pred_public, f1_public = scores['test_public.csv']
+            pred_private, _ = scores['test_private.csv']
+            
+            # Archivar probabilidades de esta ejecución
+            for nombre, predicciones in (('public_auto', pred_public), ('private_auto', pred_private)):
+                self.almacen.guardar(
+                    predicciones, nombre,
+                    threshold=modelo.threshold_optimo,
+                    metadatos={'modelo_hash': modelo_archivo, 'f1_public': f1_public}
+                )
+            
+            # Crear submission
             submission = calcularf1_score.crear_submission_final(
                 pred_public, pred_private, 
                 filename="solucion.csv"
@@ -469,19 +944,27 @@ class AutoTrainingSystem:
             self.logger.error(f"❌ Error generando submission: {e}")
             return None, None
     
-    def evaluar_y_subir_si_mejora(self):
-        """Evaluar modelo y subir si hay mejora"""
+    def evaluar_y_subir_si_mejora(self, entrenamiento=None):
+        """
+        Evaluar modelo y subir si hay mejora
+        
+        Args:
+            entrenamiento (dict): Modelo ya entrenado y registrado (ver
+                registrar_modelo_entrenado); si es None se entrena aquí
+        """
         
         self.logger.info("🔍 Evaluando si subir nueva submission")
         
         # Verificar límite diario
-        stats = self.db.obtener_estadisticas()
-        if stats['submissions_hoy'] >= Config.MAX_SUBMISSIONS_PER_DAY:
-            self.logger.warning(f"⚠️ Límite diario alcanzado: {stats['submissions_hoy']}/{Config.MAX_SUBMISSIONS_PER_DAY}")
+        if self.api.submissions_restantes() <= 0:
+            self.logger.warning(f"⚠️ Límite diario alcanzado: {Config.MAX_SUBMISSIONS_PER_DAY}/{Config.MAX_SUBMISSIONS_PER_DAY}")
             return False
         
-        # Entrenar nuevo modelo
-        hay_mejora, score, modelo_archivo = self.entrenar_nuevo_modelo()
+        # Entrenar nuevo modelo (o usar el que llega ya entrenado)
+        if entrenamiento is None:
+            hay_mejora, score, modelo_archivo = self.entrenar_nuevo_modelo()
+        else:
+            hay_mejora, score, modelo_archivo = self.registrar_modelo_entrenado(entrenamiento)
         
         if not hay_mejora:
             self.logger.info("❌ Sin mejora suficiente, no se sube submission")
@@ -502,6 +985,12 @@ class AutoTrainingSystem:
             self.logger.error("❌ Error generando submission")
             return False
         
+        # No gastar una submission en predicciones casi iguales a otra ya enviada
+        control = self.control_submissions.evaluar(archivo_submission)
+        if not control['permitido']:
+            self.logger.info(f"❌ Submission descartada: solo {control['etiquetas_distintas']} etiquetas distintas")
+            return False
+        
         # Subir submission
         exito, resultado = self.api.subir_submission(
             archivo_submission, 
@@ -521,6 +1010,7 @@ class AutoTrainingSystem:
             }
             
             self.db.registrar_submission(submission_data)
+            self.control_submissions.registrar(resultado, archivo_submission)
             
             self.logger.info(f"✅ Submission exitosa: {resultado}")
             return True
@@ -531,21 +1021,34 @@ class AutoTrainingSystem:
     def verificar_resultados_pendientes(self):
         """Verificar resultados de submissions pendientes"""
         
-        conn = sqlite3.connect(Config.DB_FILE)
-        cursor = conn.cursor()
+        pendientes = self.db.obtener_submissions_pendientes()
+        
+        if not pendientes:
+            return
+        
+        # Consultas en paralelo en lugar de una a una
+        todos = self.api.obtener_resultados_pendientes(pendientes)
         
-        cursor.execute("SELECT submission_id FROM submissions WHERE status = 'pending'")
-        pendientes = cursor.fetchall()
-        conn.close()
+        completas = {
+            submission_id: resultados for submission_id, resultados in todos.items()
+            if resultados and resultados['status'] == 'complete'
+        }
         
-        for (submission_id,) in pendientes:
-            resultados = self.api.obtener_resultados_submission(submission_id)
-            if resultados and resultados['status'] == 'complete':
-                self.db.actualizar_resultados_submission(submission_id, resultados)
-                self.logger.info(f"📊 Resultados actualizados: {submission_id} - Score: {resultados.get('public_score')}")
+        # Una sola transacción para todas las actualizaciones
+        self.db.actualizar_resultados_submissions(completas)
+        for submission_id, resultados in completas.items():
+            self.logger.info(f"📊 Resultados actualizados: {submission_id} - Score: {resultados.get('public_score')}")
     
-    def ejecutar_ciclo_completo(self):
-        """Ejecutar un ciclo completo de entrenamiento y evaluación"""
+    def ejecutar_ciclo_completo(self, entrenamiento=None):
+        """
+        Ejecutar un ciclo completo de entrenamiento y evaluación
+        
+        Args:
+            entrenamiento (dict): Modelo ya entrenado (ver evaluar_y_subir_si_mejora)
+        
+        Returns:
+            bool: True si se subió una submission
+        """
         
         self.logger.info("🔄 Iniciando ciclo completo")
         
@@ -553,20 +1056,23 @@ class AutoTrainingSystem:
             # 1. Verificar conexión
             if not self.api.verificar_conexion():
                 self.logger.error("❌ Sin conexión con API")
-                return
+                return False
             
             # 2. Actualizar resultados pendientes
             self.verificar_resultados_pendientes()
             
             # 3. Evaluar y subir si hay mejora
-            self.evaluar_y_subir_si_mejora()
+            subida = self.evaluar_y_subir_si_mejora(entrenamiento)
             
             # 4. Mostrar estadísticas
             stats = self.db.obtener_estadisticas()
             self.logger.info(f"📊 Stats: {stats['total_submissions']} submissions, mejor: {stats['mejor_score_publico']}")
             
+            return subida
+            
         except Exception as e:
             self.logger.error(f"❌ Error en ciclo completo: {e}")
+            return False
     
     def iniciar_sistema_automatico(self):
         """Iniciar sistema automático con scheduler"""
@@ -688,6 +1194,7 @@ def enviar_submission_manual(archivo_csv, mensaje="Submission manual"):
                 'hash_archivo': hashlib.md5(open(archivo_csv, 'rb').read()).hexdigest(),
             }
             db.registrar_submission(submission_data)
+            ControlSubmissions().registrar(resultado, archivo_csv)
             
         else:
             print(f"❌ Error en submission: {resultado}")
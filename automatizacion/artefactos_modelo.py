@@ -0,0 +1,250 @@
+# ================================
+# 📦 ARTEFACTOS DE MODELO MAPEABLES EN MEMORIA
+# ================================
+# Guarda los arrays de árboles compilados como bloques .npy sin comprimir
+# (cargables con mmap) y una cabecera JSON pequeña con encoders y threshold
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from automatizacion.compilador_arboles import ModeloCompilado, compilar_modelo
+import automatizacion.calcularf1_score as calcularf1_score
+
+FORMATO_ARTEFACTO = 1
+ARCHIVO_CABECERA = 'cabecera.json'
+ARCHIVO_PICKLE = 'modelo.pkl'
+ARCHIVO_INCREMENTAL = 'incremental.pkl'
+
+# Arrays de ModeloCompilado que se guardan como bloques .npy
+ARRAYS_COMPILADOS = ['feature', 'threshold', 'hijos', 'valor', 'raices', 'faltantes_izq', 'valor_neg']
+
+def _serializar_encoders(encoders):
+    return {col: le.classes_.tolist() for col, le in encoders.items()}
+
+def _deserializar_encoders(encoders):
+    resultado = {}
+    for col, clases in encoders.items():
+        le = LabelEncoder()
+        le.classes_ = np.asarray(clases)
+        resultado[col] = le
+    return resultado
+
+def _serializar_valores(valores):
+    if valores is None:
+        return None
+    return {col: valor.item() if hasattr(valor, 'item') else valor for col, valor in valores.items()}
+
+def guardar_artefacto(modelo, ruta, metadatos=None, incremental=False):
+    """
+    Guardar un modelo como artefacto mapeable en memoria
+
+    El artefacto es un directorio con:
+      - cabecera.json: formato, encoders, feature_columns, threshold, valores de
+                       imputación y metadatos
+      - <array>.npy:   arrays del modelo compilado (sin comprimir, aptos para mmap)
+      - modelo.pkl:    solo si el modelo no es compilable (fallback a pickle)
+      - huellas_train.npy, proba_oof.npy, incremental.pkl: solo con incremental=True
+
+    Args:
+        modelo: ModeloCoronario entrenado o estimador sklearn
+        ruta (str): Directorio destino (se reemplaza si existe)
+        metadatos (dict): Información adicional para la cabecera (opcional)
+        incremental (bool): Guardar también lo que necesita entrenar_incremental
+                            (estimadores sklearn, huellas, OOF y perfil del train).
+                            Ocupa bastante más que el modelo compilado
+
+    Returns:
+        str: Ruta del artefacto
+    """
+
+    es_coronario = isinstance(modelo, calcularf1_score.ModeloCoronario)
+    estimador = modelo.modelo_entrenado if es_coronario else modelo
+
+    if estimador is None:
+        raise ValueError("❌ Modelo no entrenado")
+
+    cabecera = {
+        'formato': FORMATO_ARTEFACTO,
+        'contenedor': 'ModeloCoronario' if es_coronario else 'estimador',
+        'fecha': datetime.now().isoformat(),
+        'metadatos': metadatos or {}
+    }
+
+    if es_coronario:
+        cabecera.update({
+            'feature_columns': modelo.feature_columns,
+            'encoders': _serializar_encoders(modelo.encoders),
+            'threshold_optimo': float(modelo.threshold_optimo),
+            'f1_entrenamiento': modelo.f1_entrenamiento,
+            'valores_imputacion': _serializar_valores(getattr(modelo, 'valores_imputacion', None))
+        })
+
+    # Escribir en un directorio temporal y renombrar: nunca queda un artefacto a medias
+    directorio_padre = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio_padre, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.artefacto_', dir=directorio_padre)
+
+    try:
+        compilado = None
+        if isinstance(estimador, ModeloCompilado):
+            compilado = estimador
+        else:
+            try:
+                compilado = compilar_modelo(estimador)
+            except ValueError:
+                compilado = None
+
+        if compilado is not None:
+            cabecera['modelo'] = {
+                'tipo': 'compilado',
+                'miembros': compilado.miembros,
+                'n_features': int(compilado.n_features),
+                'classes': compilado.classes_.tolist(),
+                'arrays': [nombre for nombre in ARRAYS_COMPILADOS if getattr(compilado, nombre) is not None]
+            }
+            for nombre in cabecera['modelo']['arrays']:
+                np.save(os.path.join(tmp, f'{nombre}.npy'), np.ascontiguousarray(getattr(compilado, nombre)))
+        else:
+            cabecera['modelo'] = {'tipo': 'pickle'}
+            with open(os.path.join(tmp, ARCHIVO_PICKLE), 'wb') as f:
+                pickle.dump(estimador, f)
+
+        cabecera['incremental'] = bool(incremental and es_coronario and modelo.modelo_base is not None)
+        if cabecera['incremental']:
+            _guardar_estado_incremental(modelo, tmp)
+
+        with open(os.path.join(tmp, ARCHIVO_CABECERA), 'w', encoding='utf-8') as f:
+            json.dump(cabecera, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(ruta):
+            shutil.rmtree(ruta)
+        os.replace(tmp, ruta)
+    except:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return ruta
+
+def _guardar_estado_incremental(modelo, ruta):
+    """Huellas y OOF como .npy; estimadores sklearn y perfil del train en pickle"""
+
+    np.save(os.path.join(ruta, 'huellas_train.npy'), modelo.huellas_train)
+    np.save(os.path.join(ruta, 'proba_oof.npy'), modelo.proba_oof)
+
+    estado = {
+        'modelo_base': modelo.modelo_base,
+        'modelo_ensemble': modelo.modelo_ensemble,
+        'usa_ensemble': modelo.modelo_entrenado is modelo.modelo_ensemble,
+        'perfil_train': modelo.perfil_train,
+        'ultima_actualizacion': modelo.ultima_actualizacion
+    }
+    with open(os.path.join(ruta, ARCHIVO_INCREMENTAL), 'wb') as f:
+        pickle.dump(estado, f)
+
+def _cargar_estado_incremental(modelo, ruta):
+    """Restaurar el estado de _guardar_estado_incremental (el modelo pasa a ser el estimador sklearn)"""
+
+    with open(os.path.join(ruta, ARCHIVO_INCREMENTAL), 'rb') as f:
+        estado = pickle.load(f)
+
+    modelo.huellas_train = np.load(os.path.join(ruta, 'huellas_train.npy'))
+    modelo.proba_oof = np.load(os.path.join(ruta, 'proba_oof.npy'))
+    modelo.modelo_base = estado['modelo_base']
+    modelo.modelo_ensemble = estado['modelo_ensemble']
+    modelo.perfil_train = estado['perfil_train']
+    modelo.ultima_actualizacion = estado['ultima_actualizacion']
+    # entrenar_incremental hace crecer estos estimadores: el modelo que predice tiene que ser el mismo objeto
+    modelo.modelo_entrenado = modelo.modelo_ensemble if estado['usa_ensemble'] else modelo.modelo_base
+
+def leer_cabecera(ruta):
+    """Leer solo la cabecera JSON de un artefacto"""
+
+    with open(os.path.join(ruta, ARCHIVO_CABECERA), encoding='utf-8') as f:
+        cabecera = json.load(f)
+
+    if cabecera.get('formato') != FORMATO_ARTEFACTO:
+        raise ValueError(f"❌ Formato de artefacto no soportado: {cabecera.get('formato')}")
+
+    return cabecera
+
+def cargar_artefacto(ruta, mmap=True, n_jobs=None, permitir_pickle=True, incremental=False):
+    """
+    Cargar un artefacto guardado con guardar_artefacto
+
+    Con mmap=True los arrays de árboles se mapean en modo solo lectura: la carga
+    no copia datos, la inferencia recorre directamente los arrays mapeados y las
+    páginas se comparten entre procesos que abren el mismo artefacto. La estructura
+    de los árboles se valida al cargar. El modelo cargado sirve para inferencia
+    (predecir / predecir_lote); para entrenar_incremental hay que cargarlo con
+    incremental=True.
+
+    Args:
+        ruta (str): Directorio del artefacto
+        mmap (bool): Mapear los arrays en memoria en lugar de leerlos
+        n_jobs (int): Threads de inferencia del modelo compilado
+        permitir_pickle (bool): Aceptar artefactos con modelo.pkl; False para
+                                artefactos de origen no confiable (unpickle = ejecutar código)
+        incremental (bool): Restaurar el estado para entrenar_incremental (si se guardó).
+                            El modelo queda con los estimadores sklearn en memoria, sin mmap
+
+    Returns:
+        ModeloCoronario o estimador, según lo que se guardó
+    """
+
+    cabecera = leer_cabecera(ruta)
+    info = cabecera['modelo']
+
+    if info['tipo'] == 'compilado':
+        arrays = {
+            nombre: np.load(os.path.join(ruta, f'{nombre}.npy'), mmap_mode='r' if mmap else None)
+            for nombre in info['arrays']
+        }
+        estimador = ModeloCompilado(
+            feature=arrays['feature'],
+            threshold=arrays['threshold'],
+            hijos=arrays['hijos'],
+            valor=arrays['valor'],
+            raices=arrays['raices'],
+            miembros=info['miembros'],
+            n_features=info['n_features'],
+            classes=np.asarray(info['classes']),
+            faltantes_izq=arrays.get('faltantes_izq'),
+            valor_neg=arrays.get('valor_neg'),
+            n_jobs=n_jobs
+        )
+        # Los arrays se recorren tal cual (sin copiarlos a árboles de sklearn): rechazar
+        # aquí cualquier estructura corrupta antes de usarla para inferencia
+        estimador.validar()
+    elif not permitir_pickle:
+        raise ValueError(f"❌ Artefacto con pickle rechazado: {ruta} (solo se aceptan modelos compilados)")
+    else:
+        with open(os.path.join(ruta, ARCHIVO_PICKLE), 'rb') as f:
+            estimador = pickle.load(f)
+
+    if cabecera['contenedor'] != 'ModeloCoronario':
+        return estimador
+
+    modelo = calcularf1_score.ModeloCoronario()
+    modelo.modelo_entrenado = estimador
+    modelo.feature_columns = cabecera['feature_columns']
+    modelo.encoders = _deserializar_encoders(cabecera['encoders'])
+    modelo.threshold_optimo = cabecera['threshold_optimo']
+    modelo.f1_entrenamiento = cabecera['f1_entrenamiento']
+    modelo.valores_imputacion = cabecera.get('valores_imputacion')
+
+    if incremental:
+        if not cabecera.get('incremental'):
+            print(f"⚠️ Artefacto sin estado incremental: {ruta} (entrenar_incremental hará un entrenamiento completo)")
+        elif not permitir_pickle:
+            raise ValueError(f"❌ Estado incremental rechazado: {ruta} (requiere pickle)")
+        else:
+            _cargar_estado_incremental(modelo, ruta)
+
+    return modelo
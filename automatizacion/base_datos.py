@@ -0,0 +1,159 @@
+# ================================
+# 🗄️ CAPA DE ACCESO A SQLITE COMPARTIDA
+# ================================
+# Conexiones persistentes por thread, modo WAL y escrituras agrupadas en transacciones
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+# Ajustes aplicados a cada conexión nueva
+PRAGMAS = {
+    'journal_mode': 'WAL',        # Lectores y escritor no se bloquean entre sí
+    'synchronous': 'NORMAL',      # Seguro con WAL; evita un fsync por commit
+    'cache_size': -16384,         # 16 MB de caché de páginas (negativo = KiB)
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000          # ms esperando un lock antes de "database is locked"
+}
+
+# Sentencias compiladas que sqlite3 guarda por conexión (reutilizadas por texto SQL)
+SENTENCIAS_EN_CACHE = 256
+
+class _FinThread:
+    """Marcador guardado en el threading.local: se libera cuando el thread termina"""
+
+class ConexionSQLite:
+    """
+    Acceso a una base SQLite con una conexión de larga duración por thread
+
+    Las conexiones se crean bajo demanda en cada thread y se reutilizan; como
+    sqlite3 cachea las sentencias preparadas por conexión, las consultas
+    repetidas no se vuelven a compilar. La conexión de un thread se cierra
+    cuando ese thread termina, así los threads de vida corta (p.ej. uno por
+    petición HTTP) no dejan conexiones ni descriptores abiertos. Fuera de `transaccion()` cada
+    sentencia se confirma sola (autocommit).
+
+    Usar `ConexionSQLite.compartida(ruta)` para que todos los gestores que
+    abren el mismo archivo compartan las conexiones.
+    """
+
+    _instancias = {}
+    _lock_instancias = threading.Lock()
+
+    def __init__(self, db_path, pragmas=None):
+        self.db_path = str(db_path)
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self._local = threading.local()
+        self._conexiones = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def compartida(cls, db_path, pragmas=None):
+        """Instancia única por archivo de base de datos"""
+
+        clave = os.path.abspath(str(db_path))
+        with cls._lock_instancias:
+            if clave not in cls._instancias:
+                cls._instancias[clave] = cls(db_path, pragmas)
+            return cls._instancias[clave]
+
+    def conexion(self):
+        """Conexión del thread actual (se crea la primera vez)"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directorio = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directorio, exist_ok=True)
+
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.pragmas['busy_timeout'] / 1000,
+                isolation_level=None,
+                cached_statements=SENTENCIAS_EN_CACHE,
+                check_same_thread=False    # Solo para poder cerrarla desde cerrar(); cada thread usa la suya
+            )
+            for pragma, valor in self.pragmas.items():
+                conn.execute(f'PRAGMA {pragma} = {valor}')
+
+            # Python libera los datos del threading.local al terminar el thread
+            fin_thread = _FinThread()
+            weakref.finalize(fin_thread, self._soltar, conn)
+
+            self._local.conn = conn
+            self._local.en_transaccion = False
+            self._local.fin_thread = fin_thread
+            with self._lock:
+                self._conexiones.append(conn)
+
+        return conn
+
+    @contextmanager
+    def transaccion(self):
+        """
+        Agrupar varias escrituras en una sola transacción (un único commit)
+
+        BEGIN IMMEDIATE toma el lock de escritura al empezar, así dos threads
+        no se quedan esperando a mitad de transacción. Anidar es seguro: las
+        transacciones internas forman parte de la externa.
+        """
+
+        conn = self.conexion()
+        if self._local.en_transaccion:
+            yield conn
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.en_transaccion = True
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.en_transaccion = False
+
+    def ejecutar(self, sql, parametros=()):
+        """Ejecutar una sentencia y devolver el cursor"""
+        return self.conexion().execute(sql, parametros)
+
+    def ejecutar_muchos(self, sql, filas):
+        """Ejecutar una sentencia para muchas filas dentro de una transacción"""
+
+        with self.transaccion() as conn:
+            return conn.executemany(sql, filas)
+
+    def ejecutar_script(self, script):
+        """Ejecutar varias sentencias (p.ej. CREATE TABLE ...) en una transacción"""
+
+        with self.transaccion() as conn:
+            for sentencia in script.split(';'):
+                if sentencia.strip():
+                    conn.execute(sentencia)
+
+    def consultar(self, sql, parametros=()):
+        """Todas las filas de una consulta"""
+        return self.conexion().execute(sql, parametros).fetchall()
+
+    def consultar_uno(self, sql, parametros=()):
+        """Primera fila de una consulta (o None)"""
+        return self.conexion().execute(sql, parametros).fetchone()
+
+    def _soltar(self, conn):
+        """Cerrar la conexión de un thread que ha terminado"""
+
+        with self._lock:
+            if conn in self._conexiones:
+                self._conexiones.remove(conn)
+        conn.close()
+
+    def cerrar(self):
+        """Cerrar las conexiones de todos los threads"""
+
+        with self._lock:
+            conexiones, self._conexiones = self._conexiones, []
+        for conn in conexiones:
+            conn.close()
+        self._local = threading.local()
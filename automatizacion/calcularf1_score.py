@@ -8,11 +8,15 @@ import numpy as np
 import os
 from datetime import datetime
 
+from joblib import Parallel, delayed
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split, StratifiedKFold, cross_val_score
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier, GradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import f1_score, classification_report, confusion_matrix
+from automatizacion.almacen_predicciones import AlmacenPredicciones
+from automatizacion.trazas import span, trazado, leer_csv, escribir_csv
 import warnings
 from datetime import datetime
 import os
@@ -22,18 +26,37 @@ warnings.filterwarnings('ignore')
 CALCULAR_F1 = True
 MODELO_GLOBAL = None
 
+# Cores que usa cada modelo al entrenar/inferir (-1 = todos). Los runners que
+# entrenan varios modelos en paralelo lo reducen a su presupuesto por proceso
+N_JOBS = -1
+
 class ModeloCoronario:
     """
     Clase para manejar el modelo de predicción de enfermedad coronaria
     """
     
+    # Límites de drift para el entrenamiento incremental (si se superan, reentrenar completo)
+    LIMITE_PSI = 0.2
+    LIMITE_PROPORCION_NUEVAS = 0.5
+    LIMITE_CAMBIO_PREVALENCIA = 0.05
+    
     def __init__(self):
         self.modelo_entrenado = None
         self.encoders = {}
         self.feature_columns = None
         self.threshold_optimo = 0.5
         self.modelo_ensemble = None
+        self.modelo_base = None
+        self.f1_entrenamiento = None
+        self.valores_imputacion = None   # Relleno de nulos aprendido del train (imputar_nulos)
+        
+        # Estado para entrenamiento incremental
+        self.huellas_train = None      # Hash por fila del train usado
+        self.proba_oof = None          # Probabilidades out-of-fold alineadas con huellas_train
+        self.perfil_train = None       # Distribución de features del último entrenamiento completo
+        self.ultima_actualizacion = None
         
+    @trazado('modelo.limpiar_datos')
     def limpiar_datos(self, df):
         """Limpieza y estandarización de datos"""
         
@@ -66,56 +89,68 @@ class ModeloCoronario:
         
         return df_clean
     
-    def imputar_nulos(self, df):
-        """Imputación inteligente de valores nulos"""
-        
-        df_imputed = df.copy()
+    def _calcular_valores_imputacion(self, df):
+        """Valor de relleno de cada columna: 'No' en hábitos, moda en categóricas y mediana en numéricas"""
         
         # Imputación conservadora para variables de hábitos
-        habitos_conservadores = {
-            'Frutas': 'No',
-            'Vegetales': 'No', 
-            'Actividades físicas': 'No',
-            'Fumar': 'No',
-            'Productos de tabaco': 'No',
-            'Bebebidas alcoholicas': 'No'
+        valores = {
+            col: 'No' for col in [
+                'Frutas', 'Vegetales', 'Actividades físicas',
+                'Fumar', 'Productos de tabaco', 'Bebebidas alcoholicas'
+            ] if col in df.columns
         }
         
-        # Imputación médica para condiciones
+        # Moda para condiciones médicas
         condiciones_medicas = [
             'Colesterol alto', 'VIH', 'Presión arterial alta',
             'Diabetes', 'Cáncer', 'Depresión', 'Artritis'
         ]
-        
-        # Aplicar imputación conservadora
-        for col, valor_default in habitos_conservadores.items():
-            if col in df_imputed.columns:
-                df_imputed[col].fillna(valor_default, inplace=True)
-        
-        # Aplicar moda para condiciones médicas
         for col in condiciones_medicas:
-            if col in df_imputed.columns:
-                moda = df_imputed[col].mode()
-                if len(moda) > 0:
-                    df_imputed[col].fillna(moda.iloc[0], inplace=True)
-                else:
-                    df_imputed[col].fillna('No', inplace=True)
+            if col in df.columns:
+                moda = df[col].mode()
+                valores[col] = moda.iloc[0] if len(moda) > 0 else 'No'
         
         # Para otras columnas categóricas, usar moda
-        for col in df_imputed.select_dtypes(include=['object']).columns:
-            if col != 'ID' and col != 'Condición':
-                moda = df_imputed[col].mode()
+        for col in df.select_dtypes(include=['object']).columns:
+            if col not in valores and col != 'ID' and col != 'Condición':
+                moda = df[col].mode()
                 if len(moda) > 0:
-                    df_imputed[col].fillna(moda.iloc[0], inplace=True)
+                    valores[col] = moda.iloc[0]
         
         # Para columnas numéricas, usar mediana
-        for col in df_imputed.select_dtypes(include=[np.number]).columns:
+        for col in df.select_dtypes(include=[np.number]).columns:
             if col != 'ID' and col != 'Condición':
-                mediana = df_imputed[col].median()
-                df_imputed[col].fillna(mediana, inplace=True)
+                mediana = df[col].median()
+                if pd.notna(mediana):
+                    valores[col] = mediana.item() if hasattr(mediana, 'item') else mediana
+        
+        return valores
+    
+    @trazado('modelo.imputar_nulos')
+    def imputar_nulos(self, df, ajustar=False):
+        """
+        Imputación inteligente de valores nulos
+        
+        Con ajustar=True los valores de relleno se calculan sobre df y se guardan
+        (entrenamiento). Después se reutilizan: en test una fila se imputa igual
+        llegue sola o junto a otras. Sin valores guardados se calculan sobre df.
+        """
+        
+        df_imputed = df.copy()
+        
+        valores = getattr(self, 'valores_imputacion', None)
+        if ajustar or valores is None:
+            valores = self._calcular_valores_imputacion(df_imputed)
+            if ajustar:
+                self.valores_imputacion = valores
+        
+        for col, valor in valores.items():
+            if col in df_imputed.columns:
+                df_imputed[col] = df_imputed[col].fillna(valor)
         
         return df_imputed
     
+    @trazado('modelo.feature_engineering')
     def feature_engineering(self, df):
         """Feature engineering avanzado"""
         
@@ -156,6 +191,7 @@ class ModeloCoronario:
         
         return df_features
     
+    @trazado('modelo.preparar_para_ml')
     def preparar_para_ml(self, df, es_entrenamiento=True):
         """Preparar datos para machine learning"""
         
@@ -209,14 +245,13 @@ class ModeloCoronario:
                     if col in self.encoders:
                         le = self.encoders[col]
                         try:
-                            # Manejar valores no vistos
-                            valores_encoded = []
-                            for valor in valores_limpios:
-                                if valor in le.classes_:
-                                    valores_encoded.append(le.transform([valor])[0])
-                                else:
-                                    # Valor no visto, usar el más frecuente (0)
-                                    valores_encoded.append(0)
+                            # Manejar valores no vistos (vectorizado: classes_ está ordenado)
+                            conocidos = valores_limpios.isin(le.classes_).to_numpy()
+                            valores_encoded = np.zeros(len(valores_limpios), dtype=int)
+                            valores_encoded[conocidos] = np.searchsorted(
+                                le.classes_, valores_limpios[conocidos].to_numpy()
+                            )
+                            # Valor no visto, usar el más frecuente (0)
                             X_encoded[col] = valores_encoded
                         except:
                             X_encoded[col] = 0
@@ -234,8 +269,8 @@ class ModeloCoronario:
         # 1. Limpiar datos
         df_clean = self.limpiar_datos(df_train)
         
-        # 2. Imputar nulos
-        df_imputed = self.imputar_nulos(df_clean)
+        # 2. Imputar nulos (y guardar los valores de relleno para test)
+        df_imputed = self.imputar_nulos(df_clean, ajustar=True)
         
         # 3. Feature engineering
         df_features = self.feature_engineering(df_imputed)
@@ -246,106 +281,450 @@ class ModeloCoronario:
         print(f"📊 Dataset preparado: {X.shape}")
         print(f"🎯 Target balance: {y.value_counts().to_dict()}")
         
-        # 5. Entrenar modelo base
+        # 5. Entrenar modelo base (con OOB para tener probabilidades out-of-fold)
         modelo_base = RandomForestClassifier(
             n_estimators=200,
             class_weight='balanced',
+            oob_score=True,
             random_state=42,
-            n_jobs=-1
+            n_jobs=N_JOBS
         )
         
-        modelo_base.fit(X, y)
+        with span('fit.RandomForest', filas=len(X)):
+            modelo_base.fit(X, y)
+        self.modelo_base = modelo_base
+        
+        # 6. Optimizar threshold con las probabilidades OOB (out-of-fold)
+        proba_oof_base = modelo_base.oob_decision_function_[:, 1]
+        threshold_base, f1_threshold = self._optimizar_threshold(y, proba_oof_base)
+        
+        # 7. Probabilidades out-of-fold del ensemble (None si ya pierde en el primer fold)
+        rf_model = RandomForestClassifier(n_estimators=200, class_weight='balanced', oob_score=True, random_state=42)
+        gb_model = GradientBoostingClassifier(n_estimators=100, random_state=42)
+        
+        proba_oof_ensemble = self._proba_oof_ensemble(X, y, gb_model, proba_oof_base)
+        
+        # 8. Seleccionar mejor modelo (ensemble vs base) por F1 out-of-fold, cada uno con su threshold
+        f1_ensemble = -1.0
+        self.modelo_ensemble = None
+        if proba_oof_ensemble is not None:
+            threshold_ensemble, f1_ensemble = self._optimizar_threshold(y, proba_oof_ensemble)
+        
+        if f1_ensemble > f1_threshold:
+            # El ensemble solo se entrena si se va a usar
+            self.modelo_ensemble = VotingClassifier(
+                estimators=[('rf', rf_model), ('gb', gb_model)],
+                voting='soft'
+            )
+            with span('fit.VotingClassifier', filas=len(X)):
+                self.modelo_ensemble.fit(X, y)
+            
+            self.modelo_entrenado = self.modelo_ensemble
+            self.threshold_optimo = threshold_ensemble
+            self.proba_oof = proba_oof_ensemble
+            print(f"✅ Usando Ensemble con threshold - F1 OOF: {f1_ensemble:.4f}")
+        else:
+            self.modelo_entrenado = modelo_base
+            self.threshold_optimo = threshold_base
+            self.proba_oof = proba_oof_base
+            print(f"✅ Usando RF con threshold - F1 OOF: {f1_threshold:.4f}")
+        
+        print(f"🎚️ Threshold óptimo: {self.threshold_optimo:.3f}")
+        
+        # 9. Guardar estado para futuros entrenamientos incrementales
+        self.huellas_train = self._huellas(df_train)
+        self.perfil_train = self._perfil_features(X, y)
+        self.ultima_actualizacion = {'modo': 'completo', 'filas': len(df_train)}
+        
+        # Mismo criterio que en modo incremental: F1 out-of-fold, no sobre el propio train
+        self.f1_entrenamiento = max(f1_ensemble, f1_threshold)
+        return self.f1_entrenamiento
+    
+    def _proba_oof_ensemble(self, X, y, gb, proba_rf, n_splits=5):
+        """
+        Probabilidades out-of-fold del ensemble sobre el train
         
-        # 6. Optimizar threshold
-        y_proba = modelo_base.predict_proba(X)[:, 1]
-        thresholds = np.arange(0.1, 0.9, 0.05)
+        El bosque del ensemble tiene los mismos parámetros y semilla que el modelo
+        base, así que se reutiliza su OOB (proba_rf). El boosting no tiene OOB: se
+        reentrena en validación cruzada estratificada y cada fila se predice con el
+        modelo que no la vio. Se promedian como el voting soft.
+        
+        La validación cruzada del boosting es lo más caro del entrenamiento: se
+        ajusta primero un fold y, si en esas filas el ensemble no supera al RF,
+        no se completan los demás.
+        
+        Returns:
+            np.ndarray o None: Probabilidades OOF, o None si el ensemble pierde en el primer fold
+        """
+        
+        y = np.asarray(y)
+        folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42).split(X, y))
+        proba_gb = np.empty(len(y))
+        
+        def ajustar_fold(entrenamiento, prueba):
+            modelo = clone(gb).fit(X.iloc[entrenamiento], y[entrenamiento])
+            return prueba, modelo.predict_proba(X.iloc[prueba])[:, 1]
+        
+        with span('fit.cv.GradientBoosting', filas=len(X), folds=1):
+            prueba, proba_gb[prueba] = ajustar_fold(*folds[0])
+        
+        _, f1_rf = self._optimizar_threshold(y[prueba], proba_rf[prueba])
+        _, f1_ensemble = self._optimizar_threshold(y[prueba], (proba_rf[prueba] + proba_gb[prueba]) / 2)
+        if f1_ensemble <= f1_rf:
+            print(f"⏭️ Ensemble sin mejora en el primer fold ({f1_ensemble:.4f} vs RF {f1_rf:.4f}) - "
+                  f"se omite el resto de la validación cruzada")
+            return None
+        
+        with span('fit.cv.GradientBoosting', filas=len(X), folds=n_splits - 1):
+            resultados = Parallel(n_jobs=N_JOBS)(delayed(ajustar_fold)(e, p) for e, p in folds[1:])
+        for prueba, proba in resultados:
+            proba_gb[prueba] = proba
+        
+        return (proba_rf + proba_gb) / 2
+    
+    def _optimizar_threshold(self, y, y_proba):
+        """Buscar el threshold que maximiza F1 (ignora probabilidades NaN)"""
+        
+        validas = np.isfinite(y_proba)
+        y_valido = np.asarray(y)[validas]
+        proba_valida = y_proba[validas]
+        
+        mejor_thresh = self.threshold_optimo
         best_f1 = 0
         
-        for thresh in thresholds:
-            y_pred_thresh = (y_proba >= thresh).astype(int)
-            f1_thresh = f1_score(y, y_pred_thresh)
+        for thresh in np.arange(0.1, 0.9, 0.05):
+            y_pred_thresh = (proba_valida >= thresh).astype(int)
+            f1_thresh = f1_score(y_valido, y_pred_thresh)
             if f1_thresh > best_f1:
                 best_f1 = f1_thresh
-                self.threshold_optimo = thresh
+                mejor_thresh = thresh
         
-        # 7. Crear ensemble
-        rf_model = RandomForestClassifier(n_estimators=200, class_weight='balanced', random_state=42)
-        gb_model = GradientBoostingClassifier(n_estimators=100, random_state=42)
+        return mejor_thresh, best_f1
+    
+    # ================================
+    # ♻️ ENTRENAMIENTO INCREMENTAL
+    # ================================
+    
+    def _huellas(self, df):
+        """Huella (hash uint64) de cada fila cruda del dataset"""
+        return pd.util.hash_pandas_object(df, index=False).to_numpy()
+    
+    def _perfil_features(self, X, y, n_bins=10):
+        """Distribución de referencia de cada feature (bins por cuantiles) y prevalencia"""
         
-        self.modelo_ensemble = VotingClassifier(
-            estimators=[('rf', rf_model), ('gb', gb_model)],
-            voting='soft'
+        columnas = {}
+        for col in X.columns:
+            valores = np.asarray(X[col], dtype=float)
+            valores = valores[np.isfinite(valores)]
+            if len(valores) == 0:
+                continue
+            cortes = np.unique(np.quantile(valores, np.linspace(0, 1, n_bins + 1)))[1:-1]
+            conteos = np.bincount(np.searchsorted(cortes, valores, side='right'), minlength=len(cortes) + 1)
+            columnas[col] = (cortes, conteos / conteos.sum())
+        
+        return {'columnas': columnas, 'prevalencia': float(np.mean(y))}
+    
+    def _medir_drift(self, X_nuevo, y_nuevo):
+        """PSI por feature y cambio de prevalencia de las filas nuevas contra el perfil de referencia"""
+        
+        eps = 1e-6
+        psi_max, columna_psi_max = 0.0, None
+        
+        for col, (cortes, props_ref) in self.perfil_train['columnas'].items():
+            if col not in X_nuevo.columns:
+                continue
+            valores = np.asarray(X_nuevo[col], dtype=float)
+            valores = valores[np.isfinite(valores)]
+            if len(valores) == 0:
+                continue
+            conteos = np.bincount(np.searchsorted(cortes, valores, side='right'), minlength=len(props_ref))
+            props_nuevas = conteos / conteos.sum()
+            psi = float(np.sum((props_nuevas - props_ref) * np.log((props_nuevas + eps) / (props_ref + eps))))
+            if psi > psi_max:
+                psi_max, columna_psi_max = psi, col
+        
+        return {
+            'psi_max': psi_max,
+            'columna_psi_max': columna_psi_max,
+            'cambio_prevalencia': abs(float(np.mean(y_nuevo)) - self.perfil_train['prevalencia'])
+        }
+    
+    def _categorias_no_vistas(self, df_features):
+        """Contar valores categóricos que los encoders actuales no conocen"""
+        
+        total = 0
+        for col, le in self.encoders.items():
+            if col in df_features.columns:
+                valores = df_features[col].fillna('MISSING').astype(str)
+                total += int((~valores.isin(le.classes_)).sum())
+        return total
+    
+    def _crecer_bosque(self, bosque, X, y, n_arboles_extra):
+        """Añadir árboles a un bosque ya entrenado (warm start)"""
+        bosque.set_params(
+            warm_start=True,
+            oob_score=False,  # Los OOB de árboles viejos no son válidos con el dataset crecido
+            n_estimators=bosque.n_estimators + n_arboles_extra
         )
+        with span('fit.warm_start.bosque', filas=len(X), arboles_extra=n_arboles_extra):
+            bosque.fit(X, y)
+    
+    def _continuar_boosting(self, gb, X, y, n_rondas_extra):
+        """Continuar las rondas de boosting desde el último estado (warm start)"""
+        gb.set_params(warm_start=True, n_estimators=gb.n_estimators + n_rondas_extra)
+        with span('fit.warm_start.boosting', filas=len(X), rondas_extra=n_rondas_extra):
+            gb.fit(X, y)
+    
+    def entrenar_incremental(self, df_train):
+        """
+        Actualizar el modelo con las filas añadidas a df_train sin reentrenar desde cero
+        
+        Las filas nuevas se detectan comparando huellas contra el train anterior.
+        Los bosques crecen con árboles extra (warm start) y el boosting continúa
+        sus rondas, en ambos casos ajustados solo con las filas nuevas (lo ya
+        aprendido de las previas está en los árboles existentes); el threshold se
+        recalcula sobre las probabilidades out-of-fold combinadas. Si el drift
+        supera los límites, se hace un entrenamiento completo.
+        
+        Necesita el estado del último entrenamiento en memoria (modelo_base,
+        modelo_ensemble, huellas_train, proba_oof, perfil_train). Un modelo
+        cargado de un artefacto solo lo tiene si se guardó y se cargó con
+        incremental=True (ver guardar_artefacto / cargar_artefacto); sin él se
+        hace un entrenamiento completo.
+        
+        Args:
+            df_train: Dataset de entrenamiento completo (filas anteriores + nuevas)
+        
+        Returns:
+            float: F1-score out-of-fold (igual que entrenar_modelo)
+        """
+        
+        if self.modelo_base is None or self.huellas_train is None:
+            if self.modelo_entrenado is not None:
+                print("⚠️ Modelo sin estado incremental (¿artefacto guardado sin incremental=True?) - entrenamiento completo")
+            else:
+                print("⚠️ Sin modelo previo - entrenamiento completo")
+            return self.entrenar_modelo(df_train)
         
-        self.modelo_ensemble.fit(X, y)
+        print("♻️ ENTRENAMIENTO INCREMENTAL")
+        print("="*40)
         
-        # 8. Seleccionar mejor modelo (ensemble vs base con threshold)
-        y_pred_ensemble = self.modelo_ensemble.predict(X)
-        y_pred_threshold = (modelo_base.predict_proba(X)[:, 1] >= self.threshold_optimo).astype(int)
+        # 1. Detectar filas nuevas por huella
+        huellas = self._huellas(df_train)
+        orden = np.argsort(self.huellas_train)
+        huellas_previas = self.huellas_train[orden]
+        
+        pos = np.minimum(np.searchsorted(huellas_previas, huellas), len(huellas_previas) - 1)
+        conocidas = huellas_previas[pos] == huellas
+        n_nuevas = int((~conocidas).sum())
+        
+        if not np.isin(huellas_previas, huellas).all():
+            print("⚠️ Filas anteriores modificadas o eliminadas - entrenamiento completo")
+            return self.entrenar_modelo(df_train)
+        
+        if n_nuevas == 0:
+            print("✅ Sin filas nuevas - modelo sin cambios")
+            return self.f1_entrenamiento
+        
+        print(f"📊 Filas nuevas: {n_nuevas:,} (previas: {len(huellas_previas):,})")
+        
+        # 2. Procesar con los encoders existentes
+        df_features = self.feature_engineering(self.imputar_nulos(self.limpiar_datos(df_train)))
+        X, _ = self.preparar_para_ml(df_features, es_entrenamiento=False)
+        y = df_features['Condición']
+        X_nuevo, y_nuevo = X[~conocidas], y[~conocidas]
+        
+        # 3. Métricas de drift
+        drift = self._medir_drift(X_nuevo, y_nuevo)
+        drift['proporcion_nuevas'] = n_nuevas / len(huellas_previas)
+        drift['categorias_no_vistas'] = self._categorias_no_vistas(df_features[~conocidas])
+        
+        print(f"📈 Drift: PSI máx={drift['psi_max']:.3f} ({drift['columna_psi_max']}), "
+              f"Δprevalencia={drift['cambio_prevalencia']:.3f}, "
+              f"nuevas={drift['proporcion_nuevas']:.1%}")
+        
+        motivos = []
+        if drift['psi_max'] > self.LIMITE_PSI:
+            motivos.append('PSI')
+        if drift['cambio_prevalencia'] > self.LIMITE_CAMBIO_PREVALENCIA:
+            motivos.append('prevalencia')
+        if drift['proporcion_nuevas'] > self.LIMITE_PROPORCION_NUEVAS:
+            motivos.append('proporción de filas nuevas')
+        if drift['categorias_no_vistas'] > 0:
+            motivos.append('categorías no vistas')
+        if y_nuevo.nunique() < 2:
+            # Los árboles nuevos se ajustan solo con estas filas: necesitan ambas clases
+            motivos.append('filas nuevas de una sola clase')
+        
+        if motivos:
+            print(f"⚠️ Drift excesivo ({', '.join(motivos)}) - entrenamiento completo")
+            f1_completo = self.entrenar_modelo(df_train)
+            self.ultima_actualizacion.update({'motivo': motivos, 'drift': drift})
+            return f1_completo
+        
+        # 4. OOF de las filas nuevas = predicción del modelo seleccionado antes de verlas
+        with span('predict_proba.incremental', filas=len(X_nuevo)):
+            proba_oof_nuevas = self.modelo_entrenado.predict_proba(X_nuevo)[:, 1]
+        
+        # 5. Crecer bosques y continuar boosting con las filas nuevas
+        n_arboles = max(10, int(np.ceil(drift['proporcion_nuevas'] * self.modelo_base.n_estimators)))
+        self._crecer_bosque(self.modelo_base, X_nuevo, y_nuevo, n_arboles)
+        
+        if self.modelo_ensemble is not None:
+            for nombre, miembro in self.modelo_ensemble.named_estimators_.items():
+                if isinstance(miembro, GradientBoostingClassifier):
+                    n_rondas = max(5, int(np.ceil(drift['proporcion_nuevas'] * miembro.n_estimators)))
+                    self._continuar_boosting(miembro, X_nuevo, y_nuevo, n_rondas)
+                else:
+                    self._crecer_bosque(miembro, X_nuevo, y_nuevo, n_arboles)
+        
+        print(f"🌲 Árboles añadidos por bosque: {n_arboles}")
+        
+        # 6. Refrescar threshold con los OOF combinados
+        proba_oof = np.empty(len(huellas))
+        proba_oof[conocidas] = self.proba_oof[orden][pos[conocidas]]
+        proba_oof[~conocidas] = proba_oof_nuevas
+        
+        self.threshold_optimo, f1_oof = self._optimizar_threshold(y, proba_oof)
+        
+        self.huellas_train = huellas
+        self.proba_oof = proba_oof
+        self.f1_entrenamiento = f1_oof
+        self.ultima_actualizacion = {
+            'modo': 'incremental',
+            'filas': len(df_train),
+            'filas_nuevas': n_nuevas,
+            'arboles_extra': n_arboles,
+            'drift': drift
+        }
         
-        f1_ensemble = f1_score(y, y_pred_ensemble)
-        f1_threshold = f1_score(y, y_pred_threshold)
+        print(f"🎚️ Threshold óptimo: {self.threshold_optimo:.3f}")
+        print(f"✅ Actualización incremental - F1 OOF: {f1_oof:.4f}")
         
-        if f1_ensemble > f1_threshold:
-            self.modelo_entrenado = self.modelo_ensemble
-            print(f"✅ Usando Ensemble - F1: {f1_ensemble:.4f}")
-        else:
-            self.modelo_entrenado = modelo_base
-            print(f"✅ Usando RF con threshold - F1: {f1_threshold:.4f}")
+        return f1_oof
+    
+    def features_test(self, df_test, limpio=False):
+        """
+        Limpieza, imputación y feature engineering de un dataset de test
         
-        print(f"🎚️ Threshold óptimo: {self.threshold_optimo:.3f}")
+        La imputación usa los valores aprendidos en el entrenamiento, así que el
+        resultado depende del modelo. Solo la limpieza (limpiar_datos) es común
+        a todos los modelos: con limpio=True df_test ya viene limpio.
+        """
         
-        return max(f1_ensemble, f1_threshold)
+        df_clean = df_test if limpio else self.limpiar_datos(df_test)
+        df_imputed = self.imputar_nulos(df_clean)
+        return self.feature_engineering(df_imputed)
     
-    def predecir(self, df_test, calcular_f1=False):
-        """Hacer predicciones en dataset de test"""
+    def _preparar_test(self, df_test, limpio=False):
+        """Procesar un dataset de test igual que en entrenamiento -> (X_test, y_test o None)"""
         
-        if self.modelo_entrenado is None:
+        df_features = self.features_test(df_test, limpio=limpio)
+        
+        X_test, _ = self.preparar_para_ml(df_features, es_entrenamiento=False)
+        y_test = df_test['Condición'] if 'Condición' in df_test.columns else None
+        
+        return X_test, y_test
+    
+    def validar_registros(self, df):
+        """
+        Comprobar un dataset de test antes de juntarlo con otros
+        
+        preparar_para_ml decide por el dtype de cada columna si es numérica:
+        un valor no numérico en una columna numérica cambiaría el tratamiento de
+        la columna para todo el lote. Aquí se convierten a número las columnas
+        numéricas del entrenamiento y se rechaza el dataset si alguna no lo es.
+        
+        Returns:
+            pd.DataFrame: Copia con las columnas numéricas en float
+        """
+        
+        if self.feature_columns is None:
             raise ValueError("❌ Modelo no entrenado. Ejecuta entrenar_modelo() primero.")
         
-        print("🔮 HACIENDO PREDICCIONES")
-        print("="*30)
+        df = df.copy()
+        for col in self.feature_columns:
+            if col in df.columns and col not in self.encoders:
+                try:
+                    df[col] = pd.to_numeric(df[col], errors='raise').astype(float)
+                except (ValueError, TypeError):
+                    raise ValueError(f"❌ Columna '{col}' con valores no numéricos")
         
-        # 1. Procesar datos igual que en entrenamiento
-        df_clean = self.limpiar_datos(df_test)
-        df_imputed = self.imputar_nulos(df_clean)
-        df_features = self.feature_engineering(df_imputed)
+        return df
+    
+    def predecir(self, df_test, calcular_f1=False):
+        """Hacer predicciones en dataset de test"""
         
-        # 2. Preparar para ML
-        X_test, y_test = self.preparar_para_ml(df_features, es_entrenamiento=False)
+        return self.predecir_lote({'test': df_test}, calcular_f1=calcular_f1)['test']
+    
+    def predecir_lote(self, datasets, calcular_f1=True, verbose=True, limpios=False):
+        """
+        Hacer predicciones de varios datasets de test con una sola pasada del modelo
         
-        print(f"📊 Test preparado: {X_test.shape}")
+        Cada dataset se preprocesa por separado, las matrices se concatenan, el
+        modelo corre una vez y los resultados se reparten de vuelta por nombre.
         
-        # 3. Hacer predicciones
-        if self.modelo_entrenado == self.modelo_ensemble:
-            # Usar ensemble
-            y_pred = self.modelo_entrenado.predict(X_test)
-            y_proba = self.modelo_entrenado.predict_proba(X_test)[:, 1]
-        else:
-            # Usar modelo base con threshold
-            y_proba = self.modelo_entrenado.predict_proba(X_test)[:, 1]
-            y_pred = (y_proba >= self.threshold_optimo).astype(int)
-        
-        # 4. Crear DataFrame de resultados
-        resultados = pd.DataFrame({
-            'ID': df_test['ID'],
-            'Condición': y_pred,
-            'Probabilidad': y_proba
-        })
+        Args:
+            datasets (dict): {nombre: DataFrame de test}
+            calcular_f1 (bool): Calcular F1 en los datasets que tengan 'Condición'
+            verbose (bool): Mostrar progreso (False para servir peticiones)
+            limpios (bool): Los datasets ya vienen de limpiar_datos()
         
-        # 5. Calcular F1 si se puede
-        f1_resultado = None
-        if calcular_f1 and y_test is not None:
-            f1_resultado = f1_score(y_test, y_pred)
-            print(f"🎯 F1-Score: {f1_resultado:.4f}")
+        Returns:
+            dict: {nombre: (resultados_df, f1_score o None)}
+        """
+        
+        if self.modelo_entrenado is None:
+            raise ValueError("❌ Modelo no entrenado. Ejecuta entrenar_modelo() primero.")
+        
+        if verbose:
+            print("🔮 HACIENDO PREDICCIONES")
+            print("="*30)
+        
+        # 1. Procesar cada dataset igual que en entrenamiento
+        preparados = {}
+        for nombre, df_test in datasets.items():
+            preparados[nombre] = self._preparar_test(df_test, limpio=limpios)
+            if verbose:
+                print(f"📊 Test preparado ({nombre}): {preparados[nombre][0].shape}")
+        
+        # 2. Una sola pasada de probabilidades sobre todas las filas y etiquetas
+        #    con el threshold del modelo seleccionado
+        X_total = pd.concat([X_test for X_test, _ in preparados.values()], ignore_index=True)
+        with span('predict_proba.lote', filas=len(X_total)):
+            y_proba_total = self.modelo_entrenado.predict_proba(X_total)[:, 1]
+        y_pred_total = (y_proba_total >= self.threshold_optimo).astype(int)
+        
+        # 3. Repartir resultados por dataset
+        salida = {}
+        inicio = 0
+        for nombre, (X_test, y_test) in preparados.items():
+            fin = inicio + len(X_test)
+            y_pred = y_pred_total[inicio:fin]
+            
+            resultados = pd.DataFrame({
+                'ID': datasets[nombre]['ID'].values,
+                'Condición': y_pred,
+                'Probabilidad': y_proba_total[inicio:fin]
+            })
             
-            # Reporte detallado
-            print("\n📋 Classification Report:")
-            print(classification_report(y_test, y_pred))
+            # Calcular F1 si se puede
+            f1_resultado = None
+            if calcular_f1 and y_test is not None:
+                f1_resultado = f1_score(y_test, y_pred)
+                print(f"🎯 F1-Score ({nombre}): {f1_resultado:.4f}")
+                
+                # Reporte detallado
+                print("\n📋 Classification Report:")
+                print(classification_report(y_test, y_pred))
+            
+            salida[nombre] = (resultados, f1_resultado)
+            inicio = fin
         
-        print(f"✅ Predicciones completadas: {len(resultados)} casos")
+        if verbose:
+            print(f"✅ Predicciones completadas: {len(X_total)} casos")
         
-        return resultados, f1_resultado
+        return salida
 
 # ================================
 # 🎮 FUNCIONES PRINCIPALES PARA IMPORTAR
@@ -420,7 +799,7 @@ def crear_submission_final(predicciones_public, predicciones_private, filename='
     print(f"📊 Distribución predicciones: {submission['Condición'].value_counts().to_dict()}")
     
     # Guardar archivo
-    submission.to_csv(filename, index=False)
+    escribir_csv(submission, filename, index=False)
     print(f"💾 Archivo guardado: {filename}")
     
     return submission
@@ -449,7 +828,7 @@ def obtener_score(archivo_csv, modelo=None, tiene_target=None):
     if not os.path.exists(archivo_csv):
         raise FileNotFoundError(f"❌ No se encuentra el archivo: {archivo_csv}")
     
-    df = pd.read_csv(archivo_csv)
+    df = leer_csv(archivo_csv)
     print(f"📊 Datos cargados: {df.shape[0]:,} filas × {df.shape[1]} columnas")
     
     # Detectar si tiene target automáticamente
@@ -497,7 +876,7 @@ def entrenar_modelo_completo(usar_archivo='train.csv'):
         else:
             raise FileNotFoundError("❌ No se encuentra ningún archivo de entrenamiento")
     
-    df_train = pd.read_csv(usar_archivo)
+    df_train = leer_csv(usar_archivo)
     print(f"📊 Dataset entrenamiento: {df_train.shape[0]:,} filas × {df_train.shape[1]} columnas")
     
     # Crear y entrenar modelo
@@ -512,6 +891,36 @@ def entrenar_modelo_completo(usar_archivo='train.csv'):
     
     return modelo
 
+def actualizar_modelo_incremental(usar_archivo='train.csv', modelo=None):
+    """
+    Actualiza un modelo con las filas nuevas del dataset sin reentrenar desde cero
+    
+    Args:
+        usar_archivo (str): Archivo de entrenamiento (crecido desde el último entrenamiento)
+        modelo (ModeloCoronario): Modelo a actualizar (por defecto MODELO_GLOBAL)
+    
+    Returns:
+        ModeloCoronario: Modelo actualizado
+    """
+    
+    global MODELO_GLOBAL
+    
+    if modelo is None:
+        modelo = MODELO_GLOBAL
+    
+    if modelo is None:
+        return entrenar_modelo_completo(usar_archivo)
+    
+    df_train = leer_csv(usar_archivo)
+    print(f"📊 Dataset entrenamiento: {df_train.shape[0]:,} filas × {df_train.shape[1]} columnas")
+    
+    f1_entrenamiento = modelo.entrenar_incremental(df_train)
+    print(f"✅ Modelo actualizado - F1: {f1_entrenamiento:.4f}")
+    
+    MODELO_GLOBAL = modelo
+    
+    return modelo
+
 def generar_predicciones(archivo_test, archivo_salida, modelo=None):
     """
     Genera archivo de predicciones para submission
@@ -531,23 +940,75 @@ def generar_predicciones(archivo_test, archivo_salida, modelo=None):
     # Obtener predicciones
     predicciones, f1_score = obtener_score(archivo_test, modelo, tiene_target=False)
     
-    # Formato para submission (solo ID y Condición)
+    return guardar_predicciones(predicciones, archivo_salida)
+
+def guardar_predicciones(predicciones, archivo_salida):
+    """
+    Guarda predicciones en formato submission (solo ID y Condición)
+    
+    Args:
+        predicciones (pd.DataFrame): Predicciones con columnas 'ID' y 'Condición'
+        archivo_salida (str): Nombre del archivo de salida
+    
+    Returns:
+        pd.DataFrame: DataFrame guardado
+    """
+    
     submission = predicciones[['ID', 'Condición']].copy()
     
     # Guardar archivo
-    submission.to_csv(archivo_salida, index=False)
+    escribir_csv(submission, archivo_salida, index=False)
     print(f"💾 Archivo guardado: {archivo_salida}")
     print(f"📊 Predicciones: {len(submission):,}")
     print(f"📊 Distribución: {submission['Condición'].value_counts().to_dict()}")
     
     return submission
 
-def procesar_ambos_datasets(modelo=None):
+def obtener_scores_lote(archivos_csv, modelo=None):
+    """
+    Obtiene predicciones y F1-Score de varios archivos con una sola pasada del modelo
+    
+    Args:
+        archivos_csv (list): Rutas a los archivos CSV (p.ej. ['test_public.csv', 'test_private.csv'])
+        modelo (ModeloCoronario): Modelo entrenado (opcional, se entrena automáticamente)
+    
+    Returns:
+        dict: {archivo_csv: (predicciones_df, f1_score o None)}
+    """
+    
+    print(f"🎯 ANALIZANDO EN LOTE: {', '.join(archivos_csv)}")
+    print("="*50)
+    
+    # Cargar datos
+    datasets = {}
+    for archivo_csv in archivos_csv:
+        if not os.path.exists(archivo_csv):
+            raise FileNotFoundError(f"❌ No se encuentra el archivo: {archivo_csv}")
+        
+        datasets[archivo_csv] = leer_csv(archivo_csv)
+        tiene_target = 'Condición' in datasets[archivo_csv].columns
+        print(f"📊 {archivo_csv}: {len(datasets[archivo_csv]):,} filas (target: {'Sí' if tiene_target else 'No'})")
+    
+    # Entrenar modelo si no se proporciona
+    if modelo is None:
+        print("🤖 Entrenando modelo automáticamente...")
+        modelo = entrenar_modelo_completo()
+    
+    resultados = modelo.predecir_lote(datasets, calcular_f1=True)
+    
+    for archivo_csv, (_, f1_resultado) in resultados.items():
+        if f1_resultado is not None:
+            print(f"🏆 F1-Score {archivo_csv}: {f1_resultado:.4f}")
+    
+    return resultados
+
+def procesar_ambos_datasets(modelo=None, almacen=None):
     """
     Procesa tanto test_public.csv como test_private.csv
     
     Args:
         modelo (ModeloCoronario): Modelo entrenado (opcional)
+        almacen (AlmacenPredicciones): Archivo donde guardar las probabilidades (opcional)
     
     Returns:
         dict: Resultados de ambos datasets
@@ -562,44 +1023,48 @@ def procesar_ambos_datasets(modelo=None):
     if modelo is None:
         modelo = entrenar_modelo_completo()
     
-    # Procesar test_public.csv (tiene target)
-    if os.path.exists('test_public.csv'):
-        print("\n📊 PROCESANDO TEST_PUBLIC.CSV:")
-        pred_public, f1_public = obtener_score('test_public.csv', modelo, tiene_target=True)
-        resultados['public'] = {
-            'predicciones': pred_public,
-            'f1_score': f1_public,
-            'archivo': 'test_public.csv'
-        }
-        
-        # Guardar predicciones
-        generar_predicciones('test_public.csv', 'predicciones_public.csv', modelo)
-    else:
-        print("⚠️ test_public.csv no encontrado")
-    
-    # Procesar test_private.csv (sin target)
-    if os.path.exists('test_private.csv'):
-        print("\n📊 PROCESANDO TEST_PRIVATE.CSV:")
-        pred_private, _ = obtener_score('test_private.csv', modelo, tiene_target=False)
-        resultados['private'] = {
-            'predicciones': pred_private,
-            'f1_score': None,
-            'archivo': 'test_private.csv'
-        }
-        
-        # Guardar predicciones
-        generar_predicciones('test_private.csv', 'predicciones_private.csv', modelo)
-    else:
-        print("⚠️ test_private.csv no encontrado")
-      # Crear submission combinada si ambos existen
-    if 'public' in resultados and 'private' in resultados:        print("\n📝 CREANDO SUBMISSION COMBINADA:")
+    if almacen is None:
+        almacen = AlmacenPredicciones()
+    
+    archivos = {'public': 'test_public.csv', 'private': 'test_private.csv'}
+    existentes = {}
+    for clave, archivo in archivos.items():
+        if os.path.exists(archivo):
+            existentes[clave] = archivo
+        else:
+            print(f"⚠️ {archivo} no encontrado")
+    
+    # Una sola pasada del modelo para todos los archivos
+    if existentes:
+        print(f"\n📊 PROCESANDO {', '.join(a.upper() for a in existentes.values())}:")
+        scores = obtener_scores_lote(list(existentes.values()), modelo)
+        
+        for clave, archivo in existentes.items():
+            predicciones, f1_resultado = scores[archivo]
+            resultados[clave] = {
+                'predicciones': predicciones,
+                'f1_score': f1_resultado,
+                'archivo': archivo
+            }
+            
+            # Guardar predicciones (el CSV se sobrescribe; el almacén conserva el histórico)
+            guardar_predicciones(predicciones, f'predicciones_{clave}.csv')
+            resultados[clave]['ejecucion_id'] = almacen.guardar(
+                predicciones, clave,
+                threshold=modelo.threshold_optimo,
+                metadatos={'archivo': archivo, 'f1_score': f1_resultado}
+            )
+    
+    # Crear submission combinada si ambos existen
+    if 'public' in resultados and 'private' in resultados:
+        print("\n📝 CREANDO SUBMISSION COMBINADA:")
         submission_combinada = pd.concat([
             resultados['public']['predicciones'][['ID', 'Condición']],
             resultados['private']['predicciones'][['ID', 'Condición']]
         ], ignore_index=True)
         
         archivo_final = 'solucion.csv'
-        submission_combinada.to_csv(archivo_final, index=False)
+        escribir_csv(submission_combinada, archivo_final, index=False)
         print(f"💾 Submission final: {archivo_final}")
         
         resultados['submission_final'] = {
@@ -662,7 +1127,7 @@ def calcular_f1_ponderado_datasets():
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         archivo_resultados = f'f1_ponderado_{timestamp}.csv'
-        df_resultados.to_csv(archivo_resultados, index=False)
+        escribir_csv(df_resultados, archivo_resultados, index=False)
         print(f"💾 Resultados guardados: {archivo_resultados}")
     
     return resultados_f1
@@ -0,0 +1,384 @@
+# ================================
+# 🌲 COMPILADOR DE ENSEMBLES DE ÁRBOLES A ARRAYS NUMPY
+# ================================
+# Convierte RF / ExtraTrees / GradientBoosting (y VotingClassifier soft de ellos)
+# en arrays planos de nodos para inferencia por lotes vectorizada. El recorrido
+# lee directamente esos arrays (también mapeados desde un artefacto): no se
+# reconstruye ningún árbol de sklearn ni se copia el modelo en cada proceso
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.special import expit, logit
+
+from sklearn.ensemble import (
+    RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier, VotingClassifier
+)
+from sklearn.tree import DecisionTreeClassifier
+
+# Elementos (árbol, fila) procesados a la vez: árboles profundos van de uno en uno,
+# los árboles poco profundos del boosting se agrupan para amortizar el overhead de Python
+ELEMENTOS_POR_GRUPO = 65536
+
+# Niveles que se avanzan entre compactaciones del conjunto activo
+NIVELES_POR_COMPACTACION = 3
+
+# Filas mínimas por bloque al repartir el lote entre threads
+FILAS_MIN_POR_THREAD = 4096
+
+# Nodos revisados a la vez al validar (acota la memoria temporal de validar())
+NODOS_POR_VALIDACION = 1 << 18
+
+class ModeloCompilado:
+    """
+    Ensemble de árboles empaquetado en arrays planos
+
+    Todos los árboles comparten los mismos arrays de nodos:
+      - feature:   int32, feature evaluada en el nodo (0 en hojas)
+      - threshold: float32, threshold de sklearn redondeado hacia abajo a float32
+                   (para X en float32, x <= t32 equivale a x <= t64); NaN en hojas
+                   (sklearn usa +inf en splits que solo separan los faltantes)
+      - hijos:     int32, hijos[2*i] = derecho, hijos[2*i + 1] = izquierdo; las hojas
+                   apuntan a sí mismas
+      - valor:     float64, probabilidad positiva (bosques) o learning_rate * valor (boosting)
+      - valor_neg: float64, probabilidad negativa en las hojas de bosques (0 en boosting);
+                   solo existe si el modelo tiene bosques
+
+    La inferencia avanza todas las filas del lote un nivel a la vez y compara
+    igual que sklearn: X en float32 y `x <= threshold`. Los pares (árbol, fila) que llegan
+    a una hoja salen del conjunto activo. Las sumas siguen el orden de sklearn,
+    así que las probabilidades coinciden bit a bit con predict_proba.
+
+    Cada miembro es un rango contiguo de árboles:
+      - 'bosque':   probabilidad de cada clase = media de las hojas
+      - 'boosting': probabilidad = sigmoide(base + suma de las hojas)
+    La probabilidad final es la media ponderada de los miembros (voting soft),
+    calculada como np.average en VotingClassifier.
+    """
+
+    def __init__(self, feature, threshold, hijos, valor, raices, miembros,
+                 n_features, classes, faltantes_izq=None, valor_neg=None, n_jobs=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.hijos = hijos
+        self.valor = valor
+        self.valor_neg = valor_neg
+        self.raices = raices
+        self.miembros = miembros
+        self.n_features = n_features
+        self.classes_ = classes
+        self.faltantes_izq = faltantes_izq
+        self.n_jobs = n_jobs
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    @property
+    def n_nodos(self):
+        return len(self.feature)
+
+    @property
+    def memoria_bytes(self):
+        """Bytes ocupados por los arrays de nodos"""
+        arrays = [self.feature, self.threshold, self.hijos, self.valor, self.raices]
+        arrays += [a for a in (self.faltantes_izq, self.valor_neg) if a is not None]
+        return sum(a.nbytes for a in arrays)
+
+    def validar(self):
+        """
+        Comprobar que los arrays describen árboles bien formados
+
+        Un artefacto puede llegar de otra máquina (servidor_trabajos): con hijos
+        fuera de su árbol o ciclos el recorrido daría basura o no terminaría.
+        Los hijos de un nodo interno van siempre después de él dentro del mismo
+        árbol (orden de construcción de sklearn) y las hojas apuntan a sí mismas.
+
+        Raises:
+            ValueError: Si la estructura no es válida
+        """
+
+        n_nodos = self.n_nodos
+        raices = np.asarray(self.raices, dtype=np.intp)
+        finales = np.append(raices[1:], n_nodos)
+
+        if (n_nodos == 0 or len(raices) == 0 or raices[0] != 0 or np.any(finales <= raices)
+                or len(self.threshold) != n_nodos or len(self.valor) != n_nodos
+                or len(self.hijos) != 2 * n_nodos
+                or (self.faltantes_izq is not None and len(self.faltantes_izq) != n_nodos)
+                or (self.valor_neg is not None and len(self.valor_neg) != n_nodos)):
+            raise ValueError("❌ Arrays de nodos con tamaños incoherentes")
+
+        for miembro in self.miembros:
+            if not 0 <= miembro['inicio'] < miembro['fin'] <= self.n_arboles:
+                raise ValueError(f"❌ Miembro con árboles fuera de rango: {miembro}")
+            if miembro['tipo'] == 'bosque' and self.valor_neg is None:
+                raise ValueError("❌ Falta valor_neg para los miembros de tipo bosque")
+
+        for inicio in range(0, n_nodos, NODOS_POR_VALIDACION):
+            fin = min(inicio + NODOS_POR_VALIDACION, n_nodos)
+            indices = np.arange(inicio, fin)
+            fin_arbol = finales[np.searchsorted(raices, indices, side='right') - 1]
+            hijos = np.asarray(self.hijos[2 * inicio:2 * fin], dtype=np.intp).reshape(-1, 2)
+            features = np.asarray(self.feature[inicio:fin])
+            es_hoja = np.isnan(self.threshold[inicio:fin])
+            internos = ~es_hoja
+
+            if (np.any(hijos[es_hoja] != indices[es_hoja, None])
+                    or np.any(hijos[internos] <= indices[internos, None])
+                    or np.any(hijos[internos] >= fin_arbol[internos, None])
+                    or np.any(features[internos] < 0) or np.any(features[internos] >= self.n_features)):
+                raise ValueError(f"❌ Estructura de árbol inválida en los nodos [{inicio}, {fin})")
+
+    def _hojas(self, Xf, n_filas, raices):
+        """Hoja de cada (árbol, fila) para un grupo de árboles -> array (len(raices) * n_filas,)"""
+
+        tk = np.take
+        n_elementos = len(raices) * n_filas
+
+        hojas = np.empty(n_elementos, dtype=np.intp)
+        activos = np.arange(n_elementos, dtype=np.intp)
+        inicio_fila = np.tile(np.arange(n_filas, dtype=np.intp) * self.n_features, len(raices))
+        nodos = np.repeat(np.asarray(raices, dtype=np.intp), n_filas)
+
+        # Buffers reutilizados en todos los niveles. mode='clip' evita que take()
+        # copie la salida para comprobar índices; validar() ya garantiza el rango
+        features = np.empty(n_elementos, dtype=self.feature.dtype)
+        indices = np.empty(n_elementos, dtype=np.intp)
+        x = np.empty(n_elementos, dtype=Xf.dtype)
+        t = np.empty(n_elementos, dtype=self.threshold.dtype)
+        ir_izq = np.empty(n_elementos, dtype=bool)
+        siguientes = np.empty(n_elementos, dtype=self.hijos.dtype)
+
+        while True:
+            m = len(nodos)
+            features_m, indices_m, x_m, t_m = features[:m], indices[:m], x[:m], t[:m]
+            ir_izq_m, siguientes_m = ir_izq[:m], siguientes[:m]
+
+            for _ in range(NIVELES_POR_COMPACTACION):
+                tk(self.feature, nodos, out=features_m, mode='clip')
+                np.add(features_m, inicio_fila, out=indices_m)
+                tk(Xf, indices_m, out=x_m, mode='clip')
+                tk(self.threshold, nodos, out=t_m, mode='clip')
+                np.less_equal(x_m, t_m, out=ir_izq_m)
+                if self.faltantes_izq is not None:
+                    ir_izq_m |= np.isnan(x_m) & tk(self.faltantes_izq, nodos, mode='clip')
+                np.multiply(nodos, 2, out=nodos)
+                np.add(nodos, ir_izq_m, out=nodos)
+                tk(self.hijos, nodos, out=siguientes_m, mode='clip')
+                nodos[:] = siguientes_m
+
+            tk(self.threshold, nodos, out=t_m, mode='clip')
+            es_hoja = np.isnan(t_m)
+            n_hojas = np.count_nonzero(es_hoja)
+
+            if n_hojas == m:
+                hojas[activos] = nodos
+                return hojas
+
+            # Compactar solo cuando sale una fracción apreciable del conjunto activo
+            if n_hojas * 4 > m:
+                fin = np.flatnonzero(es_hoja)
+                sigue = np.flatnonzero(~es_hoja)
+                hojas[tk(activos, fin)] = tk(nodos, fin)
+                activos, inicio_fila, nodos = tk(activos, sigue), tk(inicio_fila, sigue), tk(nodos, sigue)
+
+    def _proba_bloque(self, X):
+        """Probabilidades (n_filas, 2) para un bloque de filas"""
+
+        n_filas = X.shape[0]
+        Xf = X.ravel()
+        arboles_por_grupo = max(1, ELEMENTOS_POR_GRUPO // max(n_filas, 1))
+
+        proba = np.zeros((n_filas, 2))
+        for miembro in self.miembros:
+            bosque = miembro['tipo'] == 'bosque'
+            # Suma en el orden de los árboles, igual que sklearn (el boosting parte de su predicción inicial)
+            if bosque:
+                suma = np.zeros((n_filas, 2))
+            else:
+                suma = np.full(n_filas, miembro['base'])
+
+            for inicio in range(miembro['inicio'], miembro['fin'], arboles_por_grupo):
+                raices = self.raices[inicio:min(inicio + arboles_por_grupo, miembro['fin'])]
+                hojas = self._hojas(Xf, n_filas, raices).reshape(len(raices), n_filas)
+                for hojas_arbol in hojas:
+                    if bosque:
+                        suma[:, 0] += np.take(self.valor_neg, hojas_arbol)
+                        suma[:, 1] += np.take(self.valor, hojas_arbol)
+                    else:
+                        suma += np.take(self.valor, hojas_arbol)
+
+            if bosque:
+                proba_miembro = suma / (miembro['fin'] - miembro['inicio'])
+            else:
+                positiva = expit(suma)
+                proba_miembro = np.column_stack([1.0 - positiva, positiva])
+            proba += proba_miembro * miembro['peso']
+
+        return proba / sum(miembro['peso'] for miembro in self.miembros)
+
+    def predict_proba(self, X):
+        """Probabilidades (n_filas, 2), equivalentes a predict_proba de sklearn"""
+
+        # Mismo redondeo que sklearn, que convierte X a float32 antes de recorrer los árboles
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"❌ Se esperaban {self.n_features} features, llegaron {X.shape[-1]}")
+
+        n_jobs = self.n_jobs or os.cpu_count() or 1
+        n_bloques = max(1, min(n_jobs, X.shape[0] // FILAS_MIN_POR_THREAD))
+
+        if n_bloques == 1:
+            return self._proba_bloque(X)
+
+        # NumPy libera el GIL en take/ufuncs: los bloques de filas corren en paralelo
+        bloques = np.array_split(X, n_bloques)
+        with ThreadPoolExecutor(max_workers=n_bloques) as executor:
+            return np.concatenate(list(executor.map(self._proba_bloque, bloques)))
+
+    def predict(self, X):
+        """Clase con mayor probabilidad (igual que predict de sklearn)"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+# ================================
+# 🔧 COMPILACIÓN
+# ================================
+
+def _miembros_de(modelo, peso=1.0):
+    """Lista de (tipo, arboles, base, escala, peso) de un estimador sklearn ya entrenado"""
+
+    if isinstance(modelo, VotingClassifier):
+        if modelo.voting != 'soft':
+            raise ValueError("❌ Solo se puede compilar VotingClassifier con voting='soft'")
+        pesos = modelo.weights if modelo.weights is not None else [1.0] * len(modelo.estimators_)
+        pesos = np.asarray(pesos, dtype=float)
+        if peso != 1.0:
+            # Voting anidado: normalizar dentro del sub-ensemble y heredar el peso del padre
+            pesos = peso * pesos / np.sum(pesos)
+        miembros = []
+        for sub_modelo, sub_peso in zip(modelo.estimators_, pesos):
+            miembros.extend(_miembros_de(sub_modelo, float(sub_peso)))
+        return miembros
+
+    if isinstance(modelo, (RandomForestClassifier, ExtraTreesClassifier)):
+        _validar_binario(modelo)
+        return [('bosque', [est.tree_ for est in modelo.estimators_], 0.0, 1.0, peso)]
+
+    if isinstance(modelo, DecisionTreeClassifier):
+        _validar_binario(modelo)
+        return [('bosque', [modelo.tree_], 0.0, 1.0, peso)]
+
+    if isinstance(modelo, GradientBoostingClassifier):
+        _validar_binario(modelo)
+        if modelo.init not in (None, 'zero'):
+            raise ValueError("❌ GradientBoosting con estimador init propio no soportado")
+        if modelo.loss != 'log_loss':
+            raise ValueError("❌ Solo se soporta GradientBoosting con loss='log_loss'")
+        if modelo.init_ == 'zero':
+            base = 0.0
+        else:
+            # El init por defecto (prior) da la misma probabilidad para cualquier fila;
+            # mismo recorte y logit que sklearn para su predicción cruda inicial
+            prior = modelo.init_.predict_proba(np.zeros((1, modelo.n_features_in_)))[0, 1]
+            eps = np.finfo(np.float64).eps
+            base = float(logit(np.clip(prior, eps, 1 - eps)))
+        arboles = [est.tree_ for est in modelo.estimators_[:, 0]]
+        return [('boosting', arboles, base, modelo.learning_rate, peso)]
+
+    raise ValueError(f"❌ Modelo no compilable: {type(modelo).__name__} "
+                     "(soportados: RandomForest, ExtraTrees, GradientBoosting y VotingClassifier soft)")
+
+def _validar_binario(modelo):
+    if len(modelo.classes_) != 2 or getattr(modelo, 'n_outputs_', 1) != 1:
+        raise ValueError("❌ Solo se soportan clasificadores binarios de una salida")
+
+def _threshold_float32(threshold):
+    """Mayor float32 <= threshold: para x float32, x <= t32 equivale exactamente a x <= t64"""
+    t32 = threshold.astype(np.float32)
+    por_encima = t32.astype(np.float64) > threshold
+    t32[por_encima] = np.nextafter(t32[por_encima], np.float32(-np.inf))
+    return t32
+
+def compilar_modelo(modelo, n_jobs=None):
+    """
+    Compilar un modelo de árboles a arrays planos
+
+    Args:
+        modelo: RandomForest, ExtraTrees, GradientBoosting o VotingClassifier soft
+                entrenado, o un ModeloCoronario (se compila su modelo_entrenado)
+        n_jobs: Threads para la inferencia (None = todos los cores)
+
+    Returns:
+        ModeloCompilado
+    """
+
+    if hasattr(modelo, 'modelo_entrenado'):
+        modelo = modelo.modelo_entrenado
+
+    if modelo is None:
+        raise ValueError("❌ Modelo no entrenado")
+
+    features, thresholds, hijos, valores, valores_neg, faltantes, raices = [], [], [], [], [], [], []
+    miembros = []
+    offset = 0
+    n_arboles = 0
+
+    for tipo, arboles, base, escala, peso in _miembros_de(modelo):
+        inicio = n_arboles
+
+        for arbol in arboles:
+            es_hoja = arbol.children_left < 0
+            propio = np.arange(arbol.node_count) + offset
+
+            if tipo == 'bosque':
+                # Proporción (ponderada) de la clase positiva en la hoja, como predict_proba del árbol
+                conteos = arbol.value[:, 0, :]
+                total = conteos.sum(axis=1)
+                valor = conteos[:, 1] / total
+                valor_neg = conteos[:, 0] / total
+            else:
+                # Mismo producto que sklearn: learning_rate * valor de la hoja
+                valor = escala * arbol.value[:, 0, 0]
+                valor_neg = np.zeros(arbol.node_count)
+
+            hijos_arbol = np.empty(2 * arbol.node_count, dtype=np.int32)
+            hijos_arbol[0::2] = np.where(es_hoja, propio, arbol.children_right + offset)
+            hijos_arbol[1::2] = np.where(es_hoja, propio, arbol.children_left + offset)
+
+            features.append(np.where(es_hoja, 0, arbol.feature).astype(np.int32))
+            thresholds.append(np.where(es_hoja, np.nan, _threshold_float32(arbol.threshold)).astype(np.float32))
+            hijos.append(hijos_arbol)
+            valores.append(valor.astype(np.float64))
+            valores_neg.append(valor_neg.astype(np.float64))
+            if hasattr(arbol, 'missing_go_to_left'):
+                faltantes.append(np.asarray(arbol.missing_go_to_left, dtype=bool) & ~es_hoja)
+
+            raices.append(offset)
+            offset += arbol.node_count
+            n_arboles += 1
+
+        miembros.append({'tipo': tipo, 'inicio': inicio, 'fin': n_arboles, 'base': base, 'peso': peso})
+
+    faltantes_izq = None
+    if len(faltantes) == n_arboles and any(f.any() for f in faltantes):
+        faltantes_izq = np.concatenate(faltantes)
+
+    valor_neg = None
+    if any(miembro['tipo'] == 'bosque' for miembro in miembros):
+        valor_neg = np.concatenate(valores_neg)
+
+    return ModeloCompilado(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        hijos=np.concatenate(hijos),
+        valor=np.concatenate(valores),
+        raices=np.asarray(raices, dtype=np.int32),
+        miembros=miembros,
+        n_features=modelo.n_features_in_,
+        classes=np.asarray(modelo.classes_),
+        faltantes_izq=faltantes_izq,
+        valor_neg=valor_neg,
+        n_jobs=n_jobs
+    )
@@ -6,13 +6,13 @@
 import pandas as pd
 import numpy as np
 import json
-import pickle
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
 # Optimización
-from sklearn.model_selection import RandomizedSearchCV, GridSearchCV, StratifiedKFold
+from sklearn.model_selection import RandomizedSearchCV, GridSearchCV, StratifiedKFold, cross_val_score, train_test_split
+from sklearn.metrics import f1_score
 from sklearn.feature_selection import SelectKBest, f_classif, RFE
 from sklearn.preprocessing import PolynomialFeatures, StandardScaler
 from sklearn.calibration import CalibratedClassifierCV
@@ -47,17 +47,26 @@ except:
     IMBALANCED_AVAILABLE = False
 
 import automatizacion.calcularf1_score as calcularf1_score
+from automatizacion.registro_modelos import RegistroModelos
+from automatizacion.trazas import span, trazado, leer_csv
 
 class ModeloMejorado:
     """Sistema de mejora iterativa del modelo"""
     
-    def __init__(self, base_score=0.95):
+    def __init__(self, base_score=0.95, n_jobs=-1, factor_arboles=1.0):
         self.base_score = base_score
+        self.n_jobs = n_jobs
+        self.factor_arboles = factor_arboles
+        self.ejecucion = {}
         self.mejor_modelo = None
         self.mejor_score = base_score
         self.historial_mejoras = []
         self.configuraciones_probadas = []
         
+    def _arboles(self, n):
+        """Número de árboles escalado por factor_arboles (plan degradado por memoria)"""
+        return max(10, int(n * self.factor_arboles))
+    
     def log_experimento(self, nombre_estrategia, score, parametros, tiempo_entrenamiento):
         """Registrar experimento en historial"""
         
@@ -84,6 +93,7 @@ class ModeloMejorado:
             print(f"❌ {nombre_estrategia}: {score:.4f} (sin mejora)")
             return False
     
+    @trazado('mejora.hyperparameter_optimization')
     def hyperparameter_optimization(self, X, y):
         """Optimización de hiperparámetros con RandomizedSearch"""
         
@@ -97,7 +107,7 @@ class ModeloMejorado:
             'RandomForest': {
                 'modelo': RandomForestClassifier(random_state=42, class_weight='balanced'),
                 'params': {
-                    'n_estimators': [100, 200, 300, 500],
+                    'n_estimators': [self._arboles(n) for n in [100, 200, 300, 500]],
                     'max_depth': [10, 20, 30, None],
                     'min_samples_split': [2, 5, 10],
                     'min_samples_leaf': [1, 2, 4],
@@ -111,7 +121,7 @@ class ModeloMejorado:
             modelos_configs['XGBoost'] = {
                 'modelo': xgb.XGBClassifier(random_state=42, eval_metric='logloss'),
                 'params': {
-                    'n_estimators': [100, 200, 300],
+                    'n_estimators': [self._arboles(n) for n in [100, 200, 300]],
                     'max_depth': [3, 6, 10],
                     'learning_rate': [0.01, 0.1, 0.2],
                     'subsample': [0.8, 0.9, 1.0],
@@ -124,7 +134,7 @@ class ModeloMejorado:
             modelos_configs['LightGBM'] = {
                 'modelo': lgb.LGBMClassifier(random_state=42, class_weight='balanced'),
                 'params': {
-                    'n_estimators': [100, 200, 300],
+                    'n_estimators': [self._arboles(n) for n in [100, 200, 300]],
                     'max_depth': [3, 6, 10],
                     'learning_rate': [0.01, 0.1, 0.2],
                     'num_leaves': [31, 50, 100],
@@ -145,11 +155,12 @@ class ModeloMejorado:
                 n_iter=20,  # 20 combinaciones aleatorias
                 cv=StratifiedKFold(n_splits=3, shuffle=True, random_state=42),
                 scoring='f1',
-                n_jobs=-1,
+                n_jobs=self.n_jobs,
                 random_state=42
             )
             
-            search.fit(X, y)
+            with span('fit.busqueda', len(X), modelo=nombre_modelo):
+                search.fit(X, y)
             
             score = search.best_score_
             print(f"   Mejor score: {score:.4f}")
@@ -174,6 +185,7 @@ class ModeloMejorado:
         
         return mejor_modelo_local, mejor_score_local
     
+    @trazado('mejora.feature_engineering_avanzado')
     def feature_engineering_avanzado(self, X, y):
         """Feature engineering automático y selección de features"""
         
@@ -195,7 +207,7 @@ class ModeloMejorado:
             selector = SelectKBest(f_classif, k=500)
             X_poly = selector.fit_transform(X_poly, y)
         
-        X_poly_df = pd.DataFrame(X_poly, index=X.index)
+        X_poly_df = pd.DataFrame(X_poly, index=X.index).add_prefix('poly_')
         X_with_poly = pd.concat([X, X_poly_df], axis=1)
         
         score_poly = self._evaluar_features(X_with_poly, y, "Polynomial Features")
@@ -203,7 +215,7 @@ class ModeloMejorado:
         
         # 2. Selección de features con RFE
         print("🔄 Probando selección de features (RFE)...")
-        estimator = RandomForestClassifier(n_estimators=50, random_state=42, class_weight='balanced')
+        estimator = RandomForestClassifier(n_estimators=self._arboles(50), random_state=42, class_weight='balanced')
         
         # Probar diferentes números de features
         for n_features in [int(X.shape[1] * 0.5), int(X.shape[1] * 0.75), int(X.shape[1] * 0.9)]:
@@ -244,18 +256,20 @@ class ModeloMejorado:
         """Evaluar conjunto de features con validación cruzada"""
         
         modelo = RandomForestClassifier(
-            n_estimators=100, 
+            n_estimators=self._arboles(100), 
             random_state=42, 
             class_weight='balanced'
         )
         
         cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-        scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
+        with span('fit.cv', len(X), modelo=type(modelo).__name__):
+            scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
         score_promedio = scores.mean()
         
         print(f"   {nombre_estrategia}: {score_promedio:.4f}")
         return score_promedio
     
+    @trazado('mejora.ensemble_avanzado')
     def ensemble_avanzado(self, X, y):
         """Crear ensemble sofisticado con múltiples niveles"""
         
@@ -266,9 +280,9 @@ class ModeloMejorado:
         
         # Modelos base diversos
         modelos_base = [
-            ('rf', RandomForestClassifier(n_estimators=200, random_state=42, class_weight='balanced')),
-            ('et', ExtraTreesClassifier(n_estimators=200, random_state=42, class_weight='balanced')),
-            ('gb', GradientBoostingClassifier(n_estimators=100, random_state=42)),
+            ('rf', RandomForestClassifier(n_estimators=self._arboles(200), random_state=42, class_weight='balanced')),
+            ('et', ExtraTreesClassifier(n_estimators=self._arboles(200), random_state=42, class_weight='balanced')),
+            ('gb', GradientBoostingClassifier(n_estimators=self._arboles(100), random_state=42)),
             ('lr', LogisticRegression(class_weight='balanced', random_state=42, max_iter=1000))
         ]
         
@@ -303,9 +317,9 @@ class ModeloMejorado:
         for nombre, modelo in modelos_base[:3]:  # Solo los primeros 3 por eficiencia
             bagging_clf = BaggingClassifier(
                 modelo, 
-                n_estimators=10, 
+                n_estimators=max(2, int(10 * self.factor_arboles)), 
                 random_state=42,
-                n_jobs=-1
+                n_jobs=self.n_jobs
             )
             score_bagging = self._evaluar_modelo(bagging_clf, X, y)
             mejores_ensembles.append((f'bagging_{nombre}', score_bagging, bagging_clf))
@@ -331,9 +345,11 @@ class ModeloMejorado:
         """Evaluar modelo con validación cruzada"""
         
         cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-        scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
+        with span('fit.cv', len(X), modelo=type(modelo).__name__):
+            scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
         return scores.mean()
     
+    @trazado('mejora.balanceado_datos_avanzado')
     def balanceado_datos_avanzado(self, X, y):
         """Técnicas avanzadas para manejar desbalance"""
         
@@ -406,18 +422,20 @@ class ModeloMejorado:
         """Evaluar datos balanceados"""
         
         modelo = RandomForestClassifier(
-            n_estimators=50, 
+            n_estimators=self._arboles(50), 
             random_state=42, 
             class_weight='balanced'
         )
         
         cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-        scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
+        with span('fit.cv', len(X), modelo=type(modelo).__name__):
+            scores = cross_val_score(modelo, X, y, cv=cv, scoring='f1')
         score_promedio = scores.mean()
         
         print(f"   Score: {score_promedio:.4f}")
         return score_promedio
     
+    @trazado('mejora.threshold_optimization_avanzado')
     def threshold_optimization_avanzado(self, modelo, X, y):
         """Optimización avanzada de threshold"""
         
@@ -538,7 +556,8 @@ class ModeloMejorado:
             'mejora_total': self.mejor_score - self.base_score,
             'timestamp': datetime.now().isoformat(),
             'historial_mejoras': self.historial_mejoras,
-            'configuraciones_probadas': self.configuraciones_probadas
+            'configuraciones_probadas': self.configuraciones_probadas,
+            'ejecucion': self.ejecucion
         }
         
         with open(filename, 'w') as f:
@@ -552,13 +571,19 @@ class ModeloMejorado:
 # 🎮 FUNCIONES PRINCIPALES
 # ================================
 
-def mejorar_modelo_automatico(archivo_train='train.csv', score_base=None):
+def mejorar_modelo_automatico(archivo_train='train.csv', score_base=None, n_jobs=-1, fraccion_muestra=1.0,
+                              float32=False, factor_arboles=1.0, degradacion=None):
     """
     Función principal para mejorar modelo automáticamente
     
     Args:
         archivo_train: Archivo de entrenamiento
         score_base: Score base a superar (se calcula automáticamente si es None)
+        n_jobs: Workers de las búsquedas y ensembles en paralelo (-1 = todos los cores)
+        fraccion_muestra: Fracción estratificada del dataset a usar (1.0 = todo)
+        float32: Convertir las features numéricas a float32 (la mitad de memoria)
+        factor_arboles: Escala del número de árboles de todos los modelos
+        degradacion: Intentos previos fallidos por memoria (se guardan en el historial)
     
     Returns:
         tuple: (mejor_modelo, mejor_score, historial_mejoras)
@@ -568,7 +593,7 @@ def mejorar_modelo_automatico(archivo_train='train.csv', score_base=None):
     print("="*50)
     
     # Cargar datos
-    df = pd.read_csv(archivo_train)
+    df = leer_csv(archivo_train)
     print(f"📊 Dataset cargado: {df.shape}")
     
     # Preparar datos (usando función de calcularf1_score)
@@ -579,16 +604,32 @@ def mejorar_modelo_automatico(archivo_train='train.csv', score_base=None):
     
     X, y = modelo_base.preparar_para_ml(df_features, es_entrenamiento=True)
     
+    # Submuestreo estratificado cuando el presupuesto de memoria no da para todo
+    if fraccion_muestra < 1.0:
+        X, _, y, _ = train_test_split(X, y, train_size=fraccion_muestra, stratify=y, random_state=42)
+        print(f"✂️ Submuestreo al {fraccion_muestra:.0%}: {X.shape}")
+    
+    if float32:
+        X = X.astype({col: np.float32 for col in X.select_dtypes(include=[np.number]).columns})
+    
     # Calcular score base si no se proporciona
     if score_base is None:
         modelo_baseline = RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=42)
         cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-        scores_base = cross_val_score(modelo_baseline, X, y, cv=cv, scoring='f1')
+        with span('fit.cv', len(X), modelo='baseline'):
+            scores_base = cross_val_score(modelo_baseline, X, y, cv=cv, scoring='f1')
         score_base = scores_base.mean()
         print(f"🎯 Score base calculado: {score_base:.4f}")
     
     # Crear sistema de mejora
-    sistema_mejora = ModeloMejorado(base_score=score_base)
+    sistema_mejora = ModeloMejorado(base_score=score_base, n_jobs=n_jobs, factor_arboles=factor_arboles)
+    sistema_mejora.ejecucion = {
+        'n_jobs': n_jobs,
+        'fraccion_muestra': fraccion_muestra,
+        'float32': float32,
+        'factor_arboles': factor_arboles,
+        'degradacion': degradacion or []
+    }
     
     # Ejecutar todas las estrategias
     mejor_modelo, mejor_score = sistema_mejora.ejecutar_todas_estrategias(X, y)
@@ -615,6 +656,7 @@ def mejora_continua_programada(archivo_train='train.csv', intervalo_horas=6, max
     
     mejor_score_global = 0
     iteracion = 0
+    registro = RegistroModelos()
     
     while iteracion < max_iteraciones:
         print(f"\n🚀 ITERACIÓN {iteracion + 1}/{max_iteraciones}")
@@ -628,14 +670,15 @@ def mejora_continua_programada(archivo_train='train.csv', intervalo_horas=6, max
             if score > mejor_score_global:
                 mejor_score_global = score
                 
-                # Guardar mejor modelo
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                modelo_filename = f'mejor_modelo_{timestamp}.pkl'
-                
-                with open(modelo_filename, 'wb') as f:
-                    pickle.dump(modelo, f)
+                # Registrar mejor modelo (estimador sobre features preparadas: sin huella
+                # de datos, entrenar_o_reutilizar no debe devolverlo como ModeloCoronario)
+                modelo_hash = registro.registrar(
+                    modelo, 'mejora_continua',
+                    f1_cv=score,
+                    metadatos=dict(historial[-1] if historial else {}, archivo_train=archivo_train)
+                )
                 
-                print(f"💾 Mejor modelo guardado: {modelo_filename}")
+                print(f"💾 Mejor modelo guardado: {registro.ruta(modelo_hash)}")
                 print(f"🏆 Nuevo mejor score: {score:.4f}")
             
             iteracion += 1
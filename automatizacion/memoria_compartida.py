@@ -0,0 +1,104 @@
+# ================================
+# 🧠 DATAFRAMES EN MEMORIA COMPARTIDA
+# ================================
+# Un DataFrame se publica una vez como bloque de shared memory (columnas numéricas
+# tal cual, columnas de texto como códigos + categorías) y los procesos worker lo
+# reconstruyen sin volver a leer ni parsear el CSV
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+ALINEACION = 8
+
+class DataFramePublicado:
+    """
+    DataFrame publicado en shared memory por el proceso padre
+
+    `descriptor` es un dict pequeño y picklable que se pasa a los workers
+    (leer_dataframe). El padre debe llamar a `liberar()` cuando terminen.
+    """
+
+    def __init__(self, df):
+        columnas = []
+        arrays = []
+        offset = 0
+
+        for col in df.columns:
+            serie = df[col]
+            if serie.dtype.kind in 'biuf':
+                valores = np.ascontiguousarray(serie.to_numpy())
+                categorias = None
+            else:
+                # Texto/objetos: códigos int32 (-1 = nulo) + categorías (pocas, van en el descriptor)
+                codigos, categorias = pd.factorize(serie, use_na_sentinel=True)
+                valores = codigos.astype(np.int32)
+                categorias = categorias.tolist()
+
+            columnas.append({
+                'nombre': col,
+                'dtype': valores.dtype.str,
+                'offset': offset,
+                'categorias': categorias
+            })
+            arrays.append(valores)
+            offset += -(-valores.nbytes // ALINEACION) * ALINEACION
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for info, valores in zip(columnas, arrays):
+            destino = np.ndarray(valores.shape, dtype=valores.dtype, buffer=self.shm.buf, offset=info['offset'])
+            destino[:] = valores
+            del destino
+
+        self.descriptor = {
+            'nombre_shm': self.shm.name,
+            'filas': len(df),
+            'columnas': columnas
+        }
+
+    def liberar(self):
+        """Cerrar y eliminar el bloque de shared memory"""
+
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.liberar()
+
+def leer_dataframe(descriptor):
+    """
+    Reconstruir en un worker un DataFrame publicado con DataFramePublicado
+
+    Args:
+        descriptor (dict): DataFramePublicado.descriptor
+
+    Returns:
+        pd.DataFrame: Copia local (el bloque compartido se cierra al terminar)
+    """
+
+    # Los workers de multiprocessing comparten el resource tracker del padre,
+    # así que abrir el bloque aquí no hace que se borre al terminar el worker
+    shm = shared_memory.SharedMemory(name=descriptor['nombre_shm'])
+
+    try:
+        datos = {}
+        for info in descriptor['columnas']:
+            vista = np.ndarray(
+                descriptor['filas'], dtype=np.dtype(info['dtype']), buffer=shm.buf, offset=info['offset']
+            )
+            if info['categorias'] is None:
+                datos[info['nombre']] = vista.copy()
+            else:
+                categorias = np.asarray(info['categorias'] + [np.nan], dtype=object)
+                datos[info['nombre']] = categorias[vista]    # -1 -> último elemento (nulo)
+            del vista
+
+        return pd.DataFrame(datos)
+    finally:
+        shm.close()
@@ -0,0 +1,156 @@
+# ================================
+# 🧮 MEZCLA DE PREDICCIONES ALINEADAS POR ID
+# ================================
+# Une cualquier número de fuentes por un índice entero ordenado (searchsorted),
+# aplica pesos vectorizados y reoptimiza el threshold sobre la mezcla
+
+import numpy as np
+import pandas as pd
+
+def _columna(fuente):
+    """(ids int64 ordenados, probabilidades float64) de un DataFrame o de una tupla (ids, proba)"""
+
+    if isinstance(fuente, pd.DataFrame):
+        ids = fuente['ID'].to_numpy()
+        valores = fuente['Probabilidad'].to_numpy()
+    else:
+        ids, valores = fuente
+
+    ids = np.asarray(ids, dtype=np.int64)
+    valores = np.asarray(valores, dtype=np.float64)
+
+    if len(ids) > 1 and not np.all(ids[1:] > ids[:-1]):
+        orden = np.argsort(ids)
+        ids, valores = ids[orden], valores[orden]
+        if np.any(ids[1:] == ids[:-1]):
+            raise ValueError("❌ IDs duplicados en una fuente de predicciones")
+
+    return ids, valores
+
+def _posiciones(ids, ids_objetivo):
+    """Posición de cada ids_objetivo en ids (ordenado) y máscara de los que existen"""
+
+    if len(ids) == len(ids_objetivo) and np.array_equal(ids, ids_objetivo):
+        return np.arange(len(ids)), np.ones(len(ids), dtype=bool)
+
+    if len(ids) == 0:
+        return np.zeros(len(ids_objetivo), dtype=np.int64), np.zeros(len(ids_objetivo), dtype=bool)
+
+    pos = np.minimum(np.searchsorted(ids, ids_objetivo), len(ids) - 1)
+    return pos, ids[pos] == ids_objetivo
+
+def alinear(fuentes):
+    """
+    Alinear varias fuentes de predicciones por ID (inner join)
+
+    Args:
+        fuentes (list): DataFrames con 'ID' y 'Probabilidad', o tuplas (ids, proba)
+
+    Returns:
+        tuple: (ids comunes ordenados, matriz (n_ids, n_fuentes) de probabilidades)
+    """
+
+    columnas = [_columna(fuente) for fuente in fuentes]
+    if not columnas:
+        raise ValueError("❌ No hay fuentes que alinear")
+
+    # IDs presentes en todas las fuentes
+    ids = columnas[0][0]
+    for ids_fuente, _ in columnas[1:]:
+        ids = ids[_posiciones(ids_fuente, ids)[1]]
+
+    matriz = np.empty((len(ids), len(columnas)), dtype=np.float64)
+    for j, (ids_fuente, valores) in enumerate(columnas):
+        matriz[:, j] = valores[_posiciones(ids_fuente, ids)[0]]
+
+    return ids, matriz
+
+def optimizar_threshold(y, proba):
+    """
+    Threshold que maximiza F1, exacto sobre todos los cortes posibles
+
+    Ordena una vez y calcula TP acumulados: O(n log n) en lugar de un
+    f1_score por cada threshold candidato.
+
+    Returns:
+        tuple: (threshold, f1)
+    """
+
+    y = np.asarray(y, dtype=np.int64)
+    proba = np.asarray(proba, dtype=np.float64)
+    validas = np.isfinite(proba)
+    y, proba = y[validas], proba[validas]
+
+    positivos = y.sum()
+    if len(y) == 0 or positivos == 0:
+        return 0.5, 0.0
+
+    orden = np.argsort(-proba, kind='stable')
+    proba_ordenada = proba[orden]
+    tp = np.cumsum(y[orden])
+
+    # Solo se puede cortar al final de cada grupo de probabilidades iguales
+    fin_grupo = np.r_[proba_ordenada[1:] != proba_ordenada[:-1], True]
+    predichos = np.arange(1, len(y) + 1)
+    f1 = np.where(fin_grupo, 2 * tp / (predichos + positivos), -1.0)
+
+    mejor = int(np.argmax(f1))
+    return float(proba_ordenada[mejor]), float(f1[mejor])
+
+def mezclar(fuentes, pesos=None, etiquetas=None, threshold=None):
+    """
+    Mezcla ponderada de fuentes de predicciones alineadas por ID
+
+    Args:
+        fuentes (list): DataFrames con 'ID' y 'Probabilidad', o tuplas (ids, proba)
+        pesos (list): Peso de cada fuente (se normalizan; por defecto iguales)
+        etiquetas: DataFrame con 'ID' y 'Condición' (o tupla (ids, y)) para
+            reoptimizar el threshold sobre la mezcla y calcular su F1
+        threshold (float): Threshold fijo (p.ej. el optimizado en public al mezclar private)
+
+    Returns:
+        dict: predicciones (DataFrame ID/Condición/Probabilidad), threshold, f1, pesos,
+              filas, filas_descartadas
+    """
+
+    ids, matriz = alinear(fuentes)
+
+    pesos = np.ones(matriz.shape[1]) if pesos is None else np.asarray(pesos, dtype=np.float64)
+    if len(pesos) != matriz.shape[1]:
+        raise ValueError(f"❌ {len(pesos)} pesos para {matriz.shape[1]} fuentes")
+    pesos = pesos / pesos.sum()
+
+    proba = matriz @ pesos
+
+    f1 = None
+    if etiquetas is not None:
+        if isinstance(etiquetas, pd.DataFrame):
+            etiquetas = (etiquetas['ID'].to_numpy(), etiquetas['Condición'].to_numpy())
+        ids_y, y = _columna(etiquetas)
+        pos, existe = _posiciones(ids_y, ids)
+        y_alineada = y[pos[existe]].astype(np.int64)
+
+        if threshold is None:
+            threshold, f1 = optimizar_threshold(y_alineada, proba[existe])
+        else:
+            prediccion = proba[existe] >= threshold
+            tp = np.sum(prediccion & (y_alineada == 1))
+            f1 = float(2 * tp / max(prediccion.sum() + y_alineada.sum(), 1))
+
+    if threshold is None:
+        threshold = 0.5
+
+    filas_fuentes = max(len(fuente) if isinstance(fuente, pd.DataFrame) else len(fuente[0]) for fuente in fuentes)
+
+    return {
+        'predicciones': pd.DataFrame({
+            'ID': ids,
+            'Condición': (proba >= threshold).astype(int),
+            'Probabilidad': proba
+        }),
+        'threshold': float(threshold),
+        'f1': f1,
+        'pesos': pesos.tolist(),
+        'filas': len(ids),
+        'filas_descartadas': filas_fuentes - len(ids)
+    }
@@ -0,0 +1,333 @@
+# ================================
+# 🗂️ REGISTRO DE MODELOS VERSIONADO
+# ================================
+# Artefactos direccionados por contenido (sha256) + metadatos en SQLite
+# + pool LRU en memoria de modelos ya cargados
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+import automatizacion.calcularf1_score as calcularf1_score
+from automatizacion.artefactos_modelo import (
+    ARCHIVO_CABECERA, guardar_artefacto, cargar_artefacto, leer_cabecera
+)
+from automatizacion.base_datos import ConexionSQLite
+
+DIRECTORIO_REGISTRO = 'models_registry'
+CAPACIDAD_POOL = 4
+
+# Filas usadas para medir la latencia de inferencia al registrar
+FILAS_MEDICION_LATENCIA = 1000
+
+def huella_datos(df):
+    """Huella sha256 de un dataset (misma que se guarda para un ModeloCoronario entrenado con él)"""
+    huellas = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha256(huellas.tobytes()).hexdigest()
+
+def _hash_artefacto(ruta):
+    """sha256 del contenido del artefacto (ignora fecha y metadatos de la cabecera)"""
+
+    sha = hashlib.sha256()
+    cabecera = leer_cabecera(ruta)
+    cabecera.pop('fecha', None)
+    cabecera.pop('metadatos', None)
+    sha.update(json.dumps(cabecera, sort_keys=True).encode('utf-8'))
+
+    for nombre in sorted(os.listdir(ruta)):
+        if nombre == ARCHIVO_CABECERA:
+            continue
+        sha.update(nombre.encode('utf-8'))
+        with open(os.path.join(ruta, nombre), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+
+    return sha.hexdigest()
+
+class RegistroModelos:
+    """
+    Registro de modelos por hash de contenido
+
+    Estructura en disco:
+      <directorio>/registro.db              metadatos y versiones (SQLite)
+      <directorio>/objetos/<hash[:2]>/<hash>  artefactos (ver artefactos_modelo)
+
+    Registrar dos veces el mismo modelo no duplica el artefacto, solo añade versión.
+    Los metadatos van por ConexionSQLite (WAL, una conexión por thread).
+    """
+
+    def __init__(self, directorio=DIRECTORIO_REGISTRO, capacidad_pool=CAPACIDAD_POOL):
+        self.directorio = directorio
+        self.capacidad_pool = capacidad_pool
+        self.db_path = os.path.join(directorio, 'registro.db')
+
+        self._pool = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(directorio, 'objetos'), exist_ok=True)
+        self.db = ConexionSQLite.compartida(self.db_path)
+        self.init_database()
+
+    def init_database(self):
+        """Crear tablas del registro"""
+
+        with self.db.transaccion() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS modelos (
+                    hash TEXT PRIMARY KEY,
+                    tipo TEXT,
+                    f1_cv REAL,
+                    f1_entrenamiento REAL,
+                    threshold REAL,
+                    huella_datos TEXT,
+                    tiempo_entrenamiento REAL,
+                    latencia_ms REAL,
+                    fecha_registro TEXT,
+                    metadatos TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS versiones (
+                    nombre TEXT,
+                    version INTEGER,
+                    hash TEXT REFERENCES modelos(hash),
+                    fecha TEXT,
+                    PRIMARY KEY (nombre, version)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_modelos_huella ON modelos(huella_datos)')
+
+    def ruta(self, modelo_hash):
+        """Directorio del artefacto de un hash"""
+        return os.path.join(self.directorio, 'objetos', modelo_hash[:2], modelo_hash)
+
+    def registrar(self, modelo, nombre, f1_cv=None, huella=None, tiempo_entrenamiento=None,
+                  latencia_ms=None, metadatos=None, incremental=False):
+        """
+        Registrar un modelo como nueva versión de `nombre`
+
+        Args:
+            modelo: ModeloCoronario o estimador sklearn entrenado
+            nombre (str): Nombre lógico (p.ej. 'auto_training', 'local', 'colab')
+            f1_cv (float): F1 de validación cruzada u holdout
+            huella (str): Huella de los datos de entrenamiento (se deduce de un ModeloCoronario).
+                Solo se guarda para ModeloCoronario: un estimador suelto se entrena con
+                features ya preparadas (o una muestra) y no sirve para entrenar_o_reutilizar
+            tiempo_entrenamiento (float): Segundos de entrenamiento
+            latencia_ms (float): Latencia de inferencia por cada 1000 filas
+            metadatos (dict): Información adicional
+            incremental (bool): Guardar también el estado para entrenar_incremental
+                (ver guardar_artefacto)
+
+        Returns:
+            str: Hash del modelo
+        """
+
+        es_coronario = isinstance(modelo, calcularf1_score.ModeloCoronario)
+        if not es_coronario:
+            huella = None
+        elif huella is None and modelo.huellas_train is not None:
+            huella = hashlib.sha256(modelo.huellas_train.tobytes()).hexdigest()
+
+        # Guardar en temporal, hashear el contenido y mover a su sitio
+        objetos = os.path.join(self.directorio, 'objetos')
+        tmp = os.path.join(tempfile.mkdtemp(prefix='.registro_', dir=objetos), 'artefacto')
+        try:
+            guardar_artefacto(modelo, tmp, metadatos=metadatos, incremental=incremental)
+            modelo_hash = _hash_artefacto(tmp)
+            destino = self.ruta(modelo_hash)
+            if not os.path.exists(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(tmp, destino)
+        finally:
+            shutil.rmtree(os.path.dirname(tmp), ignore_errors=True)
+
+        cabecera = leer_cabecera(self.ruta(modelo_hash))
+        fecha = datetime.now().isoformat()
+
+        # Una transacción (BEGIN IMMEDIATE): dos procesos no pueden tomar el mismo número de versión
+        with self.db.transaccion() as conn:
+            conn.execute('''
+                INSERT INTO modelos (hash, tipo, f1_cv, f1_entrenamiento, threshold, huella_datos,
+                                     tiempo_entrenamiento, latencia_ms, fecha_registro, metadatos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET
+                    f1_cv = COALESCE(excluded.f1_cv, f1_cv),
+                    huella_datos = COALESCE(excluded.huella_datos, huella_datos),
+                    tiempo_entrenamiento = COALESCE(excluded.tiempo_entrenamiento, tiempo_entrenamiento),
+                    latencia_ms = COALESCE(excluded.latencia_ms, latencia_ms)
+            ''', (
+                modelo_hash,
+                cabecera['modelo']['tipo'],
+                f1_cv,
+                cabecera.get('f1_entrenamiento'),
+                cabecera.get('threshold_optimo'),
+                huella,
+                tiempo_entrenamiento,
+                latencia_ms,
+                fecha,
+                json.dumps(metadatos or {}, default=str)
+            ))
+
+            version = conn.execute(
+                'SELECT COALESCE(MAX(version), 0) + 1 FROM versiones WHERE nombre = ?', (nombre,)
+            ).fetchone()[0]
+            conn.execute(
+                'INSERT INTO versiones (nombre, version, hash, fecha) VALUES (?, ?, ?, ?)',
+                (nombre, version, modelo_hash, fecha)
+            )
+
+        print(f"🗂️ Modelo registrado: {nombre} v{version} ({modelo_hash[:12]})")
+
+        return modelo_hash
+
+    def resolver(self, nombre=None, version=None, modelo_hash=None):
+        """Hash de un modelo por hash, por nombre+versión o por nombre (última versión)"""
+
+        if modelo_hash is not None:
+            return modelo_hash
+
+        if version is None:
+            fila = self.db.consultar_uno(
+                'SELECT hash FROM versiones WHERE nombre = ? ORDER BY version DESC LIMIT 1', (nombre,)
+            )
+        else:
+            fila = self.db.consultar_uno(
+                'SELECT hash FROM versiones WHERE nombre = ? AND version = ?', (nombre, version)
+            )
+
+        if fila is None:
+            raise KeyError(f"❌ Modelo no registrado: {nombre} v{version or 'última'}")
+
+        return fila[0]
+
+    def obtener(self, nombre=None, version=None, modelo_hash=None, incremental=False):
+        """
+        Modelo cargado, servido desde el pool LRU si ya está en memoria
+
+        Args:
+            incremental (bool): Cargar con el estado para entrenar_incremental. Ese
+                modelo se modifica al actualizarlo: se devuelve una copia propia, sin pool
+
+        Returns:
+            ModeloCoronario o estimador (ver cargar_artefacto)
+        """
+
+        modelo_hash = self.resolver(nombre, version, modelo_hash)
+
+        if incremental:
+            return cargar_artefacto(self.ruta(modelo_hash), incremental=True)
+
+        with self._lock:
+            if modelo_hash in self._pool:
+                self._pool.move_to_end(modelo_hash)
+                return self._pool[modelo_hash]
+
+        modelo = cargar_artefacto(self.ruta(modelo_hash))
+
+        with self._lock:
+            self._pool[modelo_hash] = modelo
+            self._pool.move_to_end(modelo_hash)
+            while len(self._pool) > self.capacidad_pool:
+                self._pool.popitem(last=False)
+
+        return modelo
+
+    def buscar_por_huella(self, huella):
+        """Hash del modelo más reciente entrenado con los datos de esa huella (o None)"""
+
+        fila = self.db.consultar_uno(
+            'SELECT hash FROM modelos WHERE huella_datos = ? ORDER BY fecha_registro DESC LIMIT 1',
+            (huella,)
+        )
+
+        return fila[0] if fila else None
+
+    def mejor(self, nombre=None, metrica='f1_cv'):
+        """Hash del modelo con mayor valor de la métrica (opcionalmente solo de un nombre)"""
+
+        if metrica not in ('f1_cv', 'f1_entrenamiento'):
+            raise ValueError(f"❌ Métrica no soportada: {metrica}")
+
+        consulta = 'SELECT m.hash FROM modelos m'
+        parametros = ()
+        if nombre is not None:
+            consulta += ' JOIN versiones v ON v.hash = m.hash WHERE v.nombre = ?'
+            parametros = (nombre,)
+        consulta += f' ORDER BY m.{metrica} IS NULL, m.{metrica} DESC LIMIT 1'
+
+        fila = self.db.consultar_uno(consulta, parametros)
+
+        return fila[0] if fila else None
+
+    def listar(self, nombre=None):
+        """Versiones registradas con sus metadatos"""
+
+        consulta = '''
+            SELECT v.nombre, v.version, m.* FROM versiones v JOIN modelos m ON m.hash = v.hash
+        '''
+        parametros = ()
+        if nombre is not None:
+            consulta += ' WHERE v.nombre = ?'
+            parametros = (nombre,)
+        consulta += ' ORDER BY v.nombre, v.version'
+
+        cursor = self.db.ejecutar(consulta, parametros)
+        columnas = [descripcion[0] for descripcion in cursor.description]
+        return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+    def actualizar_latencia(self, modelo_hash, latencia_ms):
+        self.db.ejecutar('UPDATE modelos SET latencia_ms = ? WHERE hash = ?', (latencia_ms, modelo_hash))
+
+    def entrenar_o_reutilizar(self, archivo_train, nombre):
+        """
+        ModeloCoronario para un archivo de entrenamiento, reutilizando el registrado
+        si ya existe uno entrenado con exactamente esos datos
+
+        Returns:
+            tuple: (modelo, hash)
+        """
+
+        df_train = pd.read_csv(archivo_train)
+        huella = huella_datos(df_train)
+
+        modelo_hash = self.buscar_por_huella(huella)
+        if modelo_hash is not None:
+            modelo = self.obtener(modelo_hash=modelo_hash)
+            # Registros antiguos pueden tener huella en estimadores sueltos: no sirven aquí
+            if isinstance(modelo, calcularf1_score.ModeloCoronario):
+                print(f"♻️ Reutilizando modelo registrado para {archivo_train} ({modelo_hash[:12]})")
+                return modelo, modelo_hash
+
+        inicio = time.perf_counter()
+        modelo = calcularf1_score.entrenar_modelo_completo(archivo_train)
+        tiempo_entrenamiento = time.perf_counter() - inicio
+
+        # Latencia por cada 1000 filas
+        muestra = df_train.head(FILAS_MEDICION_LATENCIA)
+        inicio = time.perf_counter()
+        modelo.predecir_lote({'muestra': muestra}, calcular_f1=False, verbose=False)
+        latencia_ms = (time.perf_counter() - inicio) * 1000 * FILAS_MEDICION_LATENCIA / max(len(muestra), 1)
+
+        modelo_hash = self.registrar(
+            modelo, nombre,
+            huella=huella,
+            tiempo_entrenamiento=tiempo_entrenamiento,
+            latencia_ms=latencia_ms,
+            metadatos={'archivo_train': archivo_train}
+        )
+
+        with self._lock:
+            self._pool[modelo_hash] = modelo
+            while len(self._pool) > self.capacidad_pool:
+                self._pool.popitem(last=False)
+
+        return modelo, modelo_hash
@@ -0,0 +1,374 @@
+# ================================
+# 🛰️ SERVIDOR LOCAL DE PREDICCIONES CON MICRO-BATCHING
+# ================================
+# Mantiene modelos ModeloCoronario cargados en memoria y agrupa las peticiones
+# concurrentes en micro-lotes antes de preprocesar e inferir
+
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+
+import numpy as np
+import pandas as pd
+
+from automatizacion.registro_modelos import RegistroModelos
+
+HOST = '127.0.0.1'
+PUERTO = 8765
+MAX_LOTE = 512          # Filas máximas por micro-lote
+MAX_ESPERA_MS = 5       # Espera máxima para completar un micro-lote
+
+# Latencias recientes usadas para los percentiles
+VENTANA_LATENCIAS = 10000
+
+class _Peticion:
+    """Registros de una petición pendiente de ser incluidos en un micro-lote"""
+
+    def __init__(self, df):
+        self.df = df
+        self.resultado = None
+        self.error = None
+        self.evento = threading.Event()
+
+class Estadisticas:
+    """Latencia (p50/p99) y throughput del servidor"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.inicio = time.monotonic()
+            self.latencias_ms = deque(maxlen=VENTANA_LATENCIAS)
+            self.peticiones = 0
+            self.filas = 0
+            self.lotes = 0
+            self.errores = 0
+
+    def registrar_peticion(self, latencia_ms, filas, error=False):
+        with self._lock:
+            self.latencias_ms.append(latencia_ms)
+            self.peticiones += 1
+            self.filas += filas
+            self.errores += int(error)
+
+    def registrar_lote(self):
+        with self._lock:
+            self.lotes += 1
+
+    def resumen(self):
+        with self._lock:
+            duracion = max(time.monotonic() - self.inicio, 1e-9)
+            latencias = np.asarray(self.latencias_ms)
+            return {
+                'peticiones': self.peticiones,
+                'filas': self.filas,
+                'lotes': self.lotes,
+                'errores': self.errores,
+                'filas_por_lote': self.filas / self.lotes if self.lotes else 0.0,
+                'p50_ms': float(np.percentile(latencias, 50)) if len(latencias) else None,
+                'p99_ms': float(np.percentile(latencias, 99)) if len(latencias) else None,
+                'peticiones_por_s': self.peticiones / duracion,
+                'filas_por_s': self.filas / duracion
+            }
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes para un modelo
+
+    Un thread consume la cola: toma la primera petición pendiente y sigue
+    añadiendo hasta MAX_LOTE filas o hasta que pasan MAX_ESPERA_MS. El lote
+    completo se preprocesa e infiere de una vez y se reparte por petición.
+
+    El resultado de una petición no depende de sus compañeras de lote: la
+    imputación usa los valores aprendidos en el entrenamiento y cada petición
+    se valida por separado antes de entrar en la cola. Si aun así falla el
+    lote, se reprocesa petición a petición y solo fallan las que fallen solas.
+    """
+
+    def __init__(self, modelo, estadisticas, max_lote=MAX_LOTE, max_espera_ms=MAX_ESPERA_MS):
+        self.modelo = modelo
+        self.estadisticas = estadisticas
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+
+        self.cola = queue.Queue()
+        self.thread = threading.Thread(target=self._bucle, daemon=True)
+        self.thread.start()
+
+    def predecir(self, df):
+        """Encolar registros y esperar su resultado (bloqueante)"""
+
+        # Validar aquí, en el thread de la petición: un registro malformado
+        # falla solo su petición y no llega a mezclarse con otras
+        peticion = _Peticion(self.modelo.validar_registros(df))
+        self.cola.put(peticion)
+        peticion.evento.wait()
+
+        if peticion.error is not None:
+            raise peticion.error
+        return peticion.resultado
+
+    def detener(self):
+        self.cola.put(None)
+        self.thread.join()
+
+    def _bucle(self):
+        while True:
+            primera = self.cola.get()
+            if primera is None:
+                return
+
+            lote = [primera]
+            filas = len(primera.df)
+            limite = time.monotonic() + self.max_espera
+            fin = False
+
+            while filas < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    peticion = self.cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if peticion is None:
+                    fin = True
+                    break
+                lote.append(peticion)
+                filas += len(peticion.df)
+
+            self._procesar(lote)
+            if fin:
+                return
+
+    def _predecir(self, df):
+        resultados, _ = self.modelo.predecir_lote({'lote': df}, calcular_f1=False, verbose=False)['lote']
+        return resultados
+
+    def _procesar(self, lote):
+        try:
+            df = pd.concat([peticion.df for peticion in lote], ignore_index=True)
+            resultados = self._predecir(df)
+
+            inicio = 0
+            for peticion in lote:
+                fin = inicio + len(peticion.df)
+                peticion.resultado = resultados.iloc[inicio:fin].reset_index(drop=True)
+                inicio = fin
+        except Exception:
+            # Aislar la petición culpable: cada una por separado
+            for peticion in lote:
+                try:
+                    peticion.resultado = self._predecir(peticion.df)
+                except Exception as e:
+                    peticion.error = e
+        finally:
+            self.estadisticas.registrar_lote()
+            for peticion in lote:
+                peticion.evento.set()
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128    # El backlog por defecto (5) resetea conexiones bajo carga
+
+class ServidorPredicciones:
+    """
+    Servidor HTTP local de predicciones
+
+    Endpoints:
+      POST /predecir[/<modelo>]  cuerpo: lista de registros JSON (o {"registros": [...]})
+                                 respuesta: [{"ID", "Condición", "Probabilidad"}, ...]
+      GET  /estadisticas         latencia p50/p99, throughput y tamaño medio de lote
+      GET  /salud                modelos cargados
+    """
+
+    def __init__(self, modelos, host=HOST, puerto=PUERTO, max_lote=MAX_LOTE, max_espera_ms=MAX_ESPERA_MS):
+        if not modelos:
+            raise ValueError("❌ Se necesita al menos un modelo")
+
+        self.estadisticas = Estadisticas()
+        self.batchers = {
+            nombre: MicroBatcher(modelo, self.estadisticas, max_lote, max_espera_ms)
+            for nombre, modelo in modelos.items()
+        }
+        self.modelo_por_defecto = next(iter(modelos))
+
+        self.httpd = _ServidorHTTP((host, puerto), self._crear_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, puerto = self.httpd.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def _crear_handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _responder(self, codigo, cuerpo):
+                datos = cuerpo if isinstance(cuerpo, bytes) else json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+                self.send_response(codigo)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def do_GET(self):
+                if self.path == '/estadisticas':
+                    self._responder(200, servidor.estadisticas.resumen())
+                elif self.path == '/salud':
+                    self._responder(200, {'estado': 'ok', 'modelos': list(servidor.batchers)})
+                else:
+                    self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+
+            def do_POST(self):
+                partes = self.path.strip('/').split('/')
+                if partes[0] != 'predecir' or len(partes) > 2:
+                    self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+                    return
+
+                nombre = partes[1] if len(partes) == 2 else servidor.modelo_por_defecto
+                if nombre not in servidor.batchers:
+                    self._responder(404, {'error': f'Modelo no cargado: {nombre}'})
+                    return
+
+                inicio = time.perf_counter()
+                filas = 0
+                try:
+                    longitud = int(self.headers.get('Content-Length', 0))
+                    cuerpo = json.loads(self.rfile.read(longitud) or b'[]')
+                    registros = cuerpo['registros'] if isinstance(cuerpo, dict) else cuerpo
+
+                    df = pd.DataFrame(registros)
+                    if 'ID' not in df.columns:
+                        df['ID'] = np.arange(len(df))
+                    filas = len(df)
+
+                    if filas == 0:
+                        self._responder(200, b'[]')
+                        return
+
+                    resultados = servidor.batchers[nombre].predecir(df)
+                except Exception as e:
+                    servidor.estadisticas.registrar_peticion(
+                        (time.perf_counter() - inicio) * 1000, filas, error=True
+                    )
+                    self._responder(400, {'error': str(e)})
+                    return
+
+                self._responder(200, resultados.to_json(orient='records', force_ascii=False).encode('utf-8'))
+                servidor.estadisticas.registrar_peticion((time.perf_counter() - inicio) * 1000, filas)
+
+        return Handler
+
+    def iniciar(self, bloquear=False):
+        """Arrancar el servidor (en segundo plano salvo bloquear=True)"""
+
+        print(f"🛰️ Servidor de predicciones en {self.url} (modelos: {', '.join(self.batchers)})")
+
+        if bloquear:
+            self.httpd.serve_forever()
+        else:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for batcher in self.batchers.values():
+            batcher.detener()
+        print("🛑 Servidor de predicciones detenido")
+
+# ================================
+# 📈 PRUEBA DE CARGA
+# ================================
+
+def prueba_carga(url, registros, n_peticiones=1000, concurrencia=16, filas_por_peticion=1, modelo=None):
+    """
+    Prueba de carga local contra un servidor en marcha
+
+    Args:
+        url (str): URL base del servidor
+        registros (list): Registros de ejemplo (se reparten ciclicamente entre peticiones)
+        n_peticiones (int): Peticiones totales
+        concurrencia (int): Clientes simultáneos
+        filas_por_peticion (int): Registros por petición
+        modelo (str): Modelo a usar (por defecto el del servidor)
+
+    Returns:
+        dict: Latencias del lado cliente y estadísticas del servidor
+    """
+
+    ruta = f"{url}/predecir" + (f"/{modelo}" if modelo else '')
+
+    def enviar(i):
+        inicio_lote = (i * filas_por_peticion) % len(registros)
+        cuerpo = [registros[(inicio_lote + j) % len(registros)] for j in range(filas_por_peticion)]
+        datos = json.dumps(cuerpo, ensure_ascii=False, default=float).encode('utf-8')
+        peticion = urllib_request.Request(ruta, data=datos, headers={'Content-Type': 'application/json'})
+
+        inicio = time.perf_counter()
+        with urllib_request.urlopen(peticion) as respuesta:
+            respuesta.read()
+        return (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        latencias = np.asarray(list(executor.map(enviar, range(n_peticiones))))
+    duracion = time.perf_counter() - inicio
+
+    with urllib_request.urlopen(f"{url}/estadisticas") as respuesta:
+        servidor = json.loads(respuesta.read())
+
+    resultado = {
+        'peticiones': n_peticiones,
+        'p50_ms': float(np.percentile(latencias, 50)),
+        'p99_ms': float(np.percentile(latencias, 99)),
+        'peticiones_por_s': n_peticiones / duracion,
+        'filas_por_s': n_peticiones * filas_por_peticion / duracion,
+        'servidor': servidor
+    }
+
+    print(f"📈 PRUEBA DE CARGA: {n_peticiones} peticiones, concurrencia {concurrencia}")
+    print(f"   ⏱️ p50: {resultado['p50_ms']:.1f} ms | p99: {resultado['p99_ms']:.1f} ms")
+    print(f"   🚀 {resultado['peticiones_por_s']:.0f} peticiones/s | {resultado['filas_por_s']:.0f} filas/s")
+    print(f"   📦 Filas por lote (servidor): {servidor['filas_por_lote']:.1f}")
+
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Servidor local de predicciones')
+    parser.add_argument('--modelo', action='append', help='Nombre en el registro de modelos (repetible)')
+    parser.add_argument('--train', default='train.csv', help='Archivo de entrenamiento si no se indica --modelo')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--puerto', type=int, default=PUERTO)
+    parser.add_argument('--max-lote', type=int, default=MAX_LOTE)
+    parser.add_argument('--max-espera-ms', type=float, default=MAX_ESPERA_MS)
+    args = parser.parse_args()
+
+    registro = RegistroModelos()
+    if args.modelo:
+        modelos = {nombre: registro.obtener(nombre) for nombre in args.modelo}
+    else:
+        modelo, _ = registro.entrenar_o_reutilizar(args.train, 'servidor')
+        modelos = {'servidor': modelo}
+
+    servidor = ServidorPredicciones(
+        modelos, host=args.host, puerto=args.puerto,
+        max_lote=args.max_lote, max_espera_ms=args.max_espera_ms
+    )
+    try:
+        servidor.iniciar(bloquear=True)
+    except KeyboardInterrupt:
+        servidor.detener()
@@ -0,0 +1,631 @@
+# ================================
+# 🛰️ SERVIDOR DE TRABAJOS DE ENTRENAMIENTO POR PARTICIÓN
+# ================================
+# El coordinador publica particiones de entrenamiento + config; cualquier worker
+# (local, Colab u otra máquina) pide un trabajo por HTTP, entrena y devuelve el
+# modelo con sus probabilidades OOF/test, que se registran y archivan al llegar
+
+import argparse
+import gzip
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import re
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error as urllib_error
+from urllib import request as urllib_request
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import f1_score
+
+import automatizacion.calcularf1_score as calcularf1_score
+from automatizacion.almacen_predicciones import AlmacenPredicciones
+from automatizacion.artefactos_modelo import cargar_artefacto, guardar_artefacto, leer_cabecera
+from automatizacion.registro_modelos import RegistroModelos
+
+HOST = '127.0.0.1'
+PUERTO = 8766
+DIRECTORIO_TRABAJOS = 'trabajos'
+DIRECTORIO_CACHE_WORKER = os.path.join('trabajos', 'cache_worker')
+
+TIEMPO_CONCESION = 3600      # s que tiene un worker para entregar antes de reasignar el trabajo
+MAX_INTENTOS = 3             # Asignaciones por trabajo antes de darlo por fallido
+INTERVALO_SONDEO = 5         # s entre peticiones de un worker que no recibe trabajo
+TIMEOUT_HTTP = 600           # s por petición (las transferencias pueden ser grandes)
+BLOQUE_TRANSFERENCIA = 1 << 20
+
+ARCHIVO_RESUMEN = 'resumen.json'
+HASH_VALIDO = re.compile(r'[0-9a-f]{64}')
+
+def _es_loopback(host):
+    """True si host solo es alcanzable desde esta máquina"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def _extraer_tar(ruta_tar, destino):
+    """Extraer un tar recibido sin permitir rutas fuera de destino"""
+
+    with tarfile.open(ruta_tar) as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(destino, filter='data')
+            return
+
+        raiz = os.path.realpath(destino)
+        for miembro in tar.getmembers():
+            ruta = os.path.realpath(os.path.join(destino, miembro.name))
+            if not (miembro.isfile() or miembro.isdir()) or os.path.commonpath([raiz, ruta]) != raiz:
+                raise ValueError(f"❌ Entrada no permitida en el resultado: {miembro.name}")
+        tar.extractall(destino)
+
+# ================================
+# 📤 COORDINADOR
+# ================================
+
+class ServidorTrabajos:
+    """
+    Coordinador de trabajos de entrenamiento por partición
+
+    Los workers tiran de la cola (no hace falta poder conectarse a ellos, sirve
+    para Colab). Los datos se sirven direccionados por hash: un test compartido
+    por varios trabajos se descarga una sola vez por worker.
+
+    Escuchar fuera de loopback exige token. Los resultados solo se aceptan con
+    el modelo compilado (.npy): un modelo.pkl subido por un worker se rechaza,
+    porque cargarlo ejecutaría código arbitrario en el coordinador.
+
+    Endpoints (todos exigen la cabecera X-Token si se configuró token):
+      POST /trabajos/pedir              {"worker"} -> trabajo o 204 si no hay
+      GET  /datos/<sha256>              CSV comprimido con gzip
+      POST /trabajos/<id>/resultado     tar con artefacto/, <parte>.npz y resumen.json
+      POST /trabajos/<id>/error         {"error"} -> se reintenta hasta MAX_INTENTOS
+      GET  /trabajos                    estado de todos los trabajos
+      GET  /salud
+    """
+
+    def __init__(self, host=HOST, puerto=PUERTO, token=None, directorio=DIRECTORIO_TRABAJOS,
+                 registro=None, almacen=None, tiempo_concesion=TIEMPO_CONCESION):
+        if token is None and not _es_loopback(host):
+            raise ValueError(f"❌ Escuchar en {host!r} (fuera de loopback) requiere token")
+
+        self.token = token
+        self.directorio = directorio
+        self.directorio_datos = os.path.join(directorio, 'datos')
+        self.tiempo_concesion = tiempo_concesion
+        os.makedirs(self.directorio_datos, exist_ok=True)
+
+        self.registro = registro if registro is not None else RegistroModelos()
+        self.almacen = almacen if almacen is not None else AlmacenPredicciones()
+
+        self.trabajos = OrderedDict()
+        self._cond = threading.Condition()
+
+        self.httpd = _ServidorHTTP((host, puerto), self._crear_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, puerto = self.httpd.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    # ---------- Publicación ----------
+
+    def _guardar_datos(self, origen):
+        """Comprimir un CSV (ruta o DataFrame) en el directorio de datos -> sha256 del CSV"""
+
+        sha = hashlib.sha256()
+        tmp = tempfile.NamedTemporaryFile(dir=self.directorio_datos, prefix='.datos_', delete=False)
+
+        try:
+            with tmp, gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=1, mtime=0) as gz:
+                if isinstance(origen, pd.DataFrame):
+                    bloque = origen.to_csv(index=False).encode('utf-8')
+                    sha.update(bloque)
+                    gz.write(bloque)
+                else:
+                    with open(origen, 'rb') as f:
+                        for bloque in iter(lambda: f.read(BLOQUE_TRANSFERENCIA), b""):
+                            sha.update(bloque)
+                            gz.write(bloque)
+
+            datos_hash = sha.hexdigest()
+            os.replace(tmp.name, os.path.join(self.directorio_datos, f'{datos_hash}.csv.gz'))
+        except:
+            os.unlink(tmp.name)
+            raise
+
+        return datos_hash
+
+    def publicar(self, nombre, train, tests=None, config=None, peso=1.0):
+        """
+        Publicar un trabajo de entrenamiento
+
+        Args:
+            nombre (str): Nombre de la partición (nombre en el registro y en el almacén)
+            train: Ruta CSV o DataFrame de entrenamiento (con 'Condición')
+            tests (dict): {parte: ruta CSV o DataFrame} a predecir (p.ej. public/private)
+            config (dict): Configuración que se entrega al worker (p.ej. {'n_jobs': 4})
+            peso (float): Peso de la partición en el ensemble
+
+        Returns:
+            str: ID del trabajo
+        """
+
+        datos = {'train': self._guardar_datos(train)}
+        for parte, origen in (tests or {}).items():
+            datos[parte] = self._guardar_datos(origen)
+
+        trabajo_id = uuid.uuid4().hex[:12]
+        with self._cond:
+            self.trabajos[trabajo_id] = {
+                'id': trabajo_id,
+                'nombre': nombre,
+                'config': config or {},
+                'peso': peso,
+                'datos': datos,
+                'estado': 'pendiente',
+                'intentos': 0,
+                'worker': None,
+                'asignado': None,
+                'publicado': datetime.now().isoformat(),
+                'resultado': None,
+                'error': None
+            }
+
+        print(f"📤 Trabajo publicado: {nombre} ({trabajo_id})")
+        return trabajo_id
+
+    # ---------- Ciclo de vida ----------
+
+    def _asignar(self, worker):
+        """Siguiente trabajo pendiente para un worker (o None)"""
+
+        with self._cond:
+            ahora = time.time()
+
+            # Concesiones vencidas: el worker se perdió, el trabajo vuelve a la cola
+            for trabajo in self.trabajos.values():
+                if trabajo['estado'] == 'asignado' and ahora - trabajo['asignado'] > self.tiempo_concesion:
+                    print(f"⚠️ Trabajo {trabajo['id']} sin respuesta de {trabajo['worker']}, reasignando")
+                    self._fallar(trabajo, 'Concesión vencida')
+
+            for trabajo in self.trabajos.values():
+                if trabajo['estado'] == 'pendiente':
+                    trabajo.update(estado='asignado', worker=worker, asignado=ahora)
+                    trabajo['intentos'] += 1
+                    print(f"📦 Trabajo {trabajo['nombre']} ({trabajo['id']}) asignado a {worker}")
+                    return {
+                        'trabajo_id': trabajo['id'],
+                        'nombre': trabajo['nombre'],
+                        'config': trabajo['config'],
+                        'datos': trabajo['datos']
+                    }
+
+        return None
+
+    def _fallar(self, trabajo, mensaje):
+        """Devolver a la cola o marcar fallido (llamar con self._cond tomado)"""
+
+        trabajo['error'] = mensaje
+        trabajo['estado'] = 'pendiente' if trabajo['intentos'] < MAX_INTENTOS else 'fallido'
+        trabajo['worker'] = None
+        self._cond.notify_all()
+
+    def _registrar_error(self, trabajo_id, mensaje):
+        with self._cond:
+            trabajo = self.trabajos[trabajo_id]
+            if trabajo['estado'] == 'asignado':
+                print(f"❌ Trabajo {trabajo['nombre']} ({trabajo_id}) falló en {trabajo['worker']}: {mensaje}")
+                self._fallar(trabajo, mensaje)
+
+    def _recibir_resultado(self, trabajo_id, ruta_tar):
+        """Registrar el modelo y archivar las probabilidades de un resultado recibido"""
+
+        with self._cond:
+            trabajo = self.trabajos[trabajo_id]
+            if trabajo['estado'] != 'asignado':
+                raise ValueError(f"❌ El trabajo {trabajo_id} no está asignado ({trabajo['estado']})")
+
+        tmp = tempfile.mkdtemp(prefix='.resultado_', dir=self.directorio)
+        try:
+            _extraer_tar(ruta_tar, tmp)
+            with open(os.path.join(tmp, ARCHIVO_RESUMEN), encoding='utf-8') as f:
+                resumen = json.load(f)
+
+            metadatos = {
+                'trabajo_id': trabajo_id,
+                'worker': resumen['worker'],
+                'config': trabajo['config'],
+                'peso': trabajo['peso']
+            }
+
+            modelo = cargar_artefacto(os.path.join(tmp, 'artefacto'), mmap=False, permitir_pickle=False)
+            modelo_hash = self.registro.registrar(
+                modelo, trabajo['nombre'],
+                f1_cv=resumen['f1_oof'],
+                tiempo_entrenamiento=resumen['duracion'],
+                metadatos=metadatos
+            )
+
+            ejecuciones = {}
+            for parte in resumen['partes']:
+                with np.load(os.path.join(tmp, f'{parte}.npz')) as arrays:
+                    predicciones = pd.DataFrame({'ID': arrays['ids'], 'Probabilidad': arrays['proba']})
+                ejecuciones[parte] = self.almacen.guardar(
+                    predicciones, f"{parte}_{trabajo['nombre']}", resumen['threshold'],
+                    dict(metadatos, modelo_hash=modelo_hash, f1=resumen['f1'].get(parte))
+                )
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        with self._cond:
+            trabajo['estado'] = 'completado'
+            trabajo['error'] = None
+            trabajo['resultado'] = {
+                'modelo_hash': modelo_hash,
+                'threshold': resumen['threshold'],
+                'f1_oof': resumen['f1_oof'],
+                'f1': resumen['f1'],
+                'ejecuciones': ejecuciones,
+                'worker': resumen['worker'],
+                'duracion': resumen['duracion']
+            }
+            self._cond.notify_all()
+
+        print(f"✅ Resultado de {trabajo['nombre']} ({trabajo_id}) desde {resumen['worker']}: "
+              f"F1 OOF {resumen['f1_oof']:.4f} en {resumen['duracion']:.1f}s")
+
+        return trabajo['resultado']
+
+    def esperar(self, trabajo_ids=None, timeout=None):
+        """
+        Esperar a que los trabajos terminen (completados o fallidos)
+
+        Returns:
+            dict: {trabajo_id: trabajo}
+        """
+
+        with self._cond:
+            trabajo_ids = list(self.trabajos) if trabajo_ids is None else list(trabajo_ids)
+            terminado = lambda: all(
+                self.trabajos[t]['estado'] in ('completado', 'fallido') for t in trabajo_ids
+            )
+            if not self._cond.wait_for(terminado, timeout):
+                pendientes = [t for t in trabajo_ids if self.trabajos[t]['estado'] not in ('completado', 'fallido')]
+                raise TimeoutError(f"❌ Trabajos sin terminar: {', '.join(pendientes)}")
+
+            return {t: dict(self.trabajos[t]) for t in trabajo_ids}
+
+    def estado(self):
+        with self._cond:
+            return [
+                {clave: valor for clave, valor in trabajo.items() if clave != 'datos'}
+                for trabajo in self.trabajos.values()
+            ]
+
+    # ---------- HTTP ----------
+
+    def _crear_handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _responder(self, codigo, cuerpo=None):
+                datos = b'' if cuerpo is None else json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+                self.send_response(codigo)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _autorizado(self):
+                if servidor.token is None:
+                    return True
+                if hmac.compare_digest(self.headers.get('X-Token', ''), servidor.token):
+                    return True
+                self._responder(401, {'error': 'Token inválido'})
+                return False
+
+            def _leer_json(self):
+                longitud = int(self.headers.get('Content-Length', 0))
+                return json.loads(self.rfile.read(longitud) or b'{}')
+
+            def do_GET(self):
+                if not self._autorizado():
+                    return
+
+                partes = self.path.strip('/').split('/')
+                if self.path == '/salud':
+                    self._responder(200, {'estado': 'ok', 'trabajos': len(servidor.trabajos)})
+                elif self.path == '/trabajos':
+                    self._responder(200, servidor.estado())
+                elif len(partes) == 2 and partes[0] == 'datos' and HASH_VALIDO.fullmatch(partes[1]):
+                    ruta = os.path.join(servidor.directorio_datos, f'{partes[1]}.csv.gz')
+                    if not os.path.exists(ruta):
+                        self._responder(404, {'error': f'Datos no encontrados: {partes[1]}'})
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/gzip')
+                    self.send_header('Content-Length', str(os.path.getsize(ruta)))
+                    self.end_headers()
+                    with open(ruta, 'rb') as f:
+                        shutil.copyfileobj(f, self.wfile, BLOQUE_TRANSFERENCIA)
+                else:
+                    self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+
+            def do_POST(self):
+                if not self._autorizado():
+                    return
+
+                partes = self.path.strip('/').split('/')
+                try:
+                    if partes == ['trabajos', 'pedir']:
+                        trabajo = servidor._asignar(self._leer_json().get('worker', self.client_address[0]))
+                        if trabajo is None:
+                            self._responder(204)
+                        else:
+                            self._responder(200, trabajo)
+
+                    elif len(partes) == 3 and partes[0] == 'trabajos' and partes[1] in servidor.trabajos:
+                        if partes[2] == 'resultado':
+                            self._recibir_tar(partes[1])
+                        elif partes[2] == 'error':
+                            servidor._registrar_error(partes[1], self._leer_json().get('error', 'desconocido'))
+                            self._responder(200, {'estado': 'registrado'})
+                        else:
+                            self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+
+                    else:
+                        self._responder(404, {'error': f'Ruta no encontrada: {self.path}'})
+                except Exception as e:
+                    self._responder(400, {'error': str(e)})
+
+            def _recibir_tar(self, trabajo_id):
+                # El resultado se vuelca a disco por bloques, nunca entero en memoria
+                restante = int(self.headers.get('Content-Length', 0))
+                with tempfile.NamedTemporaryFile(dir=servidor.directorio, suffix='.tar') as tmp:
+                    while restante > 0:
+                        bloque = self.rfile.read(min(BLOQUE_TRANSFERENCIA, restante))
+                        if not bloque:
+                            raise ConnectionError("❌ Conexión cerrada durante la transferencia")
+                        tmp.write(bloque)
+                        restante -= len(bloque)
+                    tmp.flush()
+
+                    try:
+                        resultado = servidor._recibir_resultado(trabajo_id, tmp.name)
+                    except Exception as e:
+                        servidor._registrar_error(trabajo_id, f'Resultado inválido: {e}')
+                        raise
+
+                self._responder(200, {'estado': 'completado', 'modelo_hash': resultado['modelo_hash']})
+
+        return Handler
+
+    def iniciar(self, bloquear=False):
+        """Arrancar el servidor (en segundo plano salvo bloquear=True)"""
+
+        print(f"🛰️ Servidor de trabajos en {self.url}")
+
+        if bloquear:
+            self.httpd.serve_forever()
+        else:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        print("🛑 Servidor de trabajos detenido")
+
+# ================================
+# 🛠️ WORKER
+# ================================
+
+class WorkerTrabajos:
+    """
+    Worker que pide trabajos al coordinador, entrena y devuelve el resultado
+
+    El resultado es un tar con el artefacto del modelo (ver artefactos_modelo),
+    un <parte>.npz (ids, proba) por cada conjunto predicho (oof + tests) y
+    resumen.json; se sube por bloques desde disco.
+    """
+
+    def __init__(self, url, nombre=None, token=None, n_jobs=None, directorio_cache=DIRECTORIO_CACHE_WORKER):
+        self.url = url.rstrip('/')
+        self.nombre = nombre or f'{socket.gethostname()}-{os.getpid()}'
+        self.token = token
+        self.n_jobs = n_jobs
+        self.directorio_cache = directorio_cache
+        os.makedirs(directorio_cache, exist_ok=True)
+
+    def _peticion(self, ruta, datos=None, cabeceras=None):
+        cabeceras = dict(cabeceras or {})
+        if self.token is not None:
+            cabeceras['X-Token'] = self.token
+        if isinstance(datos, dict):
+            datos = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+            cabeceras['Content-Type'] = 'application/json'
+
+        peticion = urllib_request.Request(f'{self.url}{ruta}', data=datos, headers=cabeceras)
+        return urllib_request.urlopen(peticion, timeout=TIMEOUT_HTTP)
+
+    def _descargar(self, datos_hash):
+        """Ruta local de unos datos (se descargan solo la primera vez)"""
+
+        ruta = os.path.join(self.directorio_cache, f'{datos_hash}.csv.gz')
+        if os.path.exists(ruta):
+            return ruta
+
+        with self._peticion(f'/datos/{datos_hash}') as respuesta, \
+                tempfile.NamedTemporaryFile(dir=self.directorio_cache, delete=False) as tmp:
+            shutil.copyfileobj(respuesta, tmp, BLOQUE_TRANSFERENCIA)
+        os.replace(tmp.name, ruta)
+
+        return ruta
+
+    def _entrenar(self, trabajo):
+        """Entrenar y predecir un trabajo -> ruta del tar de resultado"""
+
+        config = trabajo['config']
+        n_jobs = self.n_jobs or config.get('n_jobs')
+        if n_jobs:
+            calcularf1_score.N_JOBS = n_jobs
+
+        inicio = time.perf_counter()
+
+        df_train = pd.read_csv(self._descargar(trabajo['datos']['train']))
+        modelo = calcularf1_score.ModeloCoronario()
+        modelo.entrenar_modelo(df_train)
+
+        y_train = df_train['Condición'].to_numpy()
+        f1_oof = float(f1_score(y_train, (modelo.proba_oof >= modelo.threshold_optimo).astype(int)))
+        partes = {'oof': (df_train['ID'].to_numpy(), modelo.proba_oof)}
+        f1_partes = {'oof': f1_oof}
+
+        tests = {
+            parte: pd.read_csv(self._descargar(datos_hash))
+            for parte, datos_hash in trabajo['datos'].items() if parte != 'train'
+        }
+        if tests:
+            for parte, (predicciones, f1_parte) in modelo.predecir_lote(tests, verbose=False).items():
+                partes[parte] = (predicciones['ID'].to_numpy(), predicciones['Probabilidad'].to_numpy())
+                f1_partes[parte] = f1_parte
+
+        duracion = time.perf_counter() - inicio
+
+        tmp = tempfile.mkdtemp(prefix='.trabajo_', dir=self.directorio_cache)
+        try:
+            ruta_artefacto = guardar_artefacto(modelo, os.path.join(tmp, 'artefacto'),
+                                               metadatos={'trabajo_id': trabajo['trabajo_id']})
+            if leer_cabecera(ruta_artefacto)['modelo']['tipo'] != 'compilado':
+                raise ValueError("❌ El modelo no es compilable: el coordinador no acepta artefactos con pickle")
+            for parte, (ids, proba) in partes.items():
+                np.savez(
+                    os.path.join(tmp, f'{parte}.npz'),
+                    ids=np.asarray(ids, dtype=np.int64), proba=np.asarray(proba, dtype=np.float32)
+                )
+
+            with open(os.path.join(tmp, ARCHIVO_RESUMEN), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'worker': self.nombre,
+                    'threshold': float(modelo.threshold_optimo),
+                    'f1_oof': f1_oof,
+                    'f1': f1_partes,
+                    'partes': list(partes),
+                    'filas_train': len(df_train),
+                    'duracion': duracion
+                }, f, ensure_ascii=False)
+
+            ruta_tar = f'{tmp}.tar'
+            with tarfile.open(ruta_tar, 'w') as tar:
+                for nombre in os.listdir(tmp):
+                    tar.add(os.path.join(tmp, nombre), arcname=nombre)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        return ruta_tar
+
+    def ejecutar_trabajo(self, trabajo):
+        """Entrenar un trabajo y subir su resultado (o el error)"""
+
+        print(f"🛠️ {self.nombre}: entrenando {trabajo['nombre']} ({trabajo['trabajo_id']})")
+
+        try:
+            ruta_tar = self._entrenar(trabajo)
+        except Exception as e:
+            print(f"❌ {self.nombre}: error en {trabajo['nombre']}: {e}")
+            try:
+                self._peticion(f"/trabajos/{trabajo['trabajo_id']}/error", {'error': str(e)}).close()
+            except urllib_error.URLError:
+                pass
+            return False
+
+        try:
+            with open(ruta_tar, 'rb') as f:
+                self._peticion(
+                    f"/trabajos/{trabajo['trabajo_id']}/resultado", f,
+                    {'Content-Type': 'application/x-tar', 'Content-Length': str(os.path.getsize(ruta_tar))}
+                ).close()
+        except urllib_error.URLError as e:
+            # El coordinador reasigna el trabajo (error registrado o concesión vencida)
+            print(f"❌ {self.nombre}: no se pudo entregar {trabajo['nombre']}: {e}")
+            return False
+        finally:
+            os.unlink(ruta_tar)
+
+        print(f"📬 {self.nombre}: resultado de {trabajo['nombre']} entregado")
+        return True
+
+    def ejecutar(self, salir_si_vacio=False, max_trabajos=None, intervalo=INTERVALO_SONDEO):
+        """
+        Bucle del worker
+
+        Args:
+            salir_si_vacio (bool): Terminar en cuanto no haya trabajos pendientes
+            max_trabajos (int): Terminar tras este número de trabajos
+            intervalo (float): Segundos de espera cuando no hay trabajo
+
+        Returns:
+            int: Trabajos completados
+        """
+
+        completados = 0
+        print(f"🛠️ Worker {self.nombre} conectado a {self.url}")
+
+        while max_trabajos is None or completados < max_trabajos:
+            try:
+                with self._peticion('/trabajos/pedir', {'worker': self.nombre}) as respuesta:
+                    trabajo = json.loads(respuesta.read()) if respuesta.status == 200 else None
+            except (urllib_error.URLError, ConnectionError) as e:
+                if salir_si_vacio:
+                    break
+                print(f"⚠️ {self.nombre}: coordinador no disponible ({e}), reintentando")
+                time.sleep(intervalo)
+                continue
+
+            if trabajo is None:
+                if salir_si_vacio:
+                    break
+                time.sleep(intervalo)
+                continue
+
+            completados += int(self.ejecutar_trabajo(trabajo))
+
+        return completados
+
+def ejecutar_worker(url, nombre=None, token=None, n_jobs=None, salir_si_vacio=False):
+    """Punto de entrada de un worker (p.ej. en un proceso lanzado por el coordinador)"""
+    return WorkerTrabajos(url, nombre=nombre, token=token, n_jobs=n_jobs).ejecutar(salir_si_vacio=salir_si_vacio)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Worker de entrenamiento por partición')
+    parser.add_argument('--url', default=f'http://{HOST}:{PUERTO}', help='URL del coordinador')
+    parser.add_argument('--token', default=os.environ.get('TRABAJOS_TOKEN'))
+    parser.add_argument('--nombre', help='Nombre del worker (por defecto host-pid)')
+    parser.add_argument('--n-jobs', type=int, help='Cores para entrenar (por defecto todos)')
+    parser.add_argument('--salir-si-vacio', action='store_true', help='Terminar cuando no haya trabajos')
+    args = parser.parse_args()
+
+    ejecutar_worker(args.url, args.nombre, args.token, args.n_jobs, args.salir_si_vacio)
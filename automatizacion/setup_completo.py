@@ -576,12 +576,12 @@ def ejemplo_monitoreo():
     stats = db.obtener_estadisticas()
     
     # Submissions
-    df_submissions = stats['submissions']
-    if len(df_submissions) > 0:
+    df_submissions = stats['ultimas_submissions']
+    if stats['total_submissions'] > 0:
         print("📤 SUBMISSIONS:")
-        print(f"  Total: {len(df_submissions)}")
-        print(f"  Mejor score: {df_submissions['f1_score_publico'].max()}")
-        print(f"  Promedio: {df_submissions['f1_score_publico'].mean():.4f}")
+        print(f"  Total: {stats['total_submissions']}")
+        print(f"  Mejor score: {stats['mejor_score_publico']}")
+        print(f"  Hoy: {stats['submissions_hoy']}")
         
         print("\\n📈 Últimas 5 submissions:")
         for _, row in df_submissions.head(5).iterrows():
@@ -591,7 +591,7 @@ def ejemplo_monitoreo():
     df_entrenamientos = stats['entrenamientos']
     if len(df_entrenamientos) > 0:
         print("\\n🤖 ENTRENAMIENTOS:")
-        print(f"  Total: {len(df_entrenamientos)}")
+        print(f"  Total: {stats['total_entrenamientos']}")
         print(f"  Mejor score: {df_entrenamientos['f1_score'].max():.4f}")
         
         print("\\n🏆 Mejores estrategias:")
@@ -0,0 +1,286 @@
+# ================================
+# ⏱️ TRAZAS DE ETAPAS DEL PIPELINE
+# ================================
+# Spans anidados con tiempo real, tiempo de CPU, subida del pico de RSS y filas
+# procesadas. Se exportan a SQLite (tabla spans) y a un JSON en formato Chrome
+# trace (chrome://tracing, Perfetto, speedscope) para verlos como flame chart.
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:    # Windows: sin pico de RSS
+    resource = None
+
+from automatizacion.base_datos import ConexionSQLite
+
+MAX_SPANS = 100000
+
+_span_actual = contextvars.ContextVar('span_actual', default=None)
+_contador = itertools.count(1)
+
+def _pico_rss_mb():
+    """Máximo de RSS del proceso hasta ahora (ru_maxrss está en KiB en Linux)"""
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Span:
+    """
+    Una etapa medida; usar con `with span(...) as s:`
+
+    `s.filas` se puede fijar dentro del bloque cuando el número de filas solo
+    se conoce al final (p.ej. tras leer un CSV).
+    """
+
+    __slots__ = ('id', 'padre', 'nombre', 'filas', 'atributos', 'pid', 'tid', 'inicio', 'duracion',
+                 'cpu', 'rss_pico_delta_mb', 'error', '_t0', '_cpu0', '_rss0', '_token')
+
+    def __init__(self, nombre, filas=None, atributos=None):
+        self.id = next(_contador)
+        self.padre = None
+        self.nombre = nombre
+        self.filas = filas
+        self.atributos = atributos or {}
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.inicio = None
+        self.duracion = None
+        self.cpu = None
+        self.rss_pico_delta_mb = None
+        self.error = None
+
+    def __enter__(self):
+        padre = _span_actual.get()
+        self.padre = padre.id if padre is not None else None
+        self._token = _span_actual.set(self)
+
+        self.inicio = time.time()
+        self._rss0 = _pico_rss_mb()
+        self._cpu0 = time.process_time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        self.duracion = time.perf_counter() - self._t0
+        # CPU de todo el proceso (incluye los threads de sklearn/joblib del span)
+        self.cpu = time.process_time() - self._cpu0
+        self.rss_pico_delta_mb = _pico_rss_mb() - self._rss0
+        if tipo is not None:
+            self.error = tipo.__name__
+
+        _span_actual.reset(self._token)
+        TRAZADOR.registrar(self)
+        return False
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'padre': self.padre,
+            'nombre': self.nombre,
+            'pid': self.pid,
+            'tid': self.tid,
+            'inicio': self.inicio,
+            'duracion': self.duracion,
+            'cpu': self.cpu,
+            'rss_pico_delta_mb': self.rss_pico_delta_mb,
+            'filas': self.filas,
+            'atributos': self.atributos,
+            'error': self.error
+        }
+
+def crear_tabla_spans(db):
+    """Crear (si no existe) la tabla de spans en una ConexionSQLite"""
+    db.ejecutar_script('''
+        CREATE TABLE IF NOT EXISTS spans (
+            pid INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            padre INTEGER,
+            nombre TEXT NOT NULL,
+            inicio REAL NOT NULL,
+            duracion REAL NOT NULL,
+            cpu REAL,
+            rss_pico_delta_mb REAL,
+            filas INTEGER,
+            tid INTEGER,
+            atributos TEXT,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_spans_inicio ON spans(inicio);
+        CREATE INDEX IF NOT EXISTS idx_spans_nombre ON spans(nombre, inicio)
+    ''')
+
+class Trazador:
+    """Colector de spans terminados (acotado: se descartan los más antiguos)"""
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self.activo = True
+
+    def registrar(self, span):
+        if self.activo:
+            with self._lock:
+                self._spans.append(span)
+
+    def spans(self):
+        """Copia de los spans registrados"""
+        with self._lock:
+            return list(self._spans)
+
+    def vaciar(self):
+        """Devolver y olvidar los spans registrados"""
+        with self._lock:
+            spans, self._spans = list(self._spans), deque(maxlen=self._spans.maxlen)
+        return spans
+
+    def resumen(self, spans=None):
+        """
+        Totales por nombre de etapa
+
+        Returns:
+            dict: nombre -> n, segundos, cpu, rss_pico_delta_mb (máximo), filas
+        """
+
+        resumen = {}
+        for s in (self.spans() if spans is None else spans):
+            r = resumen.setdefault(s.nombre, {'n': 0, 'segundos': 0.0, 'cpu': 0.0, 'rss_pico_delta_mb': 0.0, 'filas': 0})
+            r['n'] += 1
+            r['segundos'] += s.duracion
+            r['cpu'] += s.cpu
+            r['rss_pico_delta_mb'] = max(r['rss_pico_delta_mb'], s.rss_pico_delta_mb)
+            r['filas'] += s.filas or 0
+        return resumen
+
+    def exportar_chrome(self, ruta, spans=None):
+        """
+        Escribir los spans como Chrome trace (eventos 'X' completos, tiempos en µs)
+
+        Returns:
+            int: Spans exportados
+        """
+
+        spans = self.spans() if spans is None else spans
+        eventos = [{
+            'name': s.nombre,
+            'cat': s.nombre.split('.')[0],
+            'ph': 'X',
+            'ts': s.inicio * 1e6,
+            'dur': s.duracion * 1e6,
+            'pid': s.pid,
+            'tid': s.tid,
+            'args': dict(
+                s.atributos,
+                cpu_ms=round(s.cpu * 1000, 3),
+                rss_pico_delta_mb=round(s.rss_pico_delta_mb, 2),
+                filas=s.filas,
+                error=s.error
+            )
+        } for s in spans]
+
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        with open(ruta, 'w') as f:
+            json.dump({'traceEvents': eventos, 'displayTimeUnit': 'ms'}, f, default=str)
+        return len(eventos)
+
+    def exportar_sqlite(self, db_path, spans=None):
+        """
+        Guardar los spans en la tabla `spans` de una base SQLite (p.ej. la de métricas)
+
+        Returns:
+            int: Spans exportados
+        """
+
+        spans = self.spans() if spans is None else spans
+        db = ConexionSQLite.compartida(db_path)
+        crear_tabla_spans(db)
+        db.ejecutar_muchos('''
+            INSERT INTO spans (pid, id, padre, nombre, inicio, duracion, cpu, rss_pico_delta_mb, filas, tid, atributos, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (s.pid, s.id, s.padre, s.nombre, s.inicio, s.duracion, s.cpu, s.rss_pico_delta_mb,
+             s.filas, s.tid, json.dumps(s.atributos, default=str), s.error)
+            for s in spans
+        ])
+        return len(spans)
+
+TRAZADOR = Trazador()
+
+def span(nombre, filas=None, **atributos):
+    """
+    Medir un bloque como etapa del pipeline
+
+    Args:
+        nombre (str): Nombre de la etapa (el prefijo antes del punto es la categoría)
+        filas (int): Filas procesadas (opcional; se puede fijar después en el span)
+        **atributos: Información adicional (archivo, modelo, endpoint...)
+    """
+    return Span(nombre, filas, atributos)
+
+def _filas_de(args):
+    """Filas del primer argumento tabular (DataFrame/array)"""
+    for arg in args:
+        if hasattr(arg, 'shape') and hasattr(arg, '__len__'):
+            return len(arg)
+    return None
+
+def trazado(nombre=None):
+    """Decorador: cada llamada es un span con las filas del primer DataFrame/array recibido"""
+
+    def decorador(funcion):
+        nombre_span = nombre or funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with Span(nombre_span, _filas_de(args)):
+                return funcion(*args, **kwargs)
+
+        return envoltura
+
+    return decorador
+
+def leer_csv(ruta, **kwargs):
+    """pd.read_csv medido como span 'csv.leer'"""
+    import pandas as pd
+
+    with Span('csv.leer', atributos={'archivo': str(ruta)}) as s:
+        df = pd.read_csv(ruta, **kwargs)
+        s.filas = len(df)
+    return df
+
+def escribir_csv(df, ruta, **kwargs):
+    """df.to_csv medido como span 'csv.escribir'"""
+    with Span('csv.escribir', len(df), {'archivo': str(ruta)}):
+        df.to_csv(ruta, **kwargs)
+
+def exportar(db_path=None, archivo=None, max_archivos=None):
+    """
+    Vaciar los spans registrados hacia la base de datos y/o un archivo Chrome trace
+
+    Args:
+        db_path: Base SQLite donde guardar los spans (tabla spans)
+        archivo: JSON Chrome trace a escribir
+        max_archivos (int): Trazas JSON que se conservan en el directorio de `archivo`
+
+    Returns:
+        int: Spans exportados
+    """
+
+    spans = TRAZADOR.vaciar()
+    if spans and db_path:
+        TRAZADOR.exportar_sqlite(db_path, spans)
+    if spans and archivo:
+        TRAZADOR.exportar_chrome(archivo, spans)
+        if max_archivos:
+            antiguos = sorted(Path(archivo).parent.glob('*.json'), key=lambda p: p.stat().st_mtime)[:-max_archivos]
+            for ruta in antiguos:
+                ruta.unlink(missing_ok=True)
+    return len(spans)
@@ -0,0 +1,333 @@
+# ================================
+# 🛡️ ENTRENAMIENTO PROTEGIDO CONTRA OOM
+# ================================
+# Cada intento de entrenamiento corre en un proceso propio vigilado por RSS
+# (proceso + workers de joblib). Si se acerca al límite o el sistema se queda
+# sin memoria, se mata antes de que actúe el OOM killer y se reintenta con un
+# plan más barato: menos workers, float32, menos árboles, submuestreo.
+
+import os
+import sys
+import json
+import time
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+
+import psutil
+
+from production_config import ProductionConfig, cola_logging
+from supervisor_procesos import CONTEXTO_MP, configurar_logging_hijo, memoria_arbol_mb, terminar_arbol
+
+sys.path.append(str(Path(__file__).parent.parent))
+from automatizacion import calcularf1_score, mejora_iterativa, trazas
+from automatizacion.registro_modelos import RegistroModelos
+
+def _workers(n_jobs):
+    """n_jobs efectivo (-1 = todos los cores)"""
+    return n_jobs if n_jobs > 0 else max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+
+# Escalones de degradación, del más barato en calidad al más caro
+PASOS_DEGRADACION = [
+    ('menos_workers_float32', lambda plan: {'n_jobs': max(1, _workers(plan['n_jobs']) // 2), 'float32': True}),
+    ('un_worker_menos_arboles', lambda plan: {'n_jobs': 1, 'factor_arboles': plan['factor_arboles'] * 0.5}),
+    ('submuestreo', lambda plan: {'fraccion_muestra': plan['fraccion_muestra'] * 0.5}),
+    ('minimo', lambda plan: {'factor_arboles': plan['factor_arboles'] * 0.5,
+                             'fraccion_muestra': plan['fraccion_muestra'] * 0.5}),
+]
+
+INTERVALO_VIGILANCIA = 1.0
+GRACIA_CANCELACION = 10
+
+def _mejorar(archivo_train, n_jobs, fraccion_muestra, float32, factor_arboles, degradacion):
+    """Un intento de mejora iterativa (se ejecuta en el proceso del intento)"""
+
+    try:
+        with trazas.span('entrenamiento.intento', n_jobs=n_jobs, fraccion_muestra=fraccion_muestra,
+                         float32=float32, factor_arboles=factor_arboles):
+            _, score, historial = mejora_iterativa.mejorar_modelo_automatico(
+                archivo_train,
+                n_jobs=n_jobs,
+                fraccion_muestra=fraccion_muestra,
+                float32=float32,
+                factor_arboles=factor_arboles,
+                degradacion=degradacion
+            )
+    finally:
+        # Los spans viven en este proceso: exportarlos antes de que termine (también si falla)
+        exportar_trazas('entrenamiento')
+
+    # El modelo no se devuelve: nadie lo usa y serializarlo por la tubería
+    # duplicaría el pico de memoria justo al final del intento
+    return {
+        'score': score,
+        'historial': historial,
+        'mejora_obtenida': sum(exp['diferencia'] for exp in historial if exp['mejora'])
+    }
+
+def entrenar_modelo_submission(archivo_train, n_jobs, fraccion_muestra, float32, factor_arboles, degradacion,
+                               directorio_registro, modelo_previo=None):
+    """
+    Entrenar (o actualizar) el ModeloCoronario que se sube y registrarlo (proceso del intento)
+
+    Del plan solo se aplica n_jobs: el modelo de submission se entrena siempre
+    con el archivo completo para que su huella y su estado incremental sigan
+    siendo válidos. Como _mejorar, no devuelve el modelo sino su hash en el
+    registro, de donde lo carga AutoTrainingSystem.
+
+    Args:
+        directorio_registro (str): Registro de modelos de AutoTrainingSystem
+        modelo_previo (str): Hash del último modelo de submission (actualización incremental)
+
+    Returns:
+        dict: score, modelo_hash, tiempo_entrenamiento, actualizacion
+    """
+
+    calcularf1_score.N_JOBS = n_jobs
+    registro = RegistroModelos(directorio_registro)
+
+    try:
+        with trazas.span('entrenamiento.submission', n_jobs=n_jobs, incremental=modelo_previo is not None):
+            inicio = time.perf_counter()
+
+            previo = registro.obtener(modelo_hash=modelo_previo, incremental=True) if modelo_previo else None
+            if isinstance(previo, calcularf1_score.ModeloCoronario):
+                modelo = calcularf1_score.actualizar_modelo_incremental(archivo_train, previo)
+            else:
+                modelo = calcularf1_score.entrenar_modelo_completo(archivo_train)
+
+            tiempo_entrenamiento = time.perf_counter() - inicio
+            actualizacion = dict(modelo.ultima_actualizacion or {}, archivo_train=archivo_train, degradacion=degradacion)
+            modelo_hash = registro.registrar(
+                modelo, 'auto_training',
+                f1_cv=modelo.f1_entrenamiento,
+                tiempo_entrenamiento=tiempo_entrenamiento,
+                metadatos=actualizacion,
+                incremental=True  # El siguiente ciclo parte de este estado
+            )
+    finally:
+        exportar_trazas('entrenamiento')
+
+    return {
+        'score': modelo.f1_entrenamiento,
+        'modelo_hash': modelo_hash,
+        'tiempo_entrenamiento': tiempo_entrenamiento,
+        'actualizacion': actualizacion
+    }
+
+def exportar_trazas(prefijo):
+    """Guardar los spans del proceso en la DB de métricas y en un JSON Chrome trace"""
+
+    try:
+        archivo = ProductionConfig.TRACES_DIR / f"{prefijo}_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.json"
+        n = trazas.exportar(ProductionConfig.METRICS_DB_PATH, archivo, max_archivos=ProductionConfig.TRACES_MAX_FILES)
+        if n:
+            logging.getLogger(__name__).info(f"⏱️ {n} spans exportados a {archivo}")
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"No se pudieron exportar las trazas: {e}")
+
+def _ejecutar_intento(conexion, funcion, kwargs, nivel_log, cola_log):
+    """Punto de entrada del proceso del intento: devuelve (estado, valor) por la tubería"""
+
+    configurar_logging_hijo(nivel_log, cola_log)
+    try:
+        conexion.send(('ok', funcion(**kwargs)))
+    except MemoryError:
+        conexion.send(('memoria', 'MemoryError'))
+    except BrokenProcessPool as e:
+        # Un worker de joblib/loky muerto (TerminatedWorkerError, normalmente SIGKILL
+        # del OOM killer) es falta de memoria aunque el intento siga vivo
+        conexion.send(('memoria', f"{type(e).__name__}: {e}"))
+    except Exception as e:
+        conexion.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        conexion.close()
+
+def ejecutar_vigilado(funcion, kwargs, limite_mb, minimo_libre_mb=0, latido=None, debe_parar=None,
+                      intervalo=INTERVALO_VIGILANCIA):
+    """
+    Ejecutar funcion(**kwargs) en un proceso aparte vigilando su memoria
+
+    Args:
+        funcion (callable): Función de módulo (picklable)
+        kwargs (dict): Argumentos de la función
+        limite_mb (float): RSS máximo del proceso y sus descendientes
+        minimo_libre_mb (float): Memoria libre del sistema por debajo de la cual se cancela
+        latido (callable): Se llama en cada vuelta de vigilancia (heartbeat del supervisor)
+        debe_parar (callable): Si devuelve True, el intento se cancela
+
+    Returns:
+        tuple: (estado, valor, pico_mb) con estado 'ok', 'memoria', 'error' o 'cancelado'
+    """
+
+    recibir, enviar = CONTEXTO_MP.Pipe(duplex=False)
+    proceso = CONTEXTO_MP.Process(
+        target=_ejecutar_intento,
+        args=(enviar, funcion, kwargs, logging.getLogger().getEffectiveLevel(), cola_logging()),
+        name='entrenamiento'
+    )
+    proceso.start()
+    enviar.close()
+
+    raiz = psutil.Process(proceso.pid)
+    pico = 0.0
+
+    try:
+        while True:
+            if latido:
+                latido()
+
+            # El resultado puede ser grande: leerlo en cuanto esté, antes de join()
+            if recibir.poll(intervalo):
+                try:
+                    estado, valor = recibir.recv()
+                except EOFError:
+                    break
+                proceso.join()
+                return estado, valor, pico
+
+            if not proceso.is_alive():
+                break
+
+            memoria = memoria_arbol_mb(raiz)
+            pico = max(pico, memoria)
+
+            if memoria > limite_mb:
+                terminar_arbol(raiz, GRACIA_CANCELACION)
+                return 'memoria', f"RSS {memoria:.0f}MB > límite {limite_mb:.0f}MB", pico
+
+            libre = psutil.virtual_memory().available / 1024**2
+            if libre < minimo_libre_mb:
+                terminar_arbol(raiz, GRACIA_CANCELACION)
+                return 'memoria', f"memoria libre del sistema {libre:.0f}MB < {minimo_libre_mb:.0f}MB", pico
+
+            if debe_parar and debe_parar():
+                terminar_arbol(raiz, GRACIA_CANCELACION)
+                return 'cancelado', 'parada solicitada', pico
+    finally:
+        recibir.close()
+
+    # Terminó sin enviar nada: SIGKILL (OOM killer del kernel) o muerte abrupta
+    proceso.join()
+    if proceso.exitcode == -9:
+        return 'memoria', 'proceso matado con SIGKILL (OOM killer)', pico
+    return 'error', f"proceso terminó sin resultado (código {proceso.exitcode})", pico
+
+def planes_degradados(plan):
+    """
+    Secuencia de planes: el original y luego cada escalón de PASOS_DEGRADACION acumulado
+
+    Args:
+        plan (dict): n_jobs, fraccion_muestra, float32, factor_arboles
+
+    Yields:
+        tuple: (nombre del paso, plan)
+    """
+
+    plan = dict(plan)
+    yield 'original', dict(plan)
+
+    for nombre, paso in PASOS_DEGRADACION:
+        plan.update(paso(plan))
+        yield nombre, dict(plan)
+
+def registrar_historial(ruta, registro):
+    """Añadir una ejecución al historial de entrenamiento (una línea JSON por ejecución)"""
+
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, 'a') as f:
+        f.write(json.dumps(registro, default=str) + '\n')
+
+def entrenar_protegido(archivo_train, plan, limite_mb, minimo_libre_mb=0, fraccion_minima=0.0,
+                       latido=None, debe_parar=None, funcion=_mejorar, historial=None, argumentos=None):
+    """
+    Mejora iterativa con degradación y reintento ante falta de memoria
+
+    Args:
+        archivo_train (str): Archivo de entrenamiento
+        plan (dict): Plan inicial (GobernadorRecursos.plan_entrenamiento): n_jobs, fraccion_muestra
+        limite_mb (float): RSS máximo de cada intento
+        minimo_libre_mb (float): Memoria libre del sistema que no se debe rebasar
+        fraccion_minima (float): No se submuestrea por debajo de esta fracción
+        latido, debe_parar (callable): Integración con el supervisor (ContextoTarea)
+        funcion (callable): Función de entrenamiento (por defecto, mejorar_modelo_automatico)
+        historial (str): Archivo JSONL donde registrar la ejecución y su camino de degradación
+        argumentos (dict): Argumentos extra para `funcion` (además del plan)
+
+    Returns:
+        dict: Resultado del intento que terminó (score, historial, mejora_obtenida)
+              más 'degradacion' (intentos fallidos) y 'plan' (el que funcionó);
+              None si se canceló o se agotaron los planes
+    """
+
+    logger = logging.getLogger(__name__)
+    plan_base = {
+        'n_jobs': plan.get('n_jobs', -1),
+        'fraccion_muestra': plan.get('fraccion_muestra', 1.0),
+        'float32': plan.get('float32', False),
+        'factor_arboles': plan.get('factor_arboles', 1.0)
+    }
+    degradacion = []
+    inicio_total = datetime.now().isoformat()
+
+    def _registrar(estado, plan_final=None, score=None):
+        if historial:
+            registrar_historial(historial, {
+                'inicio': inicio_total,
+                'fin': datetime.now().isoformat(),
+                'estado': estado,
+                'plan_inicial': plan_base,
+                'plan_final': plan_final,
+                'score': score,
+                'degradacion': degradacion
+            })
+
+    for paso, plan_intento in planes_degradados(plan_base):
+        if plan_intento['fraccion_muestra'] < fraccion_minima:
+            logger.warning(f"Plan '{paso}' por debajo de la fracción mínima ({fraccion_minima:.0%}), se descarta")
+            break
+
+        logger.info(f"🛡️ Intento '{paso}': {plan_intento}")
+        inicio = time.time()
+        estado, valor, pico = ejecutar_vigilado(
+            funcion,
+            dict(argumentos or {}, **plan_intento, archivo_train=archivo_train, degradacion=list(degradacion)),
+            limite_mb,
+            minimo_libre_mb=minimo_libre_mb,
+            latido=latido,
+            debe_parar=debe_parar
+        )
+
+        if estado == 'ok':
+            valor['degradacion'] = degradacion
+            valor['plan'] = dict(plan_intento, paso=paso)
+            if degradacion:
+                logger.info(f"✅ Entrenamiento completado tras degradar: {' -> '.join(d['paso'] for d in degradacion)} -> {paso}")
+            _registrar('ok', valor['plan'], valor.get('score'))
+            return valor
+
+        if estado == 'cancelado':
+            logger.info("🛑 Entrenamiento cancelado")
+            _registrar('cancelado', plan_intento)
+            return None
+
+        if estado == 'error':
+            # Un error que no es de memoria no se arregla con un plan más barato
+            _registrar('error', plan_intento)
+            raise RuntimeError(f"Error en entrenamiento ({paso}): {valor}")
+
+        degradacion.append({
+            'paso': paso,
+            'plan': plan_intento,
+            'motivo': valor,
+            'pico_memoria_mb': round(pico, 1),
+            'segundos': round(time.time() - inicio, 1),
+            'timestamp': datetime.now().isoformat()
+        })
+        logger.warning(f"⚠️ Intento '{paso}' sin memoria ({valor}); probando un plan más barato")
+
+    logger.error(f"❌ Entrenamiento sin memoria suficiente tras {len(degradacion)} intentos")
+    _registrar('sin_memoria')
+    return None
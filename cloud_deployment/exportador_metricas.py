@@ -0,0 +1,366 @@
+# ================================
+# 📈 EXPORTADOR DE MÉTRICAS (formato de texto Prometheus)
+# ================================
+# Endpoint HTTP local /metrics con el estado del sistema, de los procesos
+# supervisados, de las etapas del pipeline (spans), del presupuesto de
+# submissions y de las colas. Un único thread de refresco regenera el texto
+# cada pocos segundos (solo lee estado ya calculado o SQLite en WAL, así que
+# nunca bloquea a los threads del pipeline) y cada scrape devuelve el último
+# texto: los threads HTTP, uno por petición, no abren conexiones a SQLite.
+
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from production_config import ProductionConfig
+
+sys.path.append(str(Path(__file__).parent.parent))
+from automatizacion.base_datos import ConexionSQLite
+
+PREFIJO = 'neurokup'
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites (segundos) de los histogramas de latencia por etapa
+BUCKETS_ETAPAS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 1800, 3600)
+BUCKETS_ENTRENAMIENTO = (60, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+MAX_SPANS_POR_SCRAPE = 10000    # El resto se lee en los siguientes scrapes
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in sorted(etiquetas.items())) + '}'
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor))
+
+class Histograma:
+    """Histograma acumulado (buckets cumulativos, suma y número de observaciones)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.cuentas = [0] * len(self.buckets)
+        self.suma = 0.0
+        self.n = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.cuentas[i] += 1
+        self.suma += valor
+        self.n += 1
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas con etiquetas, y su serialización en formato de texto
+
+    Los gauges no se guardan aquí: se calculan en cada generación a partir de
+    las fuentes registradas en ExportadorMetricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._familias = {}    # nombre -> (tipo, ayuda, {etiquetas: valor | Histograma})
+
+    def _serie(self, nombre, tipo, ayuda, etiquetas, inicial):
+        familia = self._familias.setdefault(nombre, (tipo, ayuda, {}))
+        clave = tuple(sorted(etiquetas.items()))
+        if clave not in familia[2]:
+            familia[2][clave] = inicial()
+        return familia[2], clave
+
+    def incrementar(self, nombre, ayuda, valor=1, **etiquetas):
+        with self._lock:
+            series, clave = self._serie(nombre, 'counter', ayuda, etiquetas, float)
+            series[clave] += valor
+
+    def observar(self, nombre, ayuda, valor, buckets=BUCKETS_ETAPAS, **etiquetas):
+        with self._lock:
+            series, clave = self._serie(nombre, 'histogram', ayuda, etiquetas, lambda: Histograma(buckets))
+            series[clave].observar(valor)
+
+    def texto(self, gauges=()):
+        """
+        Serializar contadores, histogramas y los gauges recibidos
+
+        Args:
+            gauges (iterable): (nombre, ayuda, etiquetas, valor)
+
+        Returns:
+            str: Exposición en formato de texto Prometheus 0.0.4
+        """
+
+        familias = {}
+        for nombre, ayuda, etiquetas, valor in gauges:
+            if valor is not None:
+                familias.setdefault(nombre, ('gauge', ayuda, {}))[2][tuple(sorted(etiquetas.items()))] = valor
+
+        lineas = []
+        with self._lock:
+            todas = dict(self._familias, **familias)
+            for nombre, (tipo, ayuda, series) in sorted(todas.items()):
+                metrica = f'{PREFIJO}_{nombre}'
+                lineas.append(f'# HELP {metrica} {ayuda}')
+                lineas.append(f'# TYPE {metrica} {tipo}')
+
+                for clave, valor in series.items():
+                    etiquetas = dict(clave)
+                    if tipo != 'histogram':
+                        lineas.append(f'{metrica}{_etiquetas(etiquetas)} {_numero(valor)}')
+                        continue
+
+                    for limite, cuenta in zip(valor.buckets, valor.cuentas):
+                        lineas.append(f'{metrica}_bucket{_etiquetas(dict(etiquetas, le=_numero(limite)))} {cuenta}')
+                    lineas.append(f'{metrica}_bucket{_etiquetas(dict(etiquetas, le="+Inf"))} {valor.n}')
+                    lineas.append(f'{metrica}_sum{_etiquetas(etiquetas)} {_numero(valor.suma)}')
+                    lineas.append(f'{metrica}_count{_etiquetas(etiquetas)} {valor.n}')
+
+        return '\n'.join(lineas) + '\n'
+
+class ExportadorMetricas:
+    """
+    Servidor HTTP de métricas para Prometheus (GET /metrics)
+
+    Fuentes:
+      - última muestra de SystemMonitor (CPU, memoria, disco, red, carga)
+      - SupervisorProcesos: procesos vivos, pausados, reinicios y memoria
+      - spans de la DB de métricas: latencia por etapa, duración de los
+        ciclos de entrenamiento, fits por modelo y filas predichas
+      - DB de submissions: submissions de hoy frente al límite diario y pendientes
+      - colas: buffer de MetricsDatabase y las que se añadan con fuente()
+    """
+
+    def __init__(self, monitor=None, supervisor=None, metrics_db=None, host=None, puerto=None,
+                 cache_segundos=None, db_submissions=None, limite_submissions=None):
+        """
+        Args:
+            monitor (SystemMonitor): Última muestra de métricas del sistema
+            supervisor (SupervisorProcesos): Estado de los procesos hijos
+            metrics_db (MetricsDatabase): Tabla de spans y buffer de métricas
+            host, puerto: Dirección de escucha (por defecto solo local)
+            cache_segundos (float): Tiempo que se reutiliza el texto generado
+            db_submissions: Base SQLite de submissions (api_submission_automatica)
+            limite_submissions (int): Submissions permitidas por día
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.monitor = monitor
+        self.supervisor = supervisor
+        self.metrics_db = metrics_db
+        self.host = host or ProductionConfig.METRICS_EXPORTER_HOST
+        self.puerto = ProductionConfig.METRICS_EXPORTER_PORT if puerto is None else puerto
+        self.cache_segundos = ProductionConfig.METRICS_EXPORTER_CACHE_SECONDS if cache_segundos is None else cache_segundos
+        self.db_submissions = db_submissions
+        self.limite_submissions = limite_submissions
+
+        self.registro = RegistroMetricas()
+        self._fuentes = []
+        self._lock_generar = threading.Lock()
+        self._texto = None
+        self._generado = 0.0
+        self._parar = threading.Event()
+        self._inicio = time.time()
+        self._ultimo_span = self._ultimo_rowid_spans()
+
+        self.httpd = None
+        self.thread = None
+        self.thread_refresco = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.httpd.server_address[1] if self.httpd else self.puerto}/metrics"
+
+    def fuente(self, funcion):
+        """
+        Registrar una fuente de gauges adicional
+
+        Args:
+            funcion (callable): Devuelve un iterable de (nombre, ayuda, etiquetas, valor)
+        """
+        self._fuentes.append(funcion)
+        return funcion
+
+    # ---------- Fuentes ----------
+
+    def _ultimo_rowid_spans(self):
+        # Los contadores empiezan con el proceso: los spans anteriores no se cuentan
+        if self.metrics_db is None:
+            return 0
+        try:
+            (rowid,) = self.metrics_db.db.consultar_uno('SELECT COALESCE(MAX(rowid), 0) FROM spans')
+            return rowid
+        except Exception:
+            return 0
+
+    def _leer_spans(self):
+        """Pasar a contadores e histogramas los spans nuevos desde el último scrape"""
+
+        if self.metrics_db is None:
+            return
+
+        filas = self.metrics_db.db.consultar('''
+            SELECT rowid, nombre, duracion, filas, error
+            FROM spans
+            WHERE rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+        ''', (self._ultimo_span, MAX_SPANS_POR_SCRAPE))
+
+        for rowid, nombre, duracion, filas_span, error in filas:
+            self._ultimo_span = rowid
+            categoria, _, detalle = nombre.partition('.')
+
+            self.registro.observar('stage_duration_seconds', 'Duración de cada etapa del pipeline',
+                                   duracion, stage=nombre)
+            if error:
+                self.registro.incrementar('stage_errors_total', 'Etapas terminadas con excepción',
+                                          stage=nombre, error=error)
+
+            if nombre == 'entrenamiento.intento':
+                self.registro.observar('training_cycle_duration_seconds', 'Duración de cada intento de entrenamiento',
+                                       duracion, buckets=BUCKETS_ENTRENAMIENTO, status='error' if error else 'ok')
+            elif categoria == 'fit':
+                self.registro.incrementar('model_fits_total', 'Entrenamientos de modelos (fit)', model=detalle)
+            elif categoria == 'predict_proba' and filas_span:
+                self.registro.incrementar('predicted_rows_total', 'Filas predichas', filas_span, model=detalle)
+                self.registro.incrementar('prediction_seconds_total', 'Tiempo dedicado a predecir',
+                                          duracion, model=detalle)
+
+    def _gauges_sistema(self):
+        ultima = self.monitor.historial.ultima() if self.monitor is not None else None
+        if ultima is not None:
+            yield 'system_cpu_percent', 'Uso de CPU del sistema', {}, ultima['cpu_percent'].item()
+            yield 'system_memory_percent', 'Memoria del sistema en uso', {}, ultima['memory_percent'].item()
+            yield 'system_memory_available_bytes', 'Memoria disponible', {}, ultima['memory_available_mb'].item() * 1024**2
+            yield 'system_disk_percent', 'Disco en uso', {}, ultima['disk_percent'].item()
+            yield 'system_disk_free_bytes', 'Disco libre', {}, ultima['disk_free_gb'].item() * 1024**3
+            yield 'system_load_average', 'Carga media (1 min)', {}, ultima['load_average'].item()
+            yield 'system_network_sent_bytes', 'Bytes enviados por la red desde el arranque', {}, ultima['network_bytes_sent'].item()
+            yield 'system_network_received_bytes', 'Bytes recibidos por la red desde el arranque', {}, ultima['network_bytes_recv'].item()
+            yield 'process_tree_resident_memory_bytes', 'RSS del proceso principal y sus hijos', {}, ultima['process_tree_memory_mb'].item() * 1024**2
+            yield 'metrics_sample_timestamp_seconds', 'Momento de la última muestra del monitor', {}, ultima['timestamp'].item()
+
+        yield 'process_start_time_seconds', 'Arranque del proceso principal', {}, self._inicio
+
+    def _gauges_procesos(self):
+        if self.supervisor is None:
+            return
+        for nombre, estado in self.supervisor.estado().items():
+            etiquetas = {'task': nombre}
+            yield 'task_up', 'Proceso supervisado vivo', etiquetas, int(estado['vivo'])
+            yield 'task_paused', 'Proceso supervisado pausado por falta de recursos', etiquetas, int(estado['pausada'])
+            yield 'task_restarts', 'Reinicios del proceso supervisado', etiquetas, estado['reinicios']
+            yield 'task_resident_memory_bytes', 'RSS del proceso supervisado y sus hijos', etiquetas, estado['memoria_mb'] * 1024**2
+            yield 'task_heartbeat_age_seconds', 'Segundos desde el último latido', etiquetas, estado['segundos_sin_latido']
+
+    def _gauges_submissions(self):
+        if not self.db_submissions or not os.path.exists(self.db_submissions):
+            return
+
+        db = ConexionSQLite.compartida(self.db_submissions)
+        hoy = datetime.now(timezone.utc).date()
+        (hoy_n,) = db.consultar_uno(
+            'SELECT COUNT(*) FROM submissions WHERE timestamp >= ? AND timestamp < ?',
+            (hoy.isoformat(), (hoy + timedelta(days=1)).isoformat())
+        )
+        (pendientes,) = db.consultar_uno("SELECT COUNT(*) FROM submissions WHERE status = 'pending'")
+
+        yield 'submissions_today', 'Submissions realizadas hoy', {}, hoy_n
+        if self.limite_submissions:
+            yield 'submissions_daily_limit', 'Submissions permitidas por día', {}, self.limite_submissions
+            yield 'submission_budget_used_ratio', 'Fracción del límite diario usada', {}, hoy_n / self.limite_submissions
+        yield 'queue_depth', 'Elementos en espera por cola', {'queue': 'submissions_pending'}, pendientes
+
+    def _gauges_colas(self):
+        if self.metrics_db is not None:
+            yield 'queue_depth', 'Elementos en espera por cola', {'queue': 'metrics_buffer'}, self.metrics_db.pendientes()
+
+    def generar(self):
+        """Texto de /metrics (reutilizado durante cache_segundos)"""
+
+        if self._texto is not None and time.monotonic() - self._generado < self.cache_segundos:
+            return self._texto
+        return self._regenerar()
+
+    def _regenerar(self):
+        with self._lock_generar:
+            gauges = []
+            for fuente in (self._leer_spans, self._gauges_sistema, self._gauges_procesos,
+                           self._gauges_submissions, self._gauges_colas, *self._fuentes):
+                try:
+                    gauges.extend(fuente() or ())
+                except Exception as e:
+                    self.logger.warning(f"Fuente de métricas {getattr(fuente, '__name__', fuente)} falló: {e}")
+
+            self._texto = self.registro.texto(gauges)
+            self._generado = time.monotonic()
+            return self._texto
+
+    def _refrescar(self):
+        """Regenerar el texto cada cache_segundos (thread de larga duración)"""
+
+        while not self._parar.wait(self.cache_segundos):
+            try:
+                self._regenerar()
+            except Exception as e:
+                self.logger.warning(f"Error generando métricas: {e}")
+
+    # ---------- HTTP ----------
+
+    def _crear_handler(self):
+        exportador = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                # Solo el texto ya generado: nada de SQLite en este thread
+                datos = exportador._texto.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', TIPO_CONTENIDO)
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+        return Handler
+
+    def iniciar(self):
+        """Arrancar el servidor y el thread de refresco (daemon)"""
+
+        self._regenerar()
+        self._parar.clear()
+        self.thread_refresco = threading.Thread(target=self._refrescar, name='metricas_refresco', daemon=True)
+        self.thread_refresco.start()
+
+        self.httpd = _ServidorHTTP((self.host, self.puerto), self._crear_handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metricas_http', daemon=True)
+        self.thread.start()
+        self.logger.info(f"📈 Métricas en {self.url}")
+
+    def detener(self):
+        self._parar.set()
+        if self.thread_refresco is not None:
+            self.thread_refresco.join(timeout=5)
+            self.thread_refresco = None
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
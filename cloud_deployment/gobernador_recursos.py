@@ -0,0 +1,161 @@
+# ================================
+# 🎛️ GOBERNADOR DE RECURSOS
+# ================================
+# Decide, con las métricas de SystemMonitor.collect_metrics, cuántos workers y
+# cuánta memoria puede usar cada entrenamiento, cuándo submuestrear o aplazar,
+# y cuándo pausar las tareas de baja prioridad (backups)
+
+import os
+import time
+import logging
+
+from production_config import ProductionConfig
+
+class GobernadorRecursos:
+    """
+    Presupuesto de CPU/memoria a partir de métricas del sistema
+
+    Se usa en dos sitios:
+      - en el proceso de ML, antes de cada entrenamiento: plan_entrenamiento()
+      - en el proceso principal, en cada vuelta del monitoreo: actualizar() y
+        pausar_baja_prioridad(), que el supervisor aplica a los backups
+    """
+
+    def __init__(self, monitor=None, memoria_max_mb=None, reserva_memoria_mb=None,
+                 cpu_max_percent=None, memoria_worker_mb=None, factor_datos=None,
+                 fraccion_minima=None, umbral_pausa_mb=None):
+        """
+        Args:
+            monitor (SystemMonitor): Fuente de métricas (collect_metrics)
+            memoria_max_mb (float): Tope de memoria del árbol de procesos de ML
+            reserva_memoria_mb (float): Memoria que se deja libre para el sistema y el proceso principal
+            cpu_max_percent (float): Uso de CPU total que no se debe superar
+            memoria_worker_mb (float): Memoria mínima por worker de entrenamiento
+            factor_datos (float): Copias de los datos que necesita cada worker
+            fraccion_minima (float): Submuestreo máximo antes de aplazar el entrenamiento
+            umbral_pausa_mb (float): Margen de memoria por debajo del cual se pausan los backups
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.monitor = monitor
+        self.memoria_max_mb = memoria_max_mb or ProductionConfig.ML_MEMORY_LIMIT_MB
+        self.reserva_memoria_mb = reserva_memoria_mb or ProductionConfig.GOVERNOR_MEMORY_RESERVE_MB
+        self.cpu_max_percent = cpu_max_percent or ProductionConfig.MAX_CPU_PERCENT
+        self.memoria_worker_mb = memoria_worker_mb or ProductionConfig.GOVERNOR_WORKER_MEMORY_MB
+        self.factor_datos = factor_datos or ProductionConfig.GOVERNOR_DATA_MEMORY_FACTOR
+        self.fraccion_minima = fraccion_minima or ProductionConfig.GOVERNOR_MIN_SAMPLE_FRACTION
+        self.umbral_pausa_mb = umbral_pausa_mb or ProductionConfig.GOVERNOR_PREEMPT_MEMORY_MB
+
+        self.metricas = {}
+        self.pausa_desde = None
+        self.sin_pausa_hasta = 0.0
+
+    def actualizar(self, metricas=None):
+        """Guardar las últimas métricas (se recogen con el monitor si no se pasan)"""
+
+        if metricas is None and self.monitor is not None:
+            metricas = self.monitor.collect_metrics()
+        if metricas:
+            self.metricas = metricas
+        return self.metricas
+
+    def _cores(self):
+        # Respeta la afinidad del proceso (ML_CPUS)
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    def margen_memoria_mb(self, metricas=None):
+        """Memoria disponible descontando la reserva del sistema"""
+
+        metricas = metricas or self.metricas
+        return metricas.get('memory_available_mb', 0) - self.reserva_memoria_mb
+
+    def plan_entrenamiento(self, datos_mb, memoria_actual_mb=0, metricas=None):
+        """
+        Presupuesto para un entrenamiento
+
+        Args:
+            datos_mb (float): Tamaño aproximado del dataset en memoria
+            memoria_actual_mb (float): Memoria que ya usa el proceso que va a entrenar
+            metricas (dict): Métricas del sistema (por defecto, una lectura nueva)
+
+        Returns:
+            dict: n_jobs, memoria_mb (presupuesto), fraccion_muestra (1.0 = todo),
+                  aplazar (True si ni submuestreando cabe) y motivo
+        """
+
+        metricas = self.actualizar(metricas)
+        cores = self._cores()
+
+        # CPU: los cores que quedan libres hasta cpu_max_percent (al menos uno)
+        cpu_libre = max(self.cpu_max_percent - metricas.get('cpu_percent', 0), 0) / 100
+        n_jobs_cpu = max(1, min(cores, int(cores * cpu_libre + 0.5)))
+
+        # Memoria: lo que queda libre en el sistema, sin pasar del tope del proceso de ML
+        presupuesto = min(self.margen_memoria_mb(metricas), self.memoria_max_mb - memoria_actual_mb)
+        memoria_worker = max(self.memoria_worker_mb, datos_mb * self.factor_datos)
+        n_jobs_memoria = int(presupuesto // memoria_worker)
+
+        n_jobs = max(1, min(n_jobs_cpu, n_jobs_memoria))
+        fraccion = 1.0
+        motivo = None
+
+        # Ni un worker cabe con todos los datos: submuestrear en proporción
+        if presupuesto < memoria_worker:
+            fraccion = max(presupuesto, 0) / memoria_worker
+            motivo = f"memoria insuficiente ({presupuesto:.0f}MB para {memoria_worker:.0f}MB por worker)"
+        elif n_jobs < n_jobs_cpu:
+            motivo = f"paralelismo limitado por memoria ({presupuesto:.0f}MB)"
+        elif n_jobs < cores:
+            motivo = f"paralelismo limitado por CPU ({metricas.get('cpu_percent', 0):.0f}% en uso)"
+
+        plan = {
+            'n_jobs': n_jobs,
+            'memoria_mb': max(presupuesto, 0),
+            'fraccion_muestra': round(min(fraccion, 1.0), 3),
+            'aplazar': fraccion < self.fraccion_minima,
+            'motivo': motivo
+        }
+
+        self.logger.info(f"🎛️ Plan de entrenamiento: {plan}")
+        return plan
+
+    def pausar_baja_prioridad(self, metricas=None, max_pausa_segundos=None):
+        """
+        ¿Deben estar pausadas las tareas de baja prioridad (backups)?
+
+        Se pausan cuando el margen de memoria baja de umbral_pausa_mb o la CPU
+        supera cpu_max_percent, y se reanudan con histéresis (el doble de margen
+        y 10 puntos menos de CPU). Una pausa nunca dura más de max_pausa_segundos;
+        tras una pausa agotada, las tareas corren otro tanto sin volver a pausarse.
+
+        Returns:
+            bool: True si deben estar pausadas
+        """
+
+        metricas = metricas or self.metricas
+        if not metricas:
+            return False
+
+        margen = self.margen_memoria_mb(metricas)
+        cpu = metricas.get('cpu_percent', 0)
+
+        ahora = time.time()
+
+        if self.pausa_desde is None:
+            sin_margen = margen < self.umbral_pausa_mb or cpu > self.cpu_max_percent
+            if sin_margen and ahora >= self.sin_pausa_hasta:
+                self.pausa_desde = ahora
+                self.logger.warning(f"⏸️ Pausando tareas de baja prioridad (margen {margen:.0f}MB, CPU {cpu:.0f}%)")
+        else:
+            recuperado = margen > 2 * self.umbral_pausa_mb and cpu < self.cpu_max_percent - 10
+            excedida = max_pausa_segundos and ahora - self.pausa_desde > max_pausa_segundos
+            if excedida:
+                self.sin_pausa_hasta = ahora + max_pausa_segundos
+            if recuperado or excedida:
+                self.pausa_desde = None
+                self.logger.info("▶️ Reanudando tareas de baja prioridad")
+
+        return self.pausa_desde is not None
@@ -1,8 +1,10 @@
 # ================================
 # 🚀 SISTEMA PRINCIPAL PARA PRODUCCIÓN
 # ================================
-# Orquestador principal con monitoreo robusto
+# Orquestador principal con monitoreo robusto: monitoreo y health checks en
+# threads del proceso principal, ML pipeline y backups en procesos supervisados
 
+import os
 import sys
 import time
 import signal
@@ -15,14 +17,150 @@ from pathlib import Path
 
 # Imports del sistema
 sys.path.append(str(Path(__file__).parent))
-from production_config import ProductionConfig, setup_logging, SecurityManager
-from monitoring_system import SystemMonitor, NotificationManager
+from production_config import ProductionConfig, setup_logging, cola_logging, SecurityManager
+from monitoring_system import SystemMonitor, NotificationManager, MetricsDatabase
 from backup_manager import BackupManager
+from supervisor_procesos import SupervisorProcesos, TareaSupervisada, memoria_arbol_mb
+from gobernador_recursos import GobernadorRecursos
+from entrenamiento_protegido import entrenar_protegido, entrenar_modelo_submission, exportar_trazas
+from exportador_metricas import ExportadorMetricas
 
 # Imports de ML
 sys.path.append(str(Path(__file__).parent.parent))
 from automatizacion import calcularf1_score, mejora_iterativa, api_submission_automatica
 
+# ================================
+# 🧬 CICLOS DE LOS PROCESOS SUPERVISADOS
+# ================================
+# Funciones de módulo: se ejecutan en procesos hijos (spawn) y reciben un ContextoTarea
+
+ARCHIVO_TRAIN = 'train.csv'
+
+def _crear_sistema_submissions():
+    """AutoTrainingSystem con las credenciales del entorno o, si faltan, del archivo de credenciales"""
+    if ProductionConfig.KAGGLE_USERNAME and ProductionConfig.KAGGLE_KEY:
+        username, api_key = ProductionConfig.KAGGLE_USERNAME, ProductionConfig.KAGGLE_KEY
+    else:
+        username, api_key = api_submission_automatica.cargar_credenciales()
+    return api_submission_automatica.AutoTrainingSystem(username, api_key)
+
+def ciclo_ml_pipeline(contexto):
+    """Entrenamiento periódico y submission automática (proceso hijo)"""
+    logger = logging.getLogger('ml_pipeline')
+    notifier = NotificationManager()
+    gobernador = GobernadorRecursos(SystemMonitor())
+    last_training = datetime.now() - timedelta(hours=24)  # Forzar entrenamiento inicial
+    sistema_submissions = None  # AutoTrainingSystem, se crea la primera vez que hay mejora
+    modelo_submission = None    # Hash del último modelo de submission (se actualiza de forma incremental)
+    
+    while not contexto.debe_parar():
+        try:
+            contexto.latido()
+            
+            # Verificar si es hora de entrenar
+            if datetime.now() - last_training >= timedelta(hours=ProductionConfig.TRAINING_INTERVAL_HOURS):
+                # Presupuesto de CPU/memoria según las métricas actuales
+                datos_mb = os.path.getsize(ARCHIVO_TRAIN) / 1024**2 if os.path.exists(ARCHIVO_TRAIN) else 0
+                plan = gobernador.plan_entrenamiento(datos_mb, memoria_actual_mb=memoria_arbol_mb(os.getpid()))
+                
+                if plan['aplazar']:
+                    logger.warning(f"⏳ Entrenamiento aplazado: {plan['motivo']}")
+                    contexto.esperar(ProductionConfig.VERIFICATION_INTERVAL_MINUTES * 60)
+                    continue
+                
+                logger.info(f"🧠 Iniciando ciclo de entrenamiento (n_jobs={plan['n_jobs']}, "
+                            f"muestra={plan['fraccion_muestra']:.0%})...")
+                
+                # Ejecutar mejora iterativa en un proceso vigilado: si se queda sin
+                # memoria se cancela y se reintenta con un plan más barato
+                resultado = entrenar_protegido(
+                    ARCHIVO_TRAIN,
+                    plan,
+                    limite_mb=plan['memoria_mb'],
+                    minimo_libre_mb=ProductionConfig.GOVERNOR_MIN_FREE_MB,
+                    fraccion_minima=ProductionConfig.GOVERNOR_MIN_SAMPLE_FRACTION,
+                    latido=contexto.latido,
+                    debe_parar=contexto.debe_parar,
+                    historial=ProductionConfig.TRAINING_HISTORY_PATH
+                )
+                
+                # El entrenamiento ya se hizo: aunque la submission falle, no repetirlo
+                # hasta el siguiente intervalo
+                last_training = datetime.now()
+                
+                if resultado and resultado['degradacion']:
+                    notifier.send_notification(
+                        "⚠️ Entrenamiento degradado por memoria",
+                        f"Plan final: {resultado['plan']}",
+                        priority='warning'
+                    )
+                
+                if resultado and resultado.get('mejora_obtenida', 0) > ProductionConfig.MIN_IMPROVEMENT_THRESHOLD:
+                    logger.info(f"✅ Mejora obtenida: {resultado['mejora_obtenida']:.4f}")
+                    
+                    # Intentar submission automática: el modelo que se sube también se
+                    # entrena en un proceso vigilado, con el plan que acaba de funcionar
+                    submission_result = False
+                    try:
+                        if sistema_submissions is None:
+                            sistema_submissions = _crear_sistema_submissions()
+                        
+                        if sistema_submissions.api.submissions_restantes() <= 0:
+                            logger.warning("⚠️ Límite diario de submissions alcanzado, no se entrena el modelo de submission")
+                        else:
+                            entrenamiento = entrenar_protegido(
+                                ARCHIVO_TRAIN,
+                                resultado['plan'],
+                                limite_mb=plan['memoria_mb'],
+                                minimo_libre_mb=ProductionConfig.GOVERNOR_MIN_FREE_MB,
+                                latido=contexto.latido,
+                                debe_parar=contexto.debe_parar,
+                                historial=ProductionConfig.TRAINING_HISTORY_PATH,
+                                funcion=entrenar_modelo_submission,
+                                argumentos={
+                                    'directorio_registro': api_submission_automatica.Config.MODELS_DIR,
+                                    'modelo_previo': modelo_submission
+                                }
+                            )
+                            if entrenamiento:
+                                modelo_submission = entrenamiento['modelo_hash']
+                                submission_result = sistema_submissions.ejecutar_ciclo_completo(entrenamiento)
+                    except Exception as e:
+                        logger.error(f"Error en submission automática: {e}")
+                    
+                    if submission_result:
+                        notifier.send_notification(
+                            "🎯 Nueva submission realizada",
+                            f"Mejora: {resultado['mejora_obtenida']:.4f}"
+                        )
+                
+                exportar_trazas('ml_pipeline')  # Spans de la submission (API, CSV) de este proceso
+            
+            # Verificar cada 30 minutos
+            contexto.esperar(ProductionConfig.VERIFICATION_INTERVAL_MINUTES * 60)
+            
+        except Exception as e:
+            logger.error(f"Error en pipeline ML: {e}")
+            contexto.esperar(300)  # Esperar 5 minutos antes de reintentar
+    
+    # Enviar las notificaciones que queden en cola antes de salir
+    notifier.cerrar()
+
+def ciclo_backup(contexto):
+    """Backups automáticos periódicos (proceso hijo)"""
+    logger = logging.getLogger('backup')
+    backup_manager = BackupManager()
+    
+    while not contexto.debe_parar():
+        try:
+            # Backup cada 24 horas
+            backup_manager.create_backup()
+            contexto.esperar(ProductionConfig.BACKUP_INTERVAL_HOURS * 3600)
+            
+        except Exception as e:
+            logger.error(f"Error en backup: {e}")
+            contexto.esperar(3600)  # Reintentar en 1 hora
+
 class ProductionSystem:
     """Sistema principal para ejecutar en producción"""
     
@@ -31,8 +169,26 @@ class ProductionSystem:
         self.running = False
         self.threads = {}
         self.monitor = SystemMonitor()
+        self.metrics_db = MetricsDatabase()
         self.notifier = NotificationManager()
         self.backup_manager = BackupManager()
+        self.supervisor = SupervisorProcesos(
+            intervalo=ProductionConfig.SUPERVISOR_CHECK_SECONDS,
+            gracia=ProductionConfig.SUPERVISOR_GRACE_SECONDS,
+            notificar=self.notifier.send_notification,
+            cola_log=cola_logging()
+        )
+        self.gobernador = GobernadorRecursos(self.monitor)
+        self.exportador = ExportadorMetricas(
+            monitor=self.monitor,
+            supervisor=self.supervisor,
+            metrics_db=self.metrics_db,
+            db_submissions=api_submission_automatica.Config.DB_FILE,
+            limite_submissions=api_submission_automatica.Config.MAX_SUBMISSIONS_PER_DAY
+        )
+        self.exportador.fuente(lambda: [(
+            'queue_depth', 'Elementos en espera por cola', {'queue': 'notifications'}, self.notifier.pendientes()
+        )])
         
         # Validar configuración
         ProductionConfig.validate_config()
@@ -41,9 +197,14 @@ class ProductionSystem:
         self.logger.info("🚀 Sistema de producción inicializado")
     
     def signal_handler(self, signum, frame):
-        """Manejar señales del sistema (SIGTERM, SIGINT)"""
-        self.logger.info(f"Señal {signum} recibida. Iniciando apagado graceful...")
-        self.stop()
+        """
+        Manejar señales del sistema (SIGTERM, SIGINT)
+        
+        Solo marca la parada: el handler corre en el thread principal en medio de
+        lo que estuviera haciendo (p.ej. dentro de supervisor.estado() con su lock
+        tomado), así que stop() lo llama _main_loop al salir, no el handler.
+        """
+        self.running = False
     
     def start(self):
         """Iniciar el sistema completo"""
@@ -62,9 +223,10 @@ class ProductionSystem:
             
             # Iniciar threads del sistema
             self._start_monitoring_thread()
-            self._start_ml_pipeline_thread()
-            self._start_backup_thread()
+            self._start_supervised_processes()
             self._start_health_check_thread()
+            if ProductionConfig.METRICS_EXPORTER_ENABLED:
+                self.exportador.iniciar()
             
             self.logger.info("✅ Todos los sistemas iniciados correctamente")
             
@@ -74,8 +236,10 @@ class ProductionSystem:
                 "El sistema de ML automático está funcionando correctamente."
             )
             
-            # Loop principal
+            # Loop principal (termina cuando una señal marca la parada)
             self._main_loop()
+            self.logger.info("Señal de parada recibida. Iniciando apagado graceful...")
+            self.stop()
             
         except Exception as e:
             self.logger.error(f"❌ Error crítico en el sistema: {e}")
@@ -90,42 +254,81 @@ class ProductionSystem:
         """Loop principal del sistema"""
         while self.running:
             try:
-                # Verificar estado de threads
+                # Verificar estado de threads (los procesos los reinicia el supervisor)
                 for thread_name, thread in self.threads.items():
                     if not thread.is_alive():
                         self.logger.warning(f"Thread {thread_name} se ha detenido")
                         self.notifier.send_notification(
                             f"⚠️ Thread {thread_name} detenido",
-                            "Se intentará reiniciar automáticamente."
+                            "Se intentará reiniciar automáticamente.",
+                            priority='warning',
+                            alert_type=f'thread_stopped:{thread_name}'
                         )
                 
+                for nombre, estado in self.supervisor.estado().items():
+                    if not estado['vivo']:
+                        self.logger.info(f"Proceso {nombre} caído ({estado['ultimo_fallo']}), "
+                                         f"reinicio programado: {estado['proximo_inicio']}")
+                
                 # Dormir y verificar cada minuto
-                time.sleep(60)
+                self._dormir(60)
                 
             except KeyboardInterrupt:
                 self.logger.info("Interrupción de teclado recibida")
                 break
             except Exception as e:
                 self.logger.error(f"Error en loop principal: {e}")
-                time.sleep(60)
+                self._dormir(60)
+    
+    def _dormir(self, segundos):
+        """Esperar en pasos de 1s para atender una parada pedida por señal sin demora"""
+        fin = time.time() + segundos
+        while self.running and time.time() < fin:
+            time.sleep(1)
     
     def _start_monitoring_thread(self):
         """Iniciar thread de monitoreo del sistema"""
         def monitoring_loop():
+            ultimo_log = 0.0
             while self.running:
                 try:
-                    metrics = self.monitor.collect_metrics()
+                    metrics = self.gobernador.actualizar(self.monitor.collect_metrics())
+                    self.metrics_db.registrar(metrics)
+                    
+                    # Verificar umbrales críticos (memoria del sistema completo: principal + hijos, en MB)
+                    if metrics.get('process_tree_memory_mb', 0) > ProductionConfig.MAX_MEMORY_MB:
+                        self.notifier.send_notification(
+                            "⚠️ Uso de memoria alto",
+                            f"{metrics['process_tree_memory_mb']:.0f}MB (límite {ProductionConfig.MAX_MEMORY_MB}MB, "
+                            f"sistema al {metrics['memory_percent']:.1f}%)",
+                            priority='warning',
+                            alert_type='high_memory'
+                        )
+                    else:
+                        self.notifier.alertas.reset_alert('high_memory')
                     
-                    # Verificar umbrales críticos
-                    if metrics['memory_percent'] > ProductionConfig.MAX_MEMORY_MB:
-                        self.logger.warning(f"Uso de memoria alto: {metrics['memory_percent']:.1f}%")
+                    if metrics.get('cpu_percent', 0) > ProductionConfig.MAX_CPU_PERCENT:
+                        self.notifier.send_notification(
+                            "⚠️ Uso de CPU alto",
+                            f"{metrics['cpu_percent']:.1f}%",
+                            priority='warning',
+                            alert_type='high_cpu'
+                        )
+                    else:
+                        self.notifier.alertas.reset_alert('high_cpu')
                     
-                    if metrics['cpu_percent'] > ProductionConfig.MAX_CPU_PERCENT:
-                        self.logger.warning(f"Uso de CPU alto: {metrics['cpu_percent']:.1f}%")
+                    # Los backups ceden CPU y memoria al entrenamiento cuando falta margen
+                    if self.gobernador.pausar_baja_prioridad(
+                        max_pausa_segundos=ProductionConfig.GOVERNOR_MAX_PAUSE_MINUTES * 60
+                    ):
+                        self.supervisor.pausar('backup')
+                    else:
+                        self.supervisor.reanudar('backup')
                     
-                    # Log métricas cada hora
-                    if datetime.now().minute == 0:
+                    # Log métricas cada hora (el detalle continuo está en /metrics)
+                    if time.time() - ultimo_log >= 3600:
                         self.logger.info(f"Métricas del sistema: {metrics}")
+                        ultimo_log = time.time()
                     
                     time.sleep(ProductionConfig.HEALTH_CHECK_INTERVAL)
                     
@@ -139,65 +342,28 @@ class ProductionSystem:
         self.threads['monitoring'] = thread
         self.logger.info("✅ Thread de monitoreo iniciado")
     
-    def _start_ml_pipeline_thread(self):
-        """Iniciar thread del pipeline de ML"""
-        def ml_pipeline_loop():
-            last_training = datetime.now() - timedelta(hours=24)  # Forzar entrenamiento inicial
-            
-            while self.running:
-                try:
-                    # Verificar si es hora de entrenar
-                    if datetime.now() - last_training >= timedelta(hours=ProductionConfig.TRAINING_INTERVAL_HOURS):
-                        self.logger.info("🧠 Iniciando ciclo de entrenamiento...")
-                        
-                        # Ejecutar mejora iterativa
-                        resultado = mejora_iterativa.mejorar_modelo_automatico()
-                        
-                        if resultado and resultado.get('mejora_obtenida', 0) > ProductionConfig.MIN_IMPROVEMENT_THRESHOLD:
-                            self.logger.info(f"✅ Mejora obtenida: {resultado['mejora_obtenida']:.4f}")
-                            
-                            # Intentar submission automática
-                            submission_result = api_submission_automatica.ejecutar_submission_automatica()
-                            
-                            if submission_result:
-                                self.notifier.send_notification(
-                                    "🎯 Nueva submission realizada",
-                                    f"Mejora: {resultado['mejora_obtenida']:.4f}"
-                                )
-                        
-                        last_training = datetime.now()
-                    
-                    # Verificar cada 30 minutos
-                    time.sleep(ProductionConfig.VERIFICATION_INTERVAL_MINUTES * 60)
-                    
-                except Exception as e:
-                    self.logger.error(f"Error en pipeline ML: {e}")
-                    time.sleep(300)  # Esperar 5 minutos antes de reintentar
-        
-        thread = threading.Thread(target=ml_pipeline_loop, name="ml_pipeline")
-        thread.daemon = True
-        thread.start()
-        self.threads['ml_pipeline'] = thread
-        self.logger.info("✅ Thread de ML pipeline iniciado")
-    
-    def _start_backup_thread(self):
-        """Iniciar thread de backups automáticos"""
-        def backup_loop():
-            while self.running:
-                try:
-                    # Backup cada 24 horas
-                    self.backup_manager.create_backup()
-                    time.sleep(ProductionConfig.BACKUP_INTERVAL_HOURS * 3600)
-                    
-                except Exception as e:
-                    self.logger.error(f"Error en backup: {e}")
-                    time.sleep(3600)  # Reintentar en 1 hora
+    def _start_supervised_processes(self):
+        """Iniciar el pipeline de ML y los backups en procesos hijos supervisados"""
+        self.supervisor.registrar(TareaSupervisada(
+            'ml_pipeline',
+            ciclo_ml_pipeline,
+            timeout_latido=ProductionConfig.ML_HEARTBEAT_TIMEOUT_MINUTES * 60,
+            memoria_max_mb=ProductionConfig.ML_MEMORY_LIMIT_MB,
+            nice=ProductionConfig.ML_NICE,
+            cpus=ProductionConfig.ML_CPUS or None,
+            backoff_max=ProductionConfig.SUPERVISOR_BACKOFF_MAX_SECONDS
+        ))
+        self.supervisor.registrar(TareaSupervisada(
+            'backup',
+            ciclo_backup,
+            timeout_latido=ProductionConfig.BACKUP_HEARTBEAT_TIMEOUT_MINUTES * 60,
+            memoria_max_mb=ProductionConfig.BACKUP_MEMORY_LIMIT_MB,
+            nice=ProductionConfig.BACKUP_NICE,
+            backoff_max=ProductionConfig.SUPERVISOR_BACKOFF_MAX_SECONDS
+        ))
         
-        thread = threading.Thread(target=backup_loop, name="backup")
-        thread.daemon = True
-        thread.start()
-        self.threads['backup'] = thread
-        self.logger.info("✅ Thread de backup iniciado")
+        self.supervisor.iniciar()
+        self.logger.info("✅ Procesos de ML pipeline y backup iniciados")
     
     def _start_health_check_thread(self):
         """Iniciar thread de health checks"""
@@ -210,8 +376,12 @@ class ProductionSystem:
                         self.logger.warning(f"Health check fallido: {health_status['issues']}")
                         self.notifier.send_notification(
                             "⚠️ Health check fallido",
-                            f"Problemas detectados: {', '.join(health_status['issues'])}"
+                            f"Problemas detectados: {', '.join(health_status['issues'])}",
+                            priority='warning',
+                            alert_type='health_check'
                         )
+                    else:
+                        self.notifier.alertas.reset_alert('health_check')
                     
                     time.sleep(300)  # Cada 5 minutos
                     
@@ -230,11 +400,18 @@ class ProductionSystem:
         self.logger.info("🛑 Deteniendo sistema...")
         self.running = False
         
+        # SIGTERM a los procesos hijos (SIGKILL si no terminan a tiempo)
+        self.supervisor.detener()
+        
         # Esperar a que los threads terminen
         for thread_name, thread in self.threads.items():
             self.logger.info(f"Esperando thread {thread_name}...")
             thread.join(timeout=30)
         
+        # Escribir las métricas que queden en el buffer
+        self.exportador.detener()
+        self.metrics_db.cerrar()
+        
         # Backup final
         try:
             self.backup_manager.create_backup()
@@ -242,6 +419,9 @@ class ProductionSystem:
         except Exception as e:
             self.logger.error(f"Error en backup final: {e}")
         
+        # Enviar las notificaciones pendientes y cerrar las conexiones SMTP/HTTP
+        self.notifier.cerrar()
+        
         self.logger.info("✅ Sistema detenido correctamente")
 
 def main():
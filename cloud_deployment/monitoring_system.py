@@ -3,60 +3,170 @@
 # ================================
 # Monitoreo robusto con alertas inteligentes
 
+import sys
+import time
+import queue
+import socket
 import psutil
-import sqlite3
 import json
+import threading
+import numpy as np
 import logging
 import smtplib
 import requests
 from datetime import datetime, timedelta
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
 from pathlib import Path
 from production_config import ProductionConfig
+from supervisor_procesos import memoria_arbol_mb
+
+sys.path.append(str(Path(__file__).parent.parent))
+from automatizacion.base_datos import ConexionSQLite
+from automatizacion.trazas import crear_tabla_spans
+
+# Historial de métricas: capacidad del buffer circular y tipos de cada campo
+CAPACIDAD_HISTORIAL = 1000
+DTYPE_METRICAS = np.dtype([
+    ('timestamp', 'f8'),               # epoch (segundos)
+    ('cpu_percent', 'f4'),
+    ('memory_percent', 'f4'),
+    ('memory_available_gb', 'f4'),
+    ('memory_available_mb', 'f4'),
+    ('disk_percent', 'f4'),
+    ('disk_free_gb', 'f4'),
+    ('network_bytes_sent', 'u8'),
+    ('network_bytes_recv', 'u8'),
+    ('process_memory_mb', 'f4'),
+    ('process_tree_memory_mb', 'f4'),
+    ('load_average', 'f4')
+])
+
+# Segundos que se reutiliza el resultado de cada sonda cara
+TTL_DISCO = 60
+TTL_ARBOL_PROCESOS = 5
+TTL_KAGGLE = 3600
+
+class BufferMetricas:
+    """
+    Buffer circular preasignado (array estructurado de NumPy) con las últimas muestras
+
+    Añadir es O(1) y sin copias; las ventanas se devuelven como arrays para
+    poder reducirlas de forma vectorizada.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_HISTORIAL, dtype=DTYPE_METRICAS):
+        self.datos = np.zeros(capacidad, dtype=dtype)
+        self.capacidad = capacidad
+        self.siguiente = 0
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacidad)
+
+    def agregar(self, muestra):
+        """Guardar una muestra (dict con los campos del dtype) sobrescribiendo la más antigua"""
+
+        self.datos[self.siguiente] = tuple(muestra.get(campo, 0) for campo in self.datos.dtype.names)
+        self.siguiente = (self.siguiente + 1) % self.capacidad
+        self.total += 1
+
+    def ultimos(self, n=None):
+        """Las últimas n muestras en orden cronológico (copia)"""
+
+        n = len(self) if n is None else min(n, len(self))
+        indices = (self.siguiente - n + np.arange(n)) % self.capacidad
+        return self.datos[indices]
+
+    def ultima(self):
+        return self.datos[(self.siguiente - 1) % self.capacidad] if len(self) else None
 
 class SystemMonitor:
     """Monitoreo del sistema en tiempo real"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.metrics_history = []
+        self.historial = BufferMetricas()
         self.alerts_sent = {}
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._proceso = psutil.Process()
+        self._cpu_anterior = psutil.cpu_times()
+    
+    @property
+    def metrics_history(self):
+        """Historial como lista de dicts (compatibilidad; para cálculos usar self.historial)"""
+        return [self._a_dict(fila) for fila in self.historial.ultimos()]
+    
+    def _a_dict(self, fila):
+        metricas = {campo: fila[campo].item() for campo in DTYPE_METRICAS.names}
+        metricas['timestamp'] = datetime.fromtimestamp(metricas['timestamp']).isoformat()
+        return metricas
+    
+    def _cacheado(self, nombre, ttl, sonda):
+        """Resultado de `sonda()` reutilizado durante `ttl` segundos"""
+        ahora = time.monotonic()
+        valor, momento = self._cache.get(nombre, (None, None))
+        if momento is None or ahora - momento > ttl:
+            valor = sonda()
+            self._cache[nombre] = (valor, ahora)
+        return valor
+    
+    def _cpu_percent(self):
+        """
+        Uso de CPU por diferencia de cpu_times desde la muestra anterior (sin dormir)
+        
+        Si apenas ha pasado tiempo desde la anterior (p.ej. la primera muestra),
+        se estima con el load average normalizado por núcleos.
+        """
+        actual = psutil.cpu_times()
+        anterior, self._cpu_anterior = self._cpu_anterior, actual
+        
+        total = sum(actual) - sum(anterior)
+        if total < 0.1 * (psutil.cpu_count() or 1):
+            if hasattr(psutil, 'getloadavg'):
+                return min(100.0, psutil.getloadavg()[0] / (psutil.cpu_count() or 1) * 100)
+            return 0.0
+        
+        ocioso = (actual.idle - anterior.idle) + (getattr(actual, 'iowait', 0) - getattr(anterior, 'iowait', 0))
+        return max(0.0, min(100.0, 100.0 * (1 - ocioso / total)))
         
     def collect_metrics(self):
         """Recopilar métricas del sistema"""
         try:
-            # Métricas de CPU y memoria
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
-            # Métricas de red
-            network = psutil.net_io_counters()
-            
-            # Métricas del proceso actual
-            process = psutil.Process()
-            process_memory = process.memory_info().rss / 1024 / 1024  # MB
-            
-            metrics = {
-                'timestamp': datetime.now().isoformat(),
-                'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
-                'memory_available_gb': memory.available / 1024**3,
-                'disk_percent': disk.percent,
-                'disk_free_gb': disk.free / 1024**3,
-                'network_bytes_sent': network.bytes_sent,
-                'network_bytes_recv': network.bytes_recv,
-                'process_memory_mb': process_memory,
-                'load_average': psutil.getloadavg()[0] if hasattr(psutil, 'getloadavg') else 0
-            }
-            
-            # Guardar en historial
-            self.metrics_history.append(metrics)
-            
-            # Mantener solo las últimas 1000 métricas
-            if len(self.metrics_history) > 1000:
-                self.metrics_history = self.metrics_history[-1000:]
+            with self._lock:
+                # Métricas de CPU y memoria
+                cpu_percent = self._cpu_percent()
+                memory = psutil.virtual_memory()
+                disk = self._cacheado('disco', TTL_DISCO, lambda: psutil.disk_usage('/'))
+                
+                # Métricas de red
+                network = psutil.net_io_counters()
+                
+                # Métricas del proceso actual (y de sus hijos: ML pipeline, backup, workers)
+                process_memory = self._proceso.memory_info().rss / 1024 / 1024  # MB
+                process_tree_memory = self._cacheado(
+                    'arbol', TTL_ARBOL_PROCESOS, lambda: memoria_arbol_mb(self._proceso)
+                )
+                
+                ahora = time.time()
+                metrics = {
+                    'timestamp': datetime.fromtimestamp(ahora).isoformat(),
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory.percent,
+                    'memory_available_gb': memory.available / 1024**3,
+                    'memory_available_mb': memory.available / 1024**2,
+                    'disk_percent': disk.percent,
+                    'disk_free_gb': disk.free / 1024**3,
+                    'network_bytes_sent': network.bytes_sent,
+                    'network_bytes_recv': network.bytes_recv,
+                    'process_memory_mb': process_memory,
+                    'process_tree_memory_mb': process_tree_memory,
+                    'load_average': psutil.getloadavg()[0] if hasattr(psutil, 'getloadavg') else 0
+                }
+                
+                # Guardar en historial (buffer circular, sin copias)
+                self.historial.agregar(dict(metrics, timestamp=ahora))
             
             return metrics
             
@@ -64,6 +174,15 @@ class SystemMonitor:
             self.logger.error(f"Error recopilando métricas: {e}")
             return {}
     
+    def _kaggle_ok(self):
+        """Autenticación con Kaggle (cara: se cachea TTL_KAGGLE segundos)"""
+        try:
+            import kaggle
+            kaggle.api.authenticate()
+            return True
+        except Exception:
+            return False
+    
     def health_check(self):
         """Verificar salud del sistema"""
         issues = []
@@ -74,13 +193,18 @@ class SystemMonitor:
             if memory.percent > 90:
                 issues.append(f"Memoria alta: {memory.percent:.1f}%")
             
-            # Verificar uso de CPU
-            cpu = psutil.cpu_percent(interval=1)
+            # Verificar uso de CPU (última muestra del monitoreo, o una nueva sin bloquear)
+            ultima = self.historial.ultima()
+            if ultima is not None and time.time() - ultima['timestamp'] < ProductionConfig.HEALTH_CHECK_INTERVAL:
+                cpu = float(ultima['cpu_percent'])
+            else:
+                with self._lock:
+                    cpu = self._cpu_percent()
             if cpu > 95:
                 issues.append(f"CPU alta: {cpu:.1f}%")
             
             # Verificar espacio en disco
-            disk = psutil.disk_usage('/')
+            disk = self._cacheado('disco', TTL_DISCO, lambda: psutil.disk_usage('/'))
             if disk.percent > 85:
                 issues.append(f"Disco lleno: {disk.percent:.1f}%")
             
@@ -95,10 +219,7 @@ class SystemMonitor:
                     issues.append(f"Archivo crítico faltante: {file_path}")
             
             # Verificar conectividad de Kaggle
-            try:
-                import kaggle
-                kaggle.api.authenticate()
-            except Exception:
+            if not self._cacheado('kaggle', TTL_KAGGLE, self._kaggle_ok):
                 issues.append("Credenciales de Kaggle inválidas")
             
             return {
@@ -117,10 +238,11 @@ class SystemMonitor:
     
     def get_system_summary(self):
         """Obtener resumen del sistema"""
-        if not self.metrics_history:
+        if not len(self.historial):
             return "No hay métricas disponibles"
         
-        latest = self.metrics_history[-1]
+        latest = self._a_dict(self.historial.ultima())
+        ventana = self.historial.ultimos(144)
         
         summary = f"""
 🖥️ **RESUMEN DEL SISTEMA**
@@ -135,22 +257,242 @@ class SystemMonitor:
 ⏰ **Timestamp:** {latest['timestamp']}
 
 📈 **Estadísticas (últimas 24h):**
-• Métricas recopiladas: {len(self.metrics_history)}
-• CPU promedio: {sum(m['cpu_percent'] for m in self.metrics_history[-144:]) / len(self.metrics_history[-144:]):.1f}%
-• Memoria promedio: {sum(m['memory_percent'] for m in self.metrics_history[-144:]) / len(self.metrics_history[-144:]):.1f}%
+• Métricas recopiladas: {len(self.historial)}
+• CPU promedio: {ventana['cpu_percent'].mean():.1f}% (máx {ventana['cpu_percent'].max():.1f}%)
+• Memoria promedio: {ventana['memory_percent'].mean():.1f}% (máx {ventana['memory_percent'].max():.1f}%)
 """
         return summary
 
+# Orden de prioridades (el resumen de un lote lleva la más alta)
+NIVELES_PRIORIDAD = {'normal': 0, 'warning': 1, 'critical': 2}
+MAX_HISTORIAL_ALERTAS = 1000    # Claves de cooldown antes de purgar las vencidas
+
+class ErrorNoReintentable(Exception):
+    """Fallo de un canal que no se arregla reintentando (p.ej. webhook inválido)"""
+
+class CanalEmail:
+    """Envío por SMTP con una conexión persistente (STARTTLS y login una sola vez)"""
+    
+    nombre = 'email'
+    
+    def __init__(self, servidor=None, puerto=None, usuario=None, password=None, destino=None,
+                 starttls=None, timeout=None):
+        self.servidor = servidor or ProductionConfig.SMTP_SERVER
+        self.puerto = puerto or ProductionConfig.SMTP_PORT
+        self.usuario = usuario or ProductionConfig.EMAIL_USER
+        self.password = password or ProductionConfig.EMAIL_PASSWORD
+        self.destino = destino or ProductionConfig.ADMIN_EMAIL
+        self.starttls = ProductionConfig.SMTP_STARTTLS if starttls is None else starttls
+        self.timeout = timeout or ProductionConfig.NOTIFY_TIMEOUT_SECONDS
+        self._smtp = None
+        self.ultimo_uso = 0.0
+    
+    def _conectar(self):
+        smtp = smtplib.SMTP(self.servidor, self.puerto, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls and smtp.has_extn('starttls'):
+                smtp.starttls()
+                smtp.ehlo()
+            # Un relay local no suele pedir credenciales
+            if self.usuario and self.password:
+                smtp.login(self.usuario, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+    
+    def _mensaje(self, titulo, mensaje, prioridad):
+        msg = MIMEMultipart()
+        msg['From'] = self.usuario or f'neurokup@{socket.gethostname()}'
+        msg['To'] = self.destino
+        asunto = f"[NeuroKup II] {titulo}"
+        
+        # Agregar prioridad al subject
+        if prioridad == 'critical':
+            asunto = f"🚨 [CRÍTICO] {asunto}"
+        elif prioridad == 'warning':
+            asunto = f"⚠️ [ALERTA] {asunto}"
+        msg['Subject'] = asunto
+        
+        # Cuerpo del mensaje
+        body = f"""
+Sistema: NeuroKup II Automation
+Servidor: {ProductionConfig.BASE_DIR}
+Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+Mensaje:
+{mensaje}
+
+---
+Este es un mensaje automático del sistema de monitoreo.
+"""
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+    
+    def enviar(self, titulo, mensaje, prioridad):
+        msg = self._mensaje(titulo, mensaje, prioridad)
+        
+        reutilizada = self._smtp is not None
+        if not reutilizada:
+            self._conectar()
+        try:
+            self._smtp.sendmail(msg['From'], [self.destino], msg.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # El servidor cerró la conexión inactiva: una reconexión inmediata
+            self.cerrar()
+            if not reutilizada:
+                raise
+            self._conectar()
+            self._smtp.sendmail(msg['From'], [self.destino], msg.as_string())
+        except Exception:
+            self.cerrar()
+            raise
+        
+        self.ultimo_uso = time.monotonic()
+    
+    def cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+class CanalSlack:
+    """Envío a un webhook de Slack (o compatible) con una sesión HTTP keep-alive"""
+    
+    nombre = 'slack'
+    
+    def __init__(self, webhook_url=None, timeout=None):
+        self.webhook_url = webhook_url or ProductionConfig.SLACK_WEBHOOK_URL
+        self.timeout = timeout or ProductionConfig.NOTIFY_TIMEOUT_SECONDS
+        self._sesion = None
+        self.ultimo_uso = 0.0
+    
+    def enviar(self, titulo, mensaje, prioridad):
+        # Determinar emoji y color según prioridad
+        if prioridad == 'critical':
+            emoji = "🚨"
+            color = "#FF0000"
+        elif prioridad == 'warning':
+            emoji = "⚠️"
+            color = "#FFA500"
+        else:
+            emoji = "ℹ️"
+            color = "#36a64f"
+        
+        payload = {
+            "text": f"{emoji} {titulo}",
+            "attachments": [{
+                "color": color,
+                "fields": [
+                    {
+                        "title": "Servidor",
+                        "value": str(ProductionConfig.BASE_DIR),
+                        "short": True
+                    },
+                    {
+                        "title": "Timestamp",
+                        "value": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        "short": True
+                    },
+                    {
+                        "title": "Mensaje",
+                        "value": mensaje,
+                        "short": False
+                    }
+                ]
+            }]
+        }
+        
+        if self._sesion is None:
+            self._sesion = requests.Session()
+        response = self._sesion.post(self.webhook_url, json=payload, timeout=self.timeout)
+        
+        # 4xx (salvo 429) no se arregla reintentando
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise ErrorNoReintentable(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        self.ultimo_uso = time.monotonic()
+    
+    def cerrar(self):
+        if self._sesion is not None:
+            self._sesion.close()
+            self._sesion = None
+
 class NotificationManager:
-    """Gestión de notificaciones (email, Slack, etc.)"""
+    """
+    Gestión de notificaciones (email, Slack, etc.) con envío en segundo plano
     
-    def __init__(self):
+    send_notification() solo registra el mensaje en el log y lo encola: un
+    thread despachador hace los envíos, así un servidor de correo lento no
+    frena el monitoreo. Los mensajes repetidos se descartan durante el
+    cooldown de AlertManager, las ráfagas se agrupan en un único resumen y
+    cada envío se reintenta un número acotado de veces. Las conexiones SMTP
+    y HTTP se reutilizan entre envíos y se cierran tras un rato sin uso.
+    """
+    
+    def __init__(self, canales=None, alertas=None, capacidad=None, ventana=None, max_lote=None,
+                 max_reintentos=None, backoff=None, inactividad=None):
+        """
+        Args:
+            canales (list): Canales de envío (por defecto, los habilitados en la configuración)
+            alertas (AlertManager): Cooldown de mensajes repetidos
+            capacidad (int): Tamaño máximo de la cola (lo que no cabe se descarta)
+            ventana (float): Segundos que se esperan más mensajes para agruparlos
+            max_lote (int): Mensajes máximos por resumen
+            max_reintentos (int): Reintentos por envío y canal
+            backoff (float): Espera base entre reintentos (exponencial)
+            inactividad (float): Segundos sin uso tras los que se cierran las conexiones
+        """
         self.logger = logging.getLogger(__name__)
         
-    def send_notification(self, title, message, priority='normal'):
-        """Enviar notificación por todos los canales configurados"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        full_message = f"[{timestamp}] {message}"
+        if canales is None:
+            canales = []
+            if ProductionConfig.EMAIL_ENABLED:
+                canales.append(CanalEmail())
+            if ProductionConfig.SLACK_ENABLED:
+                canales.append(CanalSlack())
+        self.canales = canales
+        self.alertas = alertas or AlertManager()
+        
+        self.ventana = ProductionConfig.NOTIFY_COALESCE_SECONDS if ventana is None else ventana
+        self.max_lote = max_lote or ProductionConfig.NOTIFY_MAX_BATCH
+        self.max_reintentos = ProductionConfig.NOTIFY_MAX_RETRIES if max_reintentos is None else max_reintentos
+        self.backoff = ProductionConfig.NOTIFY_RETRY_BACKOFF_SECONDS if backoff is None else backoff
+        self.inactividad = inactividad or ProductionConfig.NOTIFY_IDLE_SECONDS
+        
+        self._cola = queue.Queue(maxsize=capacidad or ProductionConfig.NOTIFY_QUEUE_SIZE)
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.descartadas = 0
+        self.enviadas = 0
+        self.fallidas = 0
+    
+    def pendientes(self):
+        """Notificaciones en cola"""
+        return self._cola.qsize()
+    
+    def send_notification(self, title, message, priority='normal', alert_type=None):
+        """
+        Registrar y encolar una notificación (no bloquea)
+        
+        Args:
+            title (str): Título
+            message (str): Mensaje
+            priority (str): 'normal', 'warning' o 'critical'
+            alert_type (str): Tipo de alerta para el cooldown; sin él se descartan
+                              solo los mensajes idénticos (mismo título y texto)
+        
+        Returns:
+            bool: False si se descartó por cooldown o por cola llena
+        """
+        clave = alert_type or f"{title}\n{message}"
+        if not self.alertas.should_send_alert(clave):
+            self.logger.debug(f"Notificación en cooldown: {title}")
+            return False
         
         # Log local
         if priority == 'critical':
@@ -160,173 +502,284 @@ class NotificationManager:
         else:
             self.logger.info(f"{title}: {message}")
         
-        # Email
-        if ProductionConfig.EMAIL_ENABLED:
-            self._send_email(title, full_message, priority)
+        if not self.canales:
+            return True
         
-        # Slack
-        if ProductionConfig.SLACK_ENABLED:
-            self._send_slack(title, full_message, priority)
+        self._arrancar()
+        try:
+            self._cola.put_nowait({
+                'titulo': title,
+                'mensaje': message,
+                'prioridad': priority,
+                'timestamp': datetime.now(),
+                'suprimidas': self.alertas.suprimidas(clave)
+            })
+            return True
+        except queue.Full:
+            self.descartadas += 1
+            self.logger.error(f"Cola de notificaciones llena, descartada: {title}")
+            return False
     
-    def _send_email(self, title, message, priority):
-        """Enviar notificación por email"""
+    def _arrancar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._despachador, name='notificaciones', daemon=True)
+                self._thread.start()
+    
+    def _siguiente_lote(self):
+        """Esperar un mensaje y agrupar los que lleguen durante la ventana"""
         try:
-            # Crear mensaje
-            msg = MimeMultipart()
-            msg['From'] = ProductionConfig.EMAIL_USER
-            msg['To'] = ProductionConfig.ADMIN_EMAIL
-            msg['Subject'] = f"[NeuroKup II] {title}"
-            
-            # Agregar prioridad al subject
-            if priority == 'critical':
-                msg['Subject'] = f"🚨 [CRÍTICO] {msg['Subject']}"
-            elif priority == 'warning':
-                msg['Subject'] = f"⚠️ [ALERTA] {msg['Subject']}"
-            
-            # Cuerpo del mensaje
-            body = f"""
-Sistema: NeuroKup II Automation
-Servidor: {ProductionConfig.BASE_DIR}
-Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-Mensaje:
-{message}
-
----
-Este es un mensaje automático del sistema de monitoreo.
-"""
-            
-            msg.attach(MimeText(body, 'plain'))
-            
-            # Enviar email
-            server = smtplib.SMTP(ProductionConfig.SMTP_SERVER, ProductionConfig.SMTP_PORT)
-            server.starttls()
-            server.login(ProductionConfig.EMAIL_USER, ProductionConfig.EMAIL_PASSWORD)
-            text = msg.as_string()
-            server.sendmail(ProductionConfig.EMAIL_USER, ProductionConfig.ADMIN_EMAIL, text)
-            server.quit()
+            primero = self._cola.get(timeout=self.inactividad / 2)
+        except queue.Empty:
+            return []
+        if primero is None:
+            return []
+        
+        lote = [primero]
+        # Lo crítico sale ya (con lo que esté en cola); al cerrar no se espera
+        espera = 0 if primero['prioridad'] == 'critical' or self._parar.is_set() else self.ventana
+        limite = time.monotonic() + espera
+        
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                item = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            lote.append(item)
+            if item['prioridad'] == 'critical':
+                limite = time.monotonic()
+        
+        return lote
+    
+    def _componer(self, lote):
+        """(título, mensaje, prioridad) de un lote: el mensaje tal cual o un resumen"""
+        
+        def linea(n):
+            texto = f"[{n['timestamp']:%Y-%m-%d %H:%M:%S}] {n['mensaje']}"
+            if n['suprimidas']:
+                texto += f" (+{n['suprimidas']} repeticiones suprimidas)"
+            return texto
+        
+        prioridad = max((n['prioridad'] for n in lote), key=lambda p: NIVELES_PRIORIDAD.get(p, 0))
+        if len(lote) == 1:
+            return lote[0]['titulo'], linea(lote[0]), prioridad
+        
+        titulo = f"Resumen: {len(lote)} notificaciones ({lote[0]['titulo']}...)"
+        mensaje = '\n\n'.join(f"{n['titulo']}\n{linea(n)}" for n in lote)
+        return titulo, mensaje, prioridad
+    
+    def _enviar(self, canal, titulo, mensaje, prioridad):
+        """Envío por un canal con reintentos acotados y backoff exponencial"""
+        for intento in range(self.max_reintentos + 1):
+            try:
+                canal.enviar(titulo, mensaje, prioridad)
+                self.enviadas += 1
+                self.logger.info(f"{canal.nombre.capitalize()} enviado: {titulo}")
+                return True
+            except ErrorNoReintentable as e:
+                self.logger.error(f"Error enviando {canal.nombre}: {e}")
+                break
+            except Exception as e:
+                if intento == self.max_reintentos or self._parar.is_set():
+                    self.logger.error(f"Error enviando {canal.nombre} tras {intento + 1} intentos: {e}")
+                    break
+                self.logger.warning(f"⚠️ {canal.nombre}: {e}, reintento {intento + 1}/{self.max_reintentos}")
+                self._parar.wait(self.backoff * 2 ** intento)
+        
+        self.fallidas += 1
+        return False
+    
+    def _despachador(self):
+        # cerrar() fija _parar antes de encolar el centinela (None) que despierta la espera
+        while not (self._parar.is_set() and self._cola.empty()):
+            lote = self._siguiente_lote()
             
-            self.logger.info(f"Email enviado: {title}")
+            if lote:
+                titulo, mensaje, prioridad = self._componer(lote)
+                for canal in self.canales:
+                    self._enviar(canal, titulo, mensaje, prioridad)
             
-        except Exception as e:
-            self.logger.error(f"Error enviando email: {e}")
+            # Cerrar conexiones sin uso (los servidores las cortan igualmente)
+            ahora = time.monotonic()
+            for canal in self.canales:
+                if ahora - canal.ultimo_uso > self.inactividad:
+                    canal.cerrar()
+        
+        for canal in self.canales:
+            canal.cerrar()
     
-    def _send_slack(self, title, message, priority):
-        """Enviar notificación a Slack"""
+    def cerrar(self, timeout=None):
+        """Enviar lo que quede en cola (sin esperar ventanas) y cerrar las conexiones"""
+        thread = self._thread
+        if thread is None:
+            return
+        
+        self._parar.set()
         try:
-            # Determinar emoji y color según prioridad
-            if priority == 'critical':
-                emoji = "🚨"
-                color = "#FF0000"
-            elif priority == 'warning':
-                emoji = "⚠️"
-                color = "#FFA500"
-            else:
-                emoji = "ℹ️"
-                color = "#36a64f"
-            
-            # Crear payload
-            payload = {
-                "text": f"{emoji} {title}",
-                "attachments": [{
-                    "color": color,
-                    "fields": [
-                        {
-                            "title": "Servidor",
-                            "value": str(ProductionConfig.BASE_DIR),
-                            "short": True
-                        },
-                        {
-                            "title": "Timestamp",
-                            "value": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                            "short": True
-                        },
-                        {
-                            "title": "Mensaje",
-                            "value": message,
-                            "short": False
-                        }
-                    ]
-                }]
-            }
-            
-            # Enviar a Slack
-            response = requests.post(
-                ProductionConfig.SLACK_WEBHOOK_URL,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                self.logger.info(f"Slack enviado: {title}")
-            else:
-                self.logger.error(f"Error en Slack: {response.status_code}")
-                
-        except Exception as e:
-            self.logger.error(f"Error enviando Slack: {e}")
+            self._cola.put(None, timeout=1)
+        except queue.Full:
+            pass
+        thread.join(timeout or ProductionConfig.NOTIFY_TIMEOUT_SECONDS * 3)
+        if thread.is_alive():
+            self.logger.warning(f"Notificaciones sin enviar al cerrar: {self.pendientes()}")
 
 class AlertManager:
     """Gestión inteligente de alertas para evitar spam"""
     
-    def __init__(self):
+    def __init__(self, cooldown_defecto=None):
         self.logger = logging.getLogger(__name__)
         self.alert_history = {}
+        self.suppressed = {}
+        self._lock = threading.Lock()
+        self.cooldown_defecto = cooldown_defecto or timedelta(minutes=ProductionConfig.NOTIFY_DEFAULT_COOLDOWN_MINUTES)
         self.cooldown_periods = {
             'high_cpu': timedelta(minutes=15),
             'high_memory': timedelta(minutes=15),
             'disk_full': timedelta(hours=1),
             'model_error': timedelta(minutes=30),
-            'kaggle_error': timedelta(minutes=60)
+            'kaggle_error': timedelta(minutes=60),
+            'health_check': timedelta(minutes=30),
+            'thread_stopped': timedelta(minutes=15)
         }
     
+    def _cooldown(self, alert_type):
+        # 'thread_stopped:monitoring' usa el cooldown de 'thread_stopped'
+        return self.cooldown_periods.get(alert_type.split(':')[0], self.cooldown_defecto)
+    
     def should_send_alert(self, alert_type):
         """Determinar si se debe enviar una alerta basado en cooldown"""
         now = datetime.now()
         
-        if alert_type not in self.alert_history:
-            self.alert_history[alert_type] = now
-            return True
-        
-        last_alert = self.alert_history[alert_type]
-        cooldown = self.cooldown_periods.get(alert_type, timedelta(minutes=30))
-        
-        if now - last_alert >= cooldown:
-            self.alert_history[alert_type] = now
-            return True
-        
-        return False
+        with self._lock:
+            last_alert = self.alert_history.get(alert_type)
+            cooldown = self._cooldown(alert_type)
+            
+            if last_alert is None or now - last_alert >= cooldown:
+                self.alert_history[alert_type] = now
+                if len(self.alert_history) > MAX_HISTORIAL_ALERTAS:
+                    self._purgar(now)
+                return True
+            
+            self.suppressed[alert_type] = self.suppressed.get(alert_type, 0) + 1
+            return False
+    
+    def _purgar(self, now):
+        # Sin alert_type la clave es el propio mensaje: no dejar crecer el historial
+        vencidas = [
+            tipo for tipo, momento in self.alert_history.items()
+            if now - momento >= self._cooldown(tipo)
+        ]
+        for tipo in vencidas:
+            del self.alert_history[tipo]
+            self.suppressed.pop(tipo, None)
+    
+    def suprimidas(self, alert_type):
+        """Repeticiones descartadas desde el último envío (y reiniciar la cuenta)"""
+        with self._lock:
+            return self.suppressed.pop(alert_type, 0)
     
     def reset_alert(self, alert_type):
         """Resetear historial de alerta (cuando el problema se resuelve)"""
-        if alert_type in self.alert_history:
-            del self.alert_history[alert_type]
+        with self._lock:
+            self.alert_history.pop(alert_type, None)
+            self.suppressed.pop(alert_type, None)
+
+# Métricas que se guardan y agregan; las de porcentaje llevan además histograma (percentiles)
+METRICAS_GUARDADAS = [
+    'cpu_percent', 'memory_percent', 'disk_percent',
+    'process_memory_mb', 'process_tree_memory_mb',
+    'network_bytes_sent', 'network_bytes_recv'
+]
+METRICAS_AGREGADAS = ['cpu_percent', 'memory_percent', 'disk_percent', 'process_memory_mb', 'process_tree_memory_mb']
+METRICAS_HISTOGRAMA = ['cpu_percent', 'memory_percent']
+BINS_HISTOGRAMA = 101    # Un bin por punto porcentual (0..100)
+
+# Resoluciones de agregación: tabla -> segundos por bucket
+ROLLUPS = {'metricas_minuto': 60, 'metricas_hora': 3600}
+
+def _histograma(valores):
+    """Histograma de porcentajes (bins de 1 punto) como array uint32"""
+    indices = np.clip(np.nan_to_num(valores).astype(np.int64), 0, BINS_HISTOGRAMA - 1)
+    return np.bincount(indices, minlength=BINS_HISTOGRAMA).astype(np.uint32)
+
+def percentil_histograma(histograma, q):
+    """Percentil q (0-100) aproximado (resolución de 1 punto) a partir de un histograma"""
+    total = histograma.sum()
+    if total == 0:
+        return None
+    return float(np.searchsorted(np.cumsum(histograma), total * q / 100))
 
 class MetricsDatabase:
-    """Base de datos para almacenar métricas históricas"""
+    """
+    Almacén de métricas históricas con buffer, agregados y retención
     
-    def __init__(self):
-        self.db_path = ProductionConfig.BASE_DIR / 'data' / 'metrics.db'
+    Las muestras se acumulan en memoria y se escriben por lotes en una sola
+    transacción. Cada lote actualiza también los agregados por minuto y por
+    hora (n, suma, máximo e histograma de los porcentajes para percentiles),
+    que se fusionan de forma incremental. Las muestras crudas se guardan poco
+    tiempo; las consultas de periodos largos usan los agregados. Todas las
+    tablas se indexan por tiempo (epoch).
+    """
+    
+    def __init__(self, db_path=None, filas_por_lote=None, intervalo_flush=None, retencion=None):
+        """
+        Args:
+            db_path: Ruta de la base de datos (por defecto METRICS_DB_PATH)
+            filas_por_lote (int): Muestras en buffer que fuerzan una escritura
+            intervalo_flush (float): Segundos máximos que una muestra espera en el buffer
+            retencion (dict): Horas que se conserva cada tabla (metricas_raw, metricas_minuto, metricas_hora, spans)
+        """
+        self.db_path = db_path or ProductionConfig.METRICS_DB_PATH
+        self.db = ConexionSQLite.compartida(self.db_path)
         self.logger = logging.getLogger(__name__)
+        
+        self.filas_por_lote = filas_por_lote or ProductionConfig.METRICS_BATCH_SIZE
+        self.intervalo_flush = intervalo_flush or ProductionConfig.METRICS_FLUSH_SECONDS
+        self.retencion = retencion or {
+            'metricas_raw': ProductionConfig.METRICS_RAW_RETENTION_HOURS,
+            'metricas_minuto': ProductionConfig.METRICS_MINUTE_RETENTION_DAYS * 24,
+            'metricas_hora': ProductionConfig.METRICS_HOUR_RETENTION_DAYS * 24,
+            'spans': ProductionConfig.TRACES_RETENTION_DAYS * 24
+        }
+        
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._ultimo_flush = time.time()
+        self._ultima_limpieza = 0.0
         self._init_db()
     
     def _init_db(self):
         """Inicializar base de datos"""
+        columnas_raw = ', '.join(f'{m} REAL' for m in METRICAS_GUARDADAS)
+        columnas_rollup = ', '.join(f'{m}_suma REAL, {m}_max REAL' for m in METRICAS_AGREGADAS)
+        columnas_histograma = ', '.join(f'{m}_histograma BLOB' for m in METRICAS_HISTOGRAMA)
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    cpu_percent REAL,
-                    memory_percent REAL,
-                    disk_percent REAL,
-                    network_bytes_sent INTEGER,
-                    network_bytes_recv INTEGER,
-                    process_memory_mb REAL
-                )
-            ''')
-            
-            conn.execute('''
+            self.db.ejecutar_script(f'''
+                CREATE TABLE IF NOT EXISTS metricas_raw (
+                    ts REAL NOT NULL,
+                    {columnas_raw}
+                );
+                CREATE INDEX IF NOT EXISTS idx_metricas_raw_ts ON metricas_raw(ts);
+                
+                CREATE TABLE IF NOT EXISTS metricas_minuto (
+                    bucket INTEGER PRIMARY KEY,
+                    n INTEGER NOT NULL,
+                    {columnas_rollup},
+                    {columnas_histograma}
+                );
+                
+                CREATE TABLE IF NOT EXISTS metricas_hora (
+                    bucket INTEGER PRIMARY KEY,
+                    n INTEGER NOT NULL,
+                    {columnas_rollup},
+                    {columnas_histograma}
+                );
+                
                 CREATE TABLE IF NOT EXISTS alerts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     timestamp TEXT NOT NULL,
@@ -335,68 +788,262 @@ class MetricsDatabase:
                     priority TEXT NOT NULL
                 )
             ''')
-            
-            conn.commit()
-            conn.close()
+            # Spans de las etapas del pipeline (automatizacion.trazas)
+            crear_tabla_spans(self.db)
             
         except Exception as e:
             self.logger.error(f"Error inicializando DB de métricas: {e}")
     
+    def registrar(self, metrics):
+        """Añadir una muestra al buffer (se escribe al llenarse el lote o pasar intervalo_flush)"""
+        if not metrics:
+            return
+        
+        ts = metrics['timestamp']
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts).timestamp()
+        
+        with self._lock:
+            self._buffer.append((ts,) + tuple(metrics.get(m) for m in METRICAS_GUARDADAS))
+            lleno = len(self._buffer) >= self.filas_por_lote
+            vencido = time.time() - self._ultimo_flush >= self.intervalo_flush
+        
+        if lleno or vencido:
+            self.flush()
+    
+    def pendientes(self):
+        """Muestras en el buffer que aún no se han escrito"""
+        return len(self._buffer)
+    
     def save_metrics(self, metrics):
         """Guardar métricas en la base de datos"""
+        self.registrar(metrics)
+    
+    def save_metrics_batch(self, metrics_list):
+        """Guardar varias muestras de métricas en una sola transacción"""
+        for metrics in metrics_list:
+            self.registrar(metrics)
+        self.flush()
+    
+    def flush(self):
+        """Escribir el buffer y actualizar los agregados en una sola transacción"""
+        with self._lock:
+            filas, self._buffer = self._buffer, []
+            self._ultimo_flush = time.time()
+        
+        if not filas:
+            return 0
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                INSERT INTO metrics (
-                    timestamp, cpu_percent, memory_percent, disk_percent,
-                    network_bytes_sent, network_bytes_recv, process_memory_mb
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                metrics['timestamp'],
-                metrics['cpu_percent'],
-                metrics['memory_percent'], 
-                metrics['disk_percent'],
-                metrics['network_bytes_sent'],
-                metrics['network_bytes_recv'],
-                metrics['process_memory_mb']
-            ))
-            conn.commit()
-            conn.close()
+            columnas = ', '.join(['ts'] + METRICAS_GUARDADAS)
+            marcadores = ', '.join('?' * (len(METRICAS_GUARDADAS) + 1))
+            
+            with self.db.transaccion() as conn:
+                conn.executemany(f'INSERT INTO metricas_raw ({columnas}) VALUES ({marcadores})', filas)
+                
+                datos = np.array(filas, dtype=np.float64)
+                for tabla, segundos in ROLLUPS.items():
+                    self._actualizar_rollup(conn, tabla, segundos, datos)
+            
+            if time.time() - self._ultima_limpieza >= 3600:
+                self.aplicar_retencion()
+            
+            return len(filas)
             
         except Exception as e:
             self.logger.error(f"Error guardando métricas: {e}")
+            # Devolver las muestras al buffer para el siguiente intento
+            with self._lock:
+                self._buffer = filas + self._buffer
+            return 0
+    
+    def _actualizar_rollup(self, conn, tabla, segundos, datos):
+        """Fusionar un lote de muestras en los buckets de una tabla de agregados"""
+        indices = {m: i + 1 for i, m in enumerate(METRICAS_GUARDADAS)}
+        buckets = (datos[:, 0] // segundos * segundos).astype(np.int64)
+        
+        columnas = (['n'] + [f'{m}_{a}' for m in METRICAS_AGREGADAS for a in ('suma', 'max')]
+                    + [f'{m}_histograma' for m in METRICAS_HISTOGRAMA])
+        
+        filas = []
+        for bucket in np.unique(buckets):
+            lote = datos[buckets == bucket]
+            existente = conn.execute(
+                f'SELECT {", ".join(columnas)} FROM {tabla} WHERE bucket = ?', (int(bucket),)
+            ).fetchone()
+            
+            fila = [int(bucket), len(lote) + (existente[0] if existente else 0)]
+            posicion = 1
+            for m in METRICAS_AGREGADAS:
+                valores = lote[:, indices[m]]
+                suma = float(np.nansum(valores))
+                maximo = np.nanmax(valores) if np.isfinite(valores).any() else np.nan
+                if existente:
+                    suma += existente[posicion] or 0
+                    if existente[posicion + 1] is not None:
+                        maximo = np.fmax(maximo, existente[posicion + 1])
+                maximo = None if np.isnan(maximo) else float(maximo)
+                fila += [suma, maximo]
+                posicion += 2
+            
+            for m in METRICAS_HISTOGRAMA:
+                histograma = _histograma(lote[:, indices[m]])
+                if existente and existente[posicion] is not None:
+                    histograma += np.frombuffer(existente[posicion], dtype=np.uint32)
+                fila.append(histograma.tobytes())
+                posicion += 1
+            
+            filas.append(fila)
+        
+        conn.executemany(
+            f'INSERT OR REPLACE INTO {tabla} (bucket, {", ".join(columnas)}) VALUES ({", ".join("?" * (len(columnas) + 1))})',
+            filas
+        )
+    
+    def aplicar_retencion(self):
+        """Borrar muestras crudas y agregados más antiguos que su retención"""
+        ahora = time.time()
+        try:
+            with self.db.transaccion() as conn:
+                borradas = conn.execute(
+                    'DELETE FROM metricas_raw WHERE ts < ?',
+                    (ahora - self.retencion['metricas_raw'] * 3600,)
+                ).rowcount
+                for tabla in ROLLUPS:
+                    borradas += conn.execute(
+                        f'DELETE FROM {tabla} WHERE bucket < ?',
+                        (int(ahora - self.retencion[tabla] * 3600),)
+                    ).rowcount
+                borradas += conn.execute(
+                    'DELETE FROM spans WHERE inicio < ?',
+                    (ahora - self.retencion.get('spans', self.retencion['metricas_hora']) * 3600,)
+                ).rowcount
+            
+            self._ultima_limpieza = ahora
+            if borradas:
+                self.logger.info(f"🧹 Retención de métricas: {borradas} filas eliminadas")
+            return borradas
+            
+        except Exception as e:
+            self.logger.error(f"Error aplicando retención de métricas: {e}")
+            return 0
+    
+    def _tabla_para(self, horas):
+        """Tabla de agregados con retención suficiente para un periodo"""
+        if horas <= self.retencion['metricas_minuto']:
+            return 'metricas_minuto'
+        return 'metricas_hora'
     
     def get_metrics_summary(self, hours=24):
         """Obtener resumen de métricas de las últimas N horas"""
+        self.flush()
+        
         try:
-            since = datetime.now() - timedelta(hours=hours)
+            tabla = self._tabla_para(hours)
+            since = int(time.time() - hours * 3600)
+            
+            filas = self.db.consultar(f'''
+                SELECT n, cpu_percent_suma, cpu_percent_max, memory_percent_suma, memory_percent_max,
+                       cpu_percent_histograma, memory_percent_histograma
+                FROM {tabla}
+                WHERE bucket >= ?
+            ''', (since,))
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.execute('''
-                SELECT 
-                    AVG(cpu_percent) as avg_cpu,
-                    MAX(cpu_percent) as max_cpu,
-                    AVG(memory_percent) as avg_memory,
-                    MAX(memory_percent) as max_memory,
-                    COUNT(*) as data_points
-                FROM metrics 
-                WHERE timestamp > ?
-            ''', (since.isoformat(),))
+            if not filas:
+                return {'avg_cpu': 0, 'max_cpu': 0, 'avg_memory': 0, 'max_memory': 0, 'data_points': 0}
             
-            result = cursor.fetchone()
-            conn.close()
+            n = sum(f[0] for f in filas)
+            histograma_cpu = sum(np.frombuffer(f[5], dtype=np.uint32).astype(np.int64) for f in filas)
+            histograma_memoria = sum(np.frombuffer(f[6], dtype=np.uint32).astype(np.int64) for f in filas)
             
             return {
-                'avg_cpu': result[0] or 0,
-                'max_cpu': result[1] or 0,
-                'avg_memory': result[2] or 0,
-                'max_memory': result[3] or 0,
-                'data_points': result[4] or 0
+                'avg_cpu': sum(f[1] or 0 for f in filas) / n,
+                'max_cpu': max((f[2] for f in filas if f[2] is not None), default=0),
+                'p95_cpu': percentil_histograma(histograma_cpu, 95),
+                'avg_memory': sum(f[3] or 0 for f in filas) / n,
+                'max_memory': max((f[4] for f in filas if f[4] is not None), default=0),
+                'p95_memory': percentil_histograma(histograma_memoria, 95),
+                'data_points': n,
+                'resolucion': tabla
             }
             
         except Exception as e:
             self.logger.error(f"Error obteniendo resumen de métricas: {e}")
             return {}
+    
+    def get_series(self, metrica, hours=24, resolucion=None):
+        """
+        Serie temporal de una métrica
+        
+        Args:
+            metrica (str): Una de METRICAS_AGREGADAS
+            hours (float): Horas hacia atrás
+            resolucion (str): 'raw', 'minuto' u 'hora' (por defecto, la más fina disponible)
+        
+        Returns:
+            list: (timestamp ISO, media, máximo) por bucket; en 'raw', (timestamp, valor, valor)
+        """
+        if metrica not in METRICAS_AGREGADAS:
+            raise ValueError(f"Métrica desconocida: {metrica}")
+        self.flush()
+        
+        since = time.time() - hours * 3600
+        if resolucion is None:
+            resolucion = 'raw' if hours <= self.retencion['metricas_raw'] else self._tabla_para(hours).split('_')[1]
+        
+        if resolucion == 'raw':
+            filas = self.db.consultar(
+                f'SELECT ts, {metrica}, {metrica} FROM metricas_raw WHERE ts >= ? ORDER BY ts', (since,)
+            )
+        else:
+            filas = self.db.consultar(f'''
+                SELECT bucket, {metrica}_suma / n, {metrica}_max
+                FROM metricas_{resolucion}
+                WHERE bucket >= ?
+                ORDER BY bucket
+            ''', (int(since),))
+        
+        return [(datetime.fromtimestamp(ts).isoformat(), media, maximo) for ts, media, maximo in filas]
+    
+    def get_spans_summary(self, hours=24):
+        """
+        Tiempo por etapa del pipeline en las últimas N horas
+        
+        Returns:
+            list: dicts con etapa, n, segundos (total y medio/máximo), cpu, rss_pico_delta_mb,
+                  filas y filas_por_segundo, ordenados por tiempo total
+        """
+        since = time.time() - hours * 3600
+        
+        try:
+            filas = self.db.consultar('''
+                SELECT nombre, COUNT(*), SUM(duracion), MAX(duracion), SUM(cpu),
+                       MAX(rss_pico_delta_mb), SUM(filas), SUM(error IS NOT NULL)
+                FROM spans
+                WHERE inicio >= ?
+                GROUP BY nombre
+                ORDER BY SUM(duracion) DESC
+            ''', (since,))
+        except Exception as e:
+            self.logger.error(f"Error obteniendo resumen de spans: {e}")
+            return []
+        
+        return [{
+            'etapa': nombre,
+            'n': n,
+            'segundos': total,
+            'segundos_medio': total / n,
+            'segundos_max': maximo,
+            'cpu': cpu,
+            'rss_pico_delta_mb': rss,
+            'filas': filas_etapa,
+            'filas_por_segundo': filas_etapa / total if filas_etapa and total else None,
+            'errores': errores
+        } for nombre, n, total, maximo, cpu, rss, filas_etapa, errores in filas]
+    
+    def cerrar(self):
+        """Escribir lo que quede en el buffer"""
+        self.flush()
 
 if __name__ == "__main__":
     # Test del sistema de monitoreo
@@ -5,7 +5,12 @@
 
 import os
 import json
+import atexit
 import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -47,15 +52,57 @@ class ProductionConfig:
     
     # === LOGGING ===
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-    LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    LOG_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
     LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', '10485760'))  # 10MB
     LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_JSON_ENABLED = os.getenv('LOG_JSON_ENABLED', 'False').lower() == 'true'  # neurokup.jsonl (una línea JSON por registro)
     
     # === MONITORING ===
     HEALTH_CHECK_INTERVAL = int(os.getenv('HEALTH_CHECK_INTERVAL', '300'))  # 5 min
     MAX_MEMORY_MB = int(os.getenv('MAX_MEMORY_MB', '2048'))
     MAX_CPU_PERCENT = int(os.getenv('MAX_CPU_PERCENT', '80'))
     
+    # === ALMACÉN DE MÉTRICAS ===
+    METRICS_BATCH_SIZE = int(os.getenv('METRICS_BATCH_SIZE', '20'))
+    METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', '600'))
+    METRICS_RAW_RETENTION_HOURS = int(os.getenv('METRICS_RAW_RETENTION_HOURS', '48'))
+    METRICS_MINUTE_RETENTION_DAYS = int(os.getenv('METRICS_MINUTE_RETENTION_DAYS', '14'))
+    METRICS_HOUR_RETENTION_DAYS = int(os.getenv('METRICS_HOUR_RETENTION_DAYS', '365'))
+    METRICS_DB_PATH = BASE_DIR / 'data' / 'metrics.db'
+    
+    # === ENDPOINT DE MÉTRICAS (Prometheus) ===
+    METRICS_EXPORTER_ENABLED = os.getenv('METRICS_EXPORTER_ENABLED', 'True').lower() == 'true'
+    METRICS_EXPORTER_HOST = os.getenv('METRICS_EXPORTER_HOST', '127.0.0.1')
+    METRICS_EXPORTER_PORT = int(os.getenv('METRICS_EXPORTER_PORT', '9108'))
+    METRICS_EXPORTER_CACHE_SECONDS = float(os.getenv('METRICS_EXPORTER_CACHE_SECONDS', '5'))
+    
+    # === TRAZAS DEL PIPELINE (spans por etapa) ===
+    TRACES_DIR = LOGS_DIR / 'trazas'  # JSON Chrome trace (chrome://tracing, Perfetto)
+    TRACES_MAX_FILES = int(os.getenv('TRACES_MAX_FILES', '50'))
+    TRACES_RETENTION_DAYS = int(os.getenv('TRACES_RETENTION_DAYS', '30'))
+    
+    # === PROCESOS SUPERVISADOS (ML pipeline y backup) ===
+    SUPERVISOR_CHECK_SECONDS = int(os.getenv('SUPERVISOR_CHECK_SECONDS', '5'))
+    SUPERVISOR_GRACE_SECONDS = int(os.getenv('SUPERVISOR_GRACE_SECONDS', '60'))
+    SUPERVISOR_BACKOFF_MAX_SECONDS = int(os.getenv('SUPERVISOR_BACKOFF_MAX_SECONDS', '1800'))
+    ML_HEARTBEAT_TIMEOUT_MINUTES = int(os.getenv('ML_HEARTBEAT_TIMEOUT_MINUTES', '15'))  # El entrenamiento late mientras se vigila
+    ML_MEMORY_LIMIT_MB = int(os.getenv('ML_MEMORY_LIMIT_MB', '3072'))
+    ML_NICE = int(os.getenv('ML_NICE', '5'))
+    ML_CPUS = int(os.getenv('ML_CPUS', '0'))  # 0 = todos los núcleos
+    BACKUP_HEARTBEAT_TIMEOUT_MINUTES = int(os.getenv('BACKUP_HEARTBEAT_TIMEOUT_MINUTES', '60'))
+    BACKUP_MEMORY_LIMIT_MB = int(os.getenv('BACKUP_MEMORY_LIMIT_MB', '512'))
+    BACKUP_NICE = int(os.getenv('BACKUP_NICE', '10'))
+    
+    # === GOBERNADOR DE RECURSOS ===
+    GOVERNOR_MEMORY_RESERVE_MB = int(os.getenv('GOVERNOR_MEMORY_RESERVE_MB', '512'))  # Para el SO y el proceso principal
+    GOVERNOR_WORKER_MEMORY_MB = int(os.getenv('GOVERNOR_WORKER_MEMORY_MB', '256'))
+    GOVERNOR_DATA_MEMORY_FACTOR = float(os.getenv('GOVERNOR_DATA_MEMORY_FACTOR', '4'))
+    GOVERNOR_MIN_SAMPLE_FRACTION = float(os.getenv('GOVERNOR_MIN_SAMPLE_FRACTION', '0.25'))
+    GOVERNOR_PREEMPT_MEMORY_MB = int(os.getenv('GOVERNOR_PREEMPT_MEMORY_MB', '512'))
+    GOVERNOR_MAX_PAUSE_MINUTES = int(os.getenv('GOVERNOR_MAX_PAUSE_MINUTES', '120'))
+    GOVERNOR_MIN_FREE_MB = int(os.getenv('GOVERNOR_MIN_FREE_MB', '256'))  # Por debajo se cancela el entrenamiento
+    TRAINING_HISTORY_PATH = BASE_DIR / 'models' / 'historial_entrenamiento.jsonl'
+    
     # === EMAIL NOTIFICATIONS (opcional) ===
     EMAIL_ENABLED = os.getenv('EMAIL_ENABLED', 'False').lower() == 'true'
     SMTP_SERVER = os.getenv('SMTP_SERVER')
@@ -63,11 +110,22 @@ class ProductionConfig:
     EMAIL_USER = os.getenv('EMAIL_USER')
     EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'True').lower() == 'true'  # Solo si el servidor lo anuncia
     
     # === SLACK NOTIFICATIONS (opcional) ===
     SLACK_ENABLED = os.getenv('SLACK_ENABLED', 'False').lower() == 'true'
     SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
     
+    # === DESPACHO DE NOTIFICACIONES (cola en segundo plano) ===
+    NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', '1000'))
+    NOTIFY_COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', '30'))  # Ventana para agrupar ráfagas
+    NOTIFY_MAX_BATCH = int(os.getenv('NOTIFY_MAX_BATCH', '50'))
+    NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '3'))
+    NOTIFY_RETRY_BACKOFF_SECONDS = float(os.getenv('NOTIFY_RETRY_BACKOFF_SECONDS', '2'))
+    NOTIFY_TIMEOUT_SECONDS = float(os.getenv('NOTIFY_TIMEOUT_SECONDS', '10'))
+    NOTIFY_IDLE_SECONDS = float(os.getenv('NOTIFY_IDLE_SECONDS', '240'))  # Conexiones SMTP/HTTP sin uso se cierran
+    NOTIFY_DEFAULT_COOLDOWN_MINUTES = int(os.getenv('NOTIFY_DEFAULT_COOLDOWN_MINUTES', '30'))
+    
     @classmethod
     def validate_config(cls):
         """Validar configuración crítica"""
@@ -92,34 +150,118 @@ class ProductionConfig:
         
         return True
 
-def setup_logging():
-    """Configurar logging para producción"""
-    from logging.handlers import RotatingFileHandler
+# Atributos estándar de LogRecord: el resto son campos pasados con extra={...}
+_ATRIBUTOS_LOG = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class FormateadorJSON(logging.Formatter):
+    """Un objeto JSON por registro (para ingerir los logs en el pipeline de métricas)"""
     
-    # Crear directorio de logs si no existe
-    ProductionConfig.LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    def format(self, record):
+        datos = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'process_name': record.processName,
+            'thread': record.threadName
+        }
+        if record.exc_info:
+            datos['exception'] = self.formatException(record.exc_info)
+        
+        # Campos estructurados: logger.info("...", extra={'etapa': 'fit', 'segundos': 1.2})
+        for clave, valor in record.__dict__.items():
+            if clave not in _ATRIBUTOS_LOG and not clave.startswith('_'):
+                datos[clave] = valor
+        
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+_lock_logging = threading.Lock()
+_listener_logging = None
+
+def setup_logging():
+    """
+    Configurar logging para producción (idempotente)
     
-    # Configurar logging
-    logger = logging.getLogger()
-    logger.setLevel(getattr(logging, ProductionConfig.LOG_LEVEL))
+    Los registros de todos los threads, y de los procesos hijos que reciban
+    cola_logging(), se encolan con un QueueHandler; un único thread
+    (QueueListener) los formatea y escribe en el archivo rotativo, la consola
+    y, si LOG_JSON_ENABLED, en neurokup.jsonl. Así el formateo y la escritura
+    salen de los threads de trabajo. Llamarla varias veces no añade handlers:
+    si el logger raíz ya tiene un QueueHandler (aunque lo haya puesto otra
+    copia de este módulo importada con otro nombre) se reutiliza.
     
-    # Handler para archivo con rotación
-    file_handler = RotatingFileHandler(
-        ProductionConfig.LOGS_DIR / 'neurokup.log',
-        maxBytes=ProductionConfig.LOG_MAX_BYTES,
-        backupCount=ProductionConfig.LOG_BACKUP_COUNT
-    )
-    file_handler.setFormatter(logging.Formatter(ProductionConfig.LOG_FORMAT))
+    Returns:
+        logging.Logger: Logger raíz
+    """
+    global _listener_logging
     
-    # Handler para consola
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(ProductionConfig.LOG_FORMAT))
+    logger = logging.getLogger()
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    with _lock_logging:
+        logger.setLevel(getattr(logging, ProductionConfig.LOG_LEVEL))
+        if _listener_logging is not None or cola_logging() is not None:
+            return logger
+        
+        # Crear directorio de logs si no existe
+        ProductionConfig.LOGS_DIR.mkdir(parents=True, exist_ok=True)
+        formato = logging.Formatter(ProductionConfig.LOG_FORMAT)
+        
+        # Handler para archivo con rotación
+        file_handler = RotatingFileHandler(
+            ProductionConfig.LOGS_DIR / 'neurokup.log',
+            maxBytes=ProductionConfig.LOG_MAX_BYTES,
+            backupCount=ProductionConfig.LOG_BACKUP_COUNT
+        )
+        file_handler.setFormatter(formato)
+        
+        # Handler para consola
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formato)
+        
+        sinks = [file_handler, console_handler]
+        if ProductionConfig.LOG_JSON_ENABLED:
+            json_handler = RotatingFileHandler(
+                ProductionConfig.LOGS_DIR / 'neurokup.jsonl',
+                maxBytes=ProductionConfig.LOG_MAX_BYTES,
+                backupCount=ProductionConfig.LOG_BACKUP_COUNT
+            )
+            json_handler.setFormatter(FormateadorJSON())
+            sinks.append(json_handler)
+        
+        # Cola de multiprocessing (spawn) para que los procesos supervisados
+        # escriban en los mismos sinks sin pelearse por la rotación
+        cola = multiprocessing.get_context('spawn').Queue()
+        
+        # Quitar handlers previos (basicConfig de algún import) para no duplicar salida
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(QueueHandler(cola))
+        
+        _listener_logging = QueueListener(cola, *sinks, respect_handler_level=True)
+        _listener_logging.start()
+        atexit.register(detener_logging)
     
     return logger
 
+def cola_logging():
+    """Cola de logging del proceso (para pasarla a procesos hijos), o None si no hay"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueHandler):
+            return handler.queue
+    return None
+
+def detener_logging():
+    """Vaciar la cola de logging y parar el listener (se llama también al salir)"""
+    global _listener_logging
+    
+    with _lock_logging:
+        listener, _listener_logging = _listener_logging, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
 def create_env_template():
     """Crear archivo .env template"""
     template = """# ================================
@@ -149,12 +291,51 @@ BACKUP_INTERVAL_HOURS=24
 LOG_LEVEL=INFO
 LOG_MAX_BYTES=10485760
 LOG_BACKUP_COUNT=5
+LOG_JSON_ENABLED=False
 
 # === MONITORING ===
 HEALTH_CHECK_INTERVAL=300
 MAX_MEMORY_MB=2048
 MAX_CPU_PERCENT=80
 
+# === ALMACÉN DE MÉTRICAS ===
+METRICS_BATCH_SIZE=20
+METRICS_FLUSH_SECONDS=600
+METRICS_RAW_RETENTION_HOURS=48
+METRICS_MINUTE_RETENTION_DAYS=14
+METRICS_HOUR_RETENTION_DAYS=365
+
+# === ENDPOINT DE MÉTRICAS ===
+METRICS_EXPORTER_ENABLED=True
+METRICS_EXPORTER_HOST=127.0.0.1
+METRICS_EXPORTER_PORT=9108
+METRICS_EXPORTER_CACHE_SECONDS=5
+
+# === TRAZAS DEL PIPELINE ===
+TRACES_MAX_FILES=50
+TRACES_RETENTION_DAYS=30
+
+# === PROCESOS SUPERVISADOS ===
+SUPERVISOR_CHECK_SECONDS=5
+SUPERVISOR_GRACE_SECONDS=60
+SUPERVISOR_BACKOFF_MAX_SECONDS=1800
+ML_HEARTBEAT_TIMEOUT_MINUTES=15
+ML_MEMORY_LIMIT_MB=3072
+ML_NICE=5
+ML_CPUS=0
+BACKUP_HEARTBEAT_TIMEOUT_MINUTES=60
+BACKUP_MEMORY_LIMIT_MB=512
+BACKUP_NICE=10
+
+# === GOBERNADOR DE RECURSOS ===
+GOVERNOR_MEMORY_RESERVE_MB=512
+GOVERNOR_WORKER_MEMORY_MB=256
+GOVERNOR_DATA_MEMORY_FACTOR=4
+GOVERNOR_MIN_SAMPLE_FRACTION=0.25
+GOVERNOR_PREEMPT_MEMORY_MB=512
+GOVERNOR_MAX_PAUSE_MINUTES=120
+GOVERNOR_MIN_FREE_MB=256
+
 # === EMAIL NOTIFICATIONS (opcional) ===
 EMAIL_ENABLED=False
 SMTP_SERVER=smtp.gmail.com
@@ -162,10 +343,21 @@ SMTP_PORT=587
 EMAIL_USER=your_email@gmail.com
 EMAIL_PASSWORD=your_app_password
 ADMIN_EMAIL=admin@example.com
+SMTP_STARTTLS=True
 
 # === SLACK NOTIFICATIONS (opcional) ===
 SLACK_ENABLED=False
 SLACK_WEBHOOK_URL=https://hooks.slack.com/services/YOUR/SLACK/WEBHOOK
+
+# === DESPACHO DE NOTIFICACIONES ===
+NOTIFY_QUEUE_SIZE=1000
+NOTIFY_COALESCE_SECONDS=30
+NOTIFY_MAX_BATCH=50
+NOTIFY_MAX_RETRIES=3
+NOTIFY_RETRY_BACKOFF_SECONDS=2
+NOTIFY_TIMEOUT_SECONDS=10
+NOTIFY_IDLE_SECONDS=240
+NOTIFY_DEFAULT_COOLDOWN_MINUTES=30
 """
     
     env_path = ProductionConfig.BASE_DIR / '.env'
@@ -0,0 +1,471 @@
+# ================================
+# 🧬 SUPERVISOR DE PROCESOS HIJOS
+# ================================
+# El pipeline de ML y los backups corren en procesos hijos supervisados:
+# heartbeats, reinicio con backoff, límites de memoria/CPU y parada graceful
+# con SIGTERM. El proceso padre (monitoreo, health checks) no comparte el GIL
+# con el entrenamiento y sigue respondiendo.
+
+import os
+import time
+import signal
+import logging
+import threading
+import multiprocessing as mp
+from datetime import datetime
+from logging.handlers import QueueHandler
+
+import psutil
+
+# spawn: el padre tiene threads (monitoreo, logging) y un fork podría heredar locks tomados
+CONTEXTO_MP = mp.get_context('spawn')
+
+class ContextoTarea:
+    """
+    Lo que recibe la función objetivo dentro del proceso hijo
+
+    La función debe llamar a `latido()` con frecuencia (o usar `esperar()`,
+    que late mientras duerme) y salir del bucle cuando `debe_parar()` sea True.
+    """
+
+    def __init__(self, nombre, latido, parar):
+        self.nombre = nombre
+        self._latido = latido
+        self._parar = parar
+        self.senal_recibida = False
+
+    def latido(self):
+        """Avisar al supervisor de que el proceso sigue vivo"""
+        self._latido.value = time.time()
+
+    def debe_parar(self):
+        """True cuando el supervisor ha pedido la parada (evento o SIGTERM)"""
+        return self.senal_recibida or self._parar.is_set()
+
+    def esperar(self, segundos):
+        """
+        Dormir latiendo cada segundo; vuelve antes si se pide la parada
+
+        Returns:
+            bool: True si se ha pedido la parada
+        """
+
+        fin = time.time() + segundos
+        while not self.debe_parar() and time.time() < fin:
+            self.latido()
+            time.sleep(min(1.0, max(fin - time.time(), 0)))
+        return self.debe_parar()
+
+FORMATO_LOG_HIJO = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+def configurar_logging_hijo(nivel_log, cola_log=None):
+    """
+    Logging de un proceso hijo: a la cola del padre si la hay (su listener
+    escribe en los sinks comunes), si no a stderr
+    """
+
+    raiz = logging.getLogger()
+    if cola_log is None:
+        logging.basicConfig(level=nivel_log, format=FORMATO_LOG_HIJO)
+        return
+
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(QueueHandler(cola_log))
+    raiz.setLevel(nivel_log)
+
+def _ejecutar_hijo(nombre, objetivo, latido, parar, nice, cpus, nivel_log, cola_log):
+    """Punto de entrada del proceso hijo"""
+
+    configurar_logging_hijo(nivel_log, cola_log)
+    logger = logging.getLogger(f'supervisor.{nombre}')
+
+    contexto = ContextoTarea(nombre, latido, parar)
+
+    # SIGTERM = parada graceful. El handler solo marca un flag: tocar el Event desde
+    # un handler podría bloquearse si la señal llega con su lock tomado.
+    # Ctrl+C llega a todo el grupo, pero la parada la decide el padre.
+    def _al_recibir_sigterm(signum, frame):
+        contexto.senal_recibida = True
+
+    signal.signal(signal.SIGTERM, _al_recibir_sigterm)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Límites de CPU: menos prioridad que el padre y, opcionalmente, solo algunos núcleos
+    if nice:
+        os.nice(nice)
+    if cpus:
+        try:
+            disponibles = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, disponibles[-cpus:])
+        except (AttributeError, OSError) as e:
+            logger.warning(f"No se pudo limitar la afinidad de CPU: {e}")
+
+    contexto.latido()
+    logger.info(f"🧬 Proceso {nombre} iniciado (pid {os.getpid()})")
+
+    try:
+        objetivo(contexto)
+    except Exception as e:
+        logger.exception(f"❌ Proceso {nombre} terminó con error: {e}")
+        raise SystemExit(1)
+
+    logger.info(f"🛑 Proceso {nombre} detenido")
+
+def memoria_arbol_mb(proceso):
+    """
+    RSS de un proceso y todos sus descendientes (p.ej. workers de joblib)
+
+    Args:
+        proceso (psutil.Process o int): Proceso raíz o su pid
+
+    Returns:
+        float: MB (0 si el proceso ya no existe)
+    """
+
+    total = 0
+    try:
+        if not isinstance(proceso, psutil.Process):
+            proceso = psutil.Process(proceso)
+        procesos = [proceso] + proceso.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+
+    for p in procesos:
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 1024 / 1024
+
+def terminar_arbol(proceso, gracia, logger=None):
+    """
+    SIGTERM a un proceso y sus descendientes; SIGKILL a los que sigan vivos tras `gracia` segundos
+
+    Args:
+        proceso (psutil.Process): Proceso raíz
+        gracia (float): Segundos de espera antes de matar
+    """
+
+    try:
+        procesos = [proceso] + proceso.children(recursive=True)
+    except psutil.Error:
+        return
+
+    # Primero el raíz: su handler marca la parada y él cierra a sus workers
+    try:
+        proceso.terminate()
+    except psutil.Error:
+        pass
+    _, vivos = psutil.wait_procs([proceso], timeout=gracia)
+
+    vivos += [p for p in procesos[1:] if p.is_running()]
+    for p in vivos:
+        try:
+            p.kill()
+        except psutil.Error:
+            pass
+    if vivos and logger:
+        logger.warning(f"⚠️ {len(vivos)} procesos no terminaron en {gracia}s y se han matado")
+    psutil.wait_procs(vivos, timeout=5)
+
+class TareaSupervisada:
+    """Un proceso hijo supervisado y su política de reinicio"""
+
+    def __init__(self, nombre, objetivo, timeout_latido=300, memoria_max_mb=None,
+                 nice=0, cpus=None, backoff_inicial=10, backoff_max=1800, estable_segundos=600):
+        """
+        Args:
+            nombre (str): Nombre de la tarea (también nombre del proceso)
+            objetivo (callable): Función de módulo (picklable) que recibe un ContextoTarea
+            timeout_latido (float): Segundos sin latido tras los que el proceso se reinicia
+            memoria_max_mb (float): RSS máximo del proceso y sus hijos (None = sin límite)
+            nice (int): Incremento de nice del proceso hijo
+            cpus (int): Número de núcleos permitidos (None = todos)
+            backoff_inicial (float): Espera antes del primer reinicio
+            backoff_max (float): Espera máxima entre reinicios
+            estable_segundos (float): Tras este tiempo vivo, el backoff vuelve al inicial
+        """
+
+        self.nombre = nombre
+        self.objetivo = objetivo
+        self.timeout_latido = timeout_latido
+        self.memoria_max_mb = memoria_max_mb
+        self.nice = nice
+        self.cpus = cpus
+        self.backoff_inicial = backoff_inicial
+        self.backoff_max = backoff_max
+        self.estable_segundos = estable_segundos
+
+        self.proceso = None
+        self.latido = CONTEXTO_MP.Value('d', 0.0, lock=False)
+        self.parar = None
+        self.inicio = None
+        self.reinicios = 0
+        self.backoff = backoff_inicial
+        self.proximo_inicio = 0.0
+        self.ultimo_fallo = None
+        self.pausada = False
+
+    def vivo(self):
+        return self.proceso is not None and self.proceso.is_alive()
+
+class SupervisorProcesos:
+    """
+    Arranca, vigila y reinicia tareas en procesos hijos
+
+    Un thread ligero del padre revisa cada `intervalo` segundos: procesos
+    caídos (reinicio con backoff exponencial), latidos vencidos y memoria por
+    encima del límite (parada graceful y reinicio).
+    """
+
+    def __init__(self, intervalo=5, gracia=60, notificar=None, cola_log=None):
+        """
+        Args:
+            intervalo (float): Segundos entre revisiones
+            gracia (float): Segundos entre SIGTERM y SIGKILL al parar un proceso
+            notificar (callable): notificar(titulo, mensaje) ante reinicios
+            cola_log: Cola de logging del padre (production_config.cola_logging());
+                      sin ella los hijos escriben en stderr
+        """
+
+        self.logger = logging.getLogger(__name__)
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self.notificar = notificar
+        self.cola_log = cola_log
+        self.tareas = {}
+        self.running = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def registrar(self, tarea):
+        """Añadir una tarea (se arranca con iniciar())"""
+        self.tareas[tarea.nombre] = tarea
+        return tarea
+
+    def iniciar(self):
+        """Arrancar todas las tareas y el thread de supervisión"""
+
+        self.running = True
+        with self._lock:
+            for tarea in self.tareas.values():
+                self._arrancar(tarea)
+
+        self._thread = threading.Thread(target=self._bucle, name="supervisor", daemon=True)
+        self._thread.start()
+
+    def _arrancar(self, tarea):
+        nivel_log = logging.getLogger().getEffectiveLevel()
+
+        tarea.parar = CONTEXTO_MP.Event()
+        tarea.latido.value = time.time()
+        tarea.proceso = CONTEXTO_MP.Process(
+            target=_ejecutar_hijo,
+            args=(tarea.nombre, tarea.objetivo, tarea.latido, tarea.parar,
+                  tarea.nice, tarea.cpus, nivel_log, self.cola_log),
+            name=tarea.nombre
+        )
+        tarea.proceso.start()
+        tarea.inicio = time.time()
+        self.logger.info(f"✅ Proceso {tarea.nombre} iniciado (pid {tarea.proceso.pid})")
+
+    def _soltar(self, tarea):
+        """
+        Preparar la parada de una tarea (con el lock tomado)
+
+        Solo reanuda el árbol si estaba pausado y devuelve lo necesario para
+        terminarlo: la espera de terminar_arbol (hasta gracia + 5s) se hace con
+        _terminar() después de soltar el lock, para no bloquear pausar/reanudar,
+        estado() ni el bucle principal mientras tanto.
+
+        Returns:
+            tuple: (proceso, evento de parada) o None si no hay proceso
+        """
+
+        if tarea.proceso is None:
+            return None
+        if tarea.pausada:
+            # Un proceso detenido con SIGSTOP no atiende SIGTERM hasta recibir SIGCONT
+            self._senal_arbol(tarea, 'resume')
+            tarea.pausada = False
+        return tarea.proceso, tarea.parar
+
+    def _terminar(self, proceso, parar):
+        """Parar un proceso soltado con _soltar() (sin el lock)"""
+
+        if proceso.is_alive():
+            parar.set()
+            try:
+                terminar_arbol(psutil.Process(proceso.pid), self.gracia, self.logger)
+            except psutil.NoSuchProcess:
+                pass
+        proceso.join(timeout=5)
+
+    def _senal_arbol(self, tarea, accion):
+        """suspend/resume del proceso de la tarea y todos sus descendientes"""
+
+        try:
+            raiz = psutil.Process(tarea.proceso.pid)
+            procesos = [raiz] + raiz.children(recursive=True)
+        except psutil.Error:
+            return
+        for p in procesos:
+            try:
+                getattr(p, accion)()
+            except psutil.Error:
+                pass
+
+    def pausar(self, nombre):
+        """
+        Congelar una tarea (SIGSTOP a su árbol de procesos) para liberar CPU a otra de más prioridad
+
+        Returns:
+            bool: True si se ha pausado ahora
+        """
+
+        with self._lock:
+            tarea = self.tareas.get(nombre)
+            if tarea is None or tarea.pausada or not tarea.vivo():
+                return False
+            self._senal_arbol(tarea, 'suspend')
+            tarea.pausada = True
+        self.logger.info(f"⏸️ Proceso {nombre} pausado")
+        return True
+
+    def reanudar(self, nombre):
+        """
+        Reanudar una tarea pausada (SIGCONT)
+
+        Returns:
+            bool: True si se ha reanudado ahora
+        """
+
+        with self._lock:
+            tarea = self.tareas.get(nombre)
+            if tarea is None or not tarea.pausada:
+                return False
+            if tarea.vivo():
+                self._senal_arbol(tarea, 'resume')
+            tarea.pausada = False
+            # El tiempo en pausa no cuenta como falta de latido
+            tarea.latido.value = time.time()
+        self.logger.info(f"▶️ Proceso {nombre} reanudado")
+        return True
+
+    def _fallo(self, tarea, motivo):
+        """Registrar el fallo y programar el reinicio con backoff"""
+
+        ahora = time.time()
+        if tarea.inicio and ahora - tarea.inicio >= tarea.estable_segundos:
+            tarea.backoff = tarea.backoff_inicial
+
+        tarea.ultimo_fallo = motivo
+        tarea.proximo_inicio = ahora + tarea.backoff
+        self.logger.warning(f"⚠️ Proceso {tarea.nombre}: {motivo}. Reinicio en {tarea.backoff:.0f}s")
+        if self.notificar:
+            try:
+                self.notificar(
+                    f"⚠️ Proceso {tarea.nombre} reiniciado",
+                    f"{motivo}. Reinicio #{tarea.reinicios + 1} en {tarea.backoff:.0f}s."
+                )
+            except Exception as e:
+                self.logger.error(f"Error notificando reinicio: {e}")
+
+        tarea.backoff = min(tarea.backoff * 2, tarea.backoff_max)
+        tarea.proceso = None
+        tarea.pausada = False
+
+    def revisar(self):
+        """Una pasada de supervisión sobre todas las tareas"""
+
+        ahora = time.time()
+        a_terminar = []
+        with self._lock:
+            if not self.running:
+                return
+
+            for tarea in self.tareas.values():
+                if tarea.proceso is None:
+                    if ahora >= tarea.proximo_inicio:
+                        tarea.reinicios += 1
+                        self._arrancar(tarea)
+                    continue
+
+                if not tarea.proceso.is_alive():
+                    tarea.proceso.join(timeout=1)
+                    self._fallo(tarea, f"terminó con código {tarea.proceso.exitcode}")
+                    continue
+
+                if tarea.pausada:
+                    continue
+
+                sin_latido = ahora - tarea.latido.value
+                if sin_latido > tarea.timeout_latido:
+                    a_terminar.append(self._soltar(tarea))
+                    self._fallo(tarea, f"sin latido desde hace {sin_latido:.0f}s")
+                    continue
+
+                if tarea.memoria_max_mb:
+                    memoria = memoria_arbol_mb(tarea.proceso.pid)
+                    if memoria > tarea.memoria_max_mb:
+                        a_terminar.append(self._soltar(tarea))
+                        self._fallo(tarea, f"memoria {memoria:.0f}MB > límite {tarea.memoria_max_mb:.0f}MB")
+
+        # _fallo() ya desvinculó los procesos: el reinicio llega en una pasada
+        # posterior de este mismo thread, cuando estos ya han terminado
+        for proceso, parar in a_terminar:
+            self._terminar(proceso, parar)
+
+    def _bucle(self):
+        while self.running:
+            try:
+                self.revisar()
+            except Exception as e:
+                self.logger.error(f"Error en supervisor: {e}")
+            time.sleep(self.intervalo)
+
+    def detener(self):
+        """Parar todas las tareas (SIGTERM, y SIGKILL tras la gracia)"""
+
+        a_terminar = []
+        with self._lock:
+            self.running = False
+            for tarea in self.tareas.values():
+                if tarea.proceso is not None:
+                    self.logger.info(f"Deteniendo proceso {tarea.nombre}...")
+                    a_terminar.append(self._soltar(tarea))
+
+        for proceso, parar in a_terminar:
+            self._terminar(proceso, parar)
+
+        # El thread puede estar terminando procesos de su última pasada
+        if self._thread is not None:
+            self._thread.join(timeout=self.intervalo + self.gracia + 6)
+
+    def estado(self):
+        """
+        Estado de cada tarea
+
+        Returns:
+            dict: nombre -> pid, vivo, pausada, reinicios, segundos_sin_latido, memoria_mb, ultimo_fallo
+        """
+
+        ahora = time.time()
+        estado = {}
+        with self._lock:
+            for nombre, tarea in self.tareas.items():
+                vivo = tarea.vivo()
+                estado[nombre] = {
+                    'pid': tarea.proceso.pid if tarea.proceso is not None else None,
+                    'vivo': vivo,
+                    'pausada': tarea.pausada,
+                    'reinicios': tarea.reinicios,
+                    'segundos_sin_latido': ahora - tarea.latido.value if vivo else None,
+                    'memoria_mb': memoria_arbol_mb(tarea.proceso.pid) if vivo else 0.0,
+                    'ultimo_fallo': tarea.ultimo_fallo,
+                    'proximo_inicio': (
+                        datetime.fromtimestamp(tarea.proximo_inicio).isoformat() if not vivo else None
+                    )
+                }
+        return estado
@@ -10,10 +10,11 @@ from pathlib import Path
 # Agregar paths necesarios
 current_dir = Path(__file__).parent
 project_root = current_dir.parent
-sys.path.extend([str(current_dir), str(project_root)])
+sys.path.extend([str(current_dir), str(project_root), str(current_dir / 'cloud_deployment')])
 
-# Imports del sistema de producción
-from cloud_deployment.production_config import ProductionConfig, setup_logging
+# Imports del sistema de producción (production_config como módulo de primer
+# nivel, igual que en cloud_deployment/, para no cargarlo dos veces)
+from production_config import ProductionConfig, setup_logging
 from cloud_deployment.main import ProductionSystem
 
 def main():
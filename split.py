@@ -5,15 +5,25 @@ split.py - Dividir dataset para competencia Neuro-Kup
 Uso:
     python split.py
     
+    python split.py --particiones 5 --repeticiones 3
+    
 Genera:
     - train_colab.csv (70% del total)
     - train_local.csv (30% del total)
+    (o train_part{k}.csv con --particiones K, y sufijo _r{n} con --repeticiones)
+
+El archivo se lee por bloques, sin cargarlo entero en memoria: cada fila va a
+una partición según un hash estable de su ID, estratificado por clase del
+target. El resultado es reproducible y no requiere barajar el dataset.
 """
 
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+import argparse
 import os
+import queue
 import sys
+import threading
 
 # ================================
 # 🔧 CONFIGURACIÓN
@@ -23,9 +33,18 @@ import sys
 INPUT_FILE = 'train.csv'  # Cambia si tu archivo tiene otro nombre
 TARGET_COLUMN = None      # Si es None, busca automáticamente
 
+ID_COLUMN = 'ID'          # Columna usada para el hash (si no existe, se usa la fila entera)
+
 # Parámetros de división
 LOCAL_SIZE = 0.3              # 30% para local, 70% para colab
 RANDOM_STATE = 42
+PARTICIONES = {'train_colab.csv': 1 - LOCAL_SIZE, 'train_local.csv': LOCAL_SIZE}
+REPETICIONES = 1              # Divisiones independientes (semilla distinta cada una)
+
+# Lectura por bloques
+CHUNK_SIZE = 100_000          # Filas por bloque
+BLOQUES_EN_COLA = 4           # Bloques pendientes por archivo de salida (acota la memoria)
+BITS_HISTOGRAMA = 16          # Resolución de los cortes por clase (2^16 bins)
 
 # ================================
 # 🔍 FUNCIONES AUXILIARES
@@ -38,10 +57,13 @@ def encontrar_target_automatico(df):
         'target_column', 'diagnosis', 'disease', 'outcome', 'condición', 'condicion'
     ]
     
+    # Primero coincidencias exactas (si no, 'Enfermedad renal' ganaba a 'Condición')
     for col in df.columns:
-        col_lower = col.lower()
-        if col_lower in posibles_targets:
+        if col.lower() in posibles_targets:
             return col
+    
+    for col in df.columns:
+        col_lower = col.lower()
         if any(palabra in col_lower for palabra in ['target', 'enfermedad', 'coronaria', 'condición', 'condicion']):
             return col
     
@@ -60,24 +82,25 @@ def verificar_archivo(filepath):
         return False
     return True
 
-def mostrar_info_dataset(df, target_col):
-    """Mostrar información del dataset"""
+def mostrar_info_dataset(distribucion, target_col):
+    """Mostrar información del dataset a partir de la distribución del target"""
+    total = int(distribucion.sum())
+    
     print(f"📊 INFORMACIÓN DEL DATASET")
     print("="*40)
     print(f"Archivo: {INPUT_FILE}")
-    print(f"Dimensiones: {df.shape[0]:,} filas × {df.shape[1]} columnas")
+    print(f"Filas: {total:,}")
     print(f"Target: '{target_col}'")
     
     # Distribución del target
-    dist = df[target_col].value_counts()
     print(f"Distribución del target:")
-    for valor, cantidad in dist.items():
-        porcentaje = (cantidad / len(df)) * 100
+    for valor, cantidad in distribucion.items():
+        porcentaje = (cantidad / total) * 100
         print(f"  {valor}: {cantidad:,} ({porcentaje:.1f}%)")
     
     # Verificar balance
-    if len(dist) == 2:
-        ratio = min(dist) / max(dist)
+    if len(distribucion) == 2:
+        ratio = min(distribucion) / max(distribucion)
         if ratio < 0.3:
             print(f"⚠️  Dataset desbalanceado (ratio: {ratio:.2f})")
         else:
@@ -85,42 +108,174 @@ def mostrar_info_dataset(df, target_col):
     
     print("="*40)
 
-def dividir_dataset(df, target_col):
-    """Dividir el dataset en dos partes para comparación directa entre entornos"""
-    print(f"\n🔄 DIVIDIENDO DATASET...")
+def _mezclar_bits(x):
+    """splitmix64 vectorizado: hash estable uint64 -> uint64 (igual en cualquier máquina)"""
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+def _bins_hash(chunk, semilla):
+    """Bin (0 .. 2^BITS_HISTOGRAMA-1) de cada fila según el hash de su ID y la semilla"""
+    if ID_COLUMN in chunk.columns and chunk[ID_COLUMN].dtype.kind in 'iu':
+        base = chunk[ID_COLUMN].to_numpy().astype(np.uint64)
+    elif ID_COLUMN in chunk.columns:
+        base = pd.util.hash_array(chunk[ID_COLUMN].astype(str).to_numpy())
+    else:
+        base = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
     
-    X = df.drop(target_col, axis=1)
-    y = df[target_col]
+    sal = _mezclar_bits(np.array([semilla], dtype=np.uint64))
+    return (_mezclar_bits(base ^ sal) >> np.uint64(64 - BITS_HISTOGRAMA)).astype(np.int64)
+
+def _clases(chunk, target_col):
+    """Clase del target de cada fila como texto (agrupa también valores nulos o mezclados)"""
+    return chunk[target_col].astype(str).to_numpy()
+
+def _leer_bloques(input_file, columnas=None, chunk_size=CHUNK_SIZE):
+    return pd.read_csv(input_file, usecols=columnas, chunksize=chunk_size)
+
+def _nombres_archivos(particiones, repeticion, repeticiones):
+    if repeticiones == 1:
+        return list(particiones)
+    return [f"{os.path.splitext(nombre)[0]}_r{repeticion}.csv" for nombre in particiones]
+
+class _EscritorParticion(threading.Thread):
+    """Escribe en su archivo los bloques que recibe por una cola acotada"""
     
-    # División directa: Train Colab (70%) vs Train Local (30%)
-    X_train_colab, X_train_local, y_train_colab, y_train_local = train_test_split(
-        X, y,
-        test_size=LOCAL_SIZE,
-        random_state=RANDOM_STATE,
-        stratify=y
-    )
+    def __init__(self, archivo, columnas):
+        super().__init__(daemon=True)
+        self.archivo = archivo
+        self.columnas = columnas
+        self.cola = queue.Queue(maxsize=BLOQUES_EN_COLA)
+        self.error = None
+    
+    def run(self):
+        try:
+            with open(self.archivo, 'w', encoding='utf-8', newline='') as f:
+                pd.DataFrame(columns=self.columnas).to_csv(f, index=False)
+                while True:
+                    bloque = self.cola.get()
+                    if bloque is None:
+                        break
+                    bloque.to_csv(f, header=False, index=False)
+        except Exception as e:
+            self.error = e
+            # Seguir vaciando la cola para no bloquear al lector
+            while self.cola.get() is not None:
+                pass
+
+def dividir_dataset(input_file, target_col, particiones=None, repeticiones=REPETICIONES,
+                    semilla=RANDOM_STATE, chunk_size=CHUNK_SIZE):
+    """
+    División estratificada en K partes (y R repeticiones) leyendo por bloques
+    
+    1ª pasada (solo ID y target): histograma por clase del hash de cada fila.
+       De ahí salen, para cada clase, los cortes de hash que reparten sus filas
+       según las fracciones pedidas.
+    2ª pasada: cada bloque se reparte con esos cortes y los trozos se envían a
+       un thread escritor por archivo (colas acotadas: memoria ~ chunk_size).
+    
+    Args:
+        input_file (str): CSV de origen
+        target_col (str): Columna target (estratificación)
+        particiones (dict): {archivo: fracción}, fracciones que suman 1
+        repeticiones (int): Divisiones independientes (semilla + r)
+        semilla (int): Semilla del hash
+        chunk_size (int): Filas por bloque
+    
+    Returns:
+        dict: {archivo: pd.Series con filas por clase}
+    """
+    print(f"\n🔄 DIVIDIENDO DATASET POR BLOQUES...")
     
-    # Reconstruir DataFrames
-    train_colab = pd.concat([X_train_colab, y_train_colab], axis=1)
-    train_local = pd.concat([X_train_local, y_train_local], axis=1)
+    particiones = particiones or PARTICIONES
+    fracciones = np.asarray(list(particiones.values()), dtype=float)
+    if not np.isclose(fracciones.sum(), 1.0):
+        raise ValueError(f"❌ Las fracciones deben sumar 1 (suman {fracciones.sum():.3f})")
+    
+    n_bins = 1 << BITS_HISTOGRAMA
+    semillas = [semilla + r for r in range(repeticiones)]
+    
+    # 1ª pasada: histograma de bins de hash por (repetición, clase)
+    columnas = pd.read_csv(input_file, nrows=0).columns.tolist()
+    columnas_hash = [c for c in (ID_COLUMN, target_col) if c in columnas]
+    histogramas = [{} for _ in semillas]
+    
+    for chunk in _leer_bloques(input_file, columnas_hash if ID_COLUMN in columnas else None, chunk_size):
+        clases = _clases(chunk, target_col)
+        for r, semilla_r in enumerate(semillas):
+            bins = _bins_hash(chunk, semilla_r)
+            for clase in np.unique(clases):
+                if clase not in histogramas[r]:
+                    histogramas[r][clase] = np.zeros(n_bins, dtype=np.int64)
+                histogramas[r][clase] += np.bincount(bins[clases == clase], minlength=n_bins)
+    
+    # Cortes por clase: último bin de cada partición salvo la última
+    cortes = [{} for _ in semillas]
+    for r in range(repeticiones):
+        for clase, histograma in histogramas[r].items():
+            acumulado = np.cumsum(histograma)
+            objetivos = np.round(np.cumsum(fracciones)[:-1] * acumulado[-1])
+            cortes_clase = []
+            for objetivo in objetivos:
+                i = int(np.searchsorted(acumulado, objetivo))
+                # Quedarse con el borde de bin más cercano al objetivo
+                if i > 0 and abs(acumulado[i - 1] - objetivo) <= abs(acumulado[min(i, n_bins - 1)] - objetivo):
+                    i -= 1
+                cortes_clase.append(min(i, n_bins - 1))
+            cortes[r][clase] = np.asarray(cortes_clase)
+    
+    # 2ª pasada: repartir bloques y escribir en paralelo
+    escritores = {}
+    for r in range(repeticiones):
+        for archivo in _nombres_archivos(particiones, r, repeticiones):
+            escritores[archivo] = _EscritorParticion(archivo, columnas)
+            escritores[archivo].start()
+    
+    conteos = {archivo: {} for archivo in escritores}
+    try:
+        for chunk in _leer_bloques(input_file, None, chunk_size):
+            clases = _clases(chunk, target_col)
+            for r, semilla_r in enumerate(semillas):
+                bins = _bins_hash(chunk, semilla_r)
+                destino = np.zeros(len(chunk), dtype=np.int64)
+                for clase, cortes_clase in cortes[r].items():
+                    mascara = clases == clase
+                    destino[mascara] = np.searchsorted(cortes_clase, bins[mascara], side='left')
+                
+                for k, archivo in enumerate(_nombres_archivos(particiones, r, repeticiones)):
+                    mascara = destino == k
+                    for clase, cantidad in zip(*np.unique(clases[mascara], return_counts=True)):
+                        conteos[archivo][clase] = conteos[archivo].get(clase, 0) + int(cantidad)
+                    escritores[archivo].cola.put(chunk[mascara])
+    finally:
+        for escritor in escritores.values():
+            escritor.cola.put(None)
+        for escritor in escritores.values():
+            escritor.join()
+    
+    errores = [f"{e.archivo}: {e.error}" for e in escritores.values() if e.error is not None]
+    if errores:
+        raise IOError(f"❌ Error escribiendo particiones: {'; '.join(errores)}")
+    
+    conteos = {archivo: pd.Series(c, dtype=int).sort_index() for archivo, c in conteos.items()}
+    total = sum(int(c.sum()) for c in conteos.values()) // repeticiones
     
     # Mostrar resultados
     print(f"✅ División completada:")
-    print(f"  Train Colab:   {len(train_colab):,} muestras ({len(train_colab)/len(df)*100:.1f}%)")
-    print(f"  Train Local:   {len(train_local):,} muestras ({len(train_local)/len(df)*100:.1f}%)")
+    for archivo, c in conteos.items():
+        print(f"  {archivo}: {int(c.sum()):,} muestras ({c.sum()/total*100:.1f}%)")
     
-    return train_colab, train_local
+    return conteos
 
-def verificar_distribuciones(train_colab, train_local, target_col):
-    """Verificar que las distribuciones se mantienen"""
-    print(f"\n📈 VERIFICANDO DISTRIBUCIONES:")
+def verificar_distribuciones(conteos, target_col):
+    """Verificar que las distribuciones del target se mantienen en cada partición"""
+    print(f"\n📈 VERIFICANDO DISTRIBUCIONES ({target_col}):")
     
-    distribuciones = {}
-    for nombre, data in [('Colab', train_colab), ('Local', train_local)]:
-        dist = data[target_col].value_counts(normalize=True).sort_index()
-        distribuciones[nombre] = dist
-    
-    df_dist = pd.DataFrame(distribuciones).round(3)
+    df_dist = pd.DataFrame({
+        archivo: c / c.sum() for archivo, c in conteos.items()
+    }).fillna(0).round(3)
     print(df_dist)
     
     # Verificar consistencia
@@ -130,27 +285,29 @@ def verificar_distribuciones(train_colab, train_local, target_col):
     else:
         print(f"⚠️  Distribuciones variables (desv. std máx: {std_dev:.3f})")
 
-def guardar_archivos(train_colab, train_local):
-    """Guardar los archivos divididos"""
-    print(f"\n💾 GUARDANDO ARCHIVOS...")
-    
-    archivos = [
-        ('train_colab.csv', train_colab),
-        ('train_local.csv', train_local)
-    ]
+def guardar_archivos(conteos):
+    """Resumen de los archivos escritos por dividir_dataset"""
+    print(f"\n💾 ARCHIVOS GUARDADOS:")
     
     archivos_guardados = []
-    for filename, data in archivos:
-        data.to_csv(filename, index=False)
+    for filename, c in conteos.items():
         size_mb = os.path.getsize(filename) / (1024*1024)
-        print(f"  ✅ {filename} - {len(data):,} filas ({size_mb:.2f} MB)")
+        print(f"  ✅ {filename} - {int(c.sum()):,} filas ({size_mb:.2f} MB)")
         archivos_guardados.append(filename)
     
     return archivos_guardados
 
-def crear_info_file(train_colab, train_local, target_col):
+def crear_info_file(conteos, target_col, particiones=None, repeticiones=REPETICIONES):
     """Crear archivo con información de la división"""
-    total_samples = len(train_colab) + len(train_local)
+    particiones = particiones or PARTICIONES
+    total_samples = sum(int(c.sum()) for c in conteos.values()) // repeticiones
+    
+    distribucion = "\n".join(
+        f"- {archivo}: {int(c.sum()):,} muestras ({c.sum()/total_samples*100:.1f}%)"
+        for archivo, c in conteos.items()
+    )
+    fracciones = ", ".join(f"{archivo}: {fraccion}" for archivo, fraccion in particiones.items())
+    
     info_content = f"""DIVISIÓN DEL DATASET - COMPETENCIA NEURO-KUP
 ========================================
 
@@ -159,21 +316,20 @@ Target: {target_col}
 Fecha: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 DISTRIBUCIÓN:
-- train_colab.csv:   {len(train_colab):,} muestras
-- train_local.csv:   {len(train_local):,} muestras  
-- TOTAL:             {total_samples:,} muestras
-
-PORCENTAJES:
-- Colab:    {len(train_colab)/total_samples*100:.1f}%
-- Local:    {len(train_local)/total_samples*100:.1f}%
+{distribucion}
+- TOTAL: {total_samples:,} muestras
 
 CONFIGURACIÓN USADA:
-- LOCAL_SIZE: {LOCAL_SIZE} 
+- PARTICIONES: {fracciones}
+- REPETICIONES: {repeticiones}
 - RANDOM_STATE: {RANDOM_STATE}
+- ID_COLUMN: {ID_COLUMN}
 
 ESTRATEGIA:
-División directa en 2 partes para comparación entre entornos local y Colab.
-Eliminado el holdout set para maximizar datos de entrenamiento.
+Cada fila va a la partición que indica un hash estable de su ID (semilla
+RANDOM_STATE + repetición), con cortes calculados por clase del target para
+mantener su distribución. Se lee por bloques: no hace falta cargar ni barajar
+el dataset, y repetir la división con la misma configuración da los mismos archivos.
 """
     
     with open('split_info.txt', 'w', encoding='utf-8') as f:
@@ -185,44 +341,47 @@ Eliminado el holdout set para maximizar datos de entrenamiento.
 # 🚀 FUNCIÓN PRINCIPAL
 # ================================
 
-def main():
+def main(particiones=None, repeticiones=REPETICIONES, chunk_size=CHUNK_SIZE):
     """Función principal del script"""
     print("🎯 DIVISIÓN DE DATASET - COMPETENCIA NEURO-KUP")
     print("="*50)
     
+    particiones = particiones or PARTICIONES
+    
     # 1. Verificar archivo
     if not verificar_archivo(INPUT_FILE):
         return 1
     
-    # 2. Cargar datos
-    print(f"📁 Cargando {INPUT_FILE}...")
+    # 2. Leer solo la cabecera (los datos se procesan por bloques)
     try:
-        df = pd.read_csv(INPUT_FILE)
-        print(f"✅ Datos cargados: {len(df):,} filas")
+        cabecera = pd.read_csv(INPUT_FILE, nrows=0)
     except Exception as e:
-        print(f"❌ Error cargando archivo: {e}")
+        print(f"❌ Error leyendo archivo: {e}")
         return 1
     
     # 3. Identificar target
     target_col = TARGET_COLUMN
     if target_col is None:
-        target_col = encontrar_target_automatico(df)
+        target_col = encontrar_target_automatico(cabecera)
     
-    if target_col not in df.columns:
+    if target_col not in cabecera.columns:
         print(f"❌ Error: Columna target '{target_col}' no encontrada")
-        print(f"Columnas disponibles: {list(df.columns)}")
+        print(f"Columnas disponibles: {list(cabecera.columns)}")
         return 1
     
-    # 4. Mostrar información
-    mostrar_info_dataset(df, target_col)
-      # 5. Dividir dataset
-    train_colab, train_local = dividir_dataset(df, target_col)
-      # 6. Verificar distribuciones
-    verificar_distribuciones(train_colab, train_local, target_col)
+    # 4. Dividir dataset (por bloques, escribiendo las particiones en paralelo)
+    conteos = dividir_dataset(INPUT_FILE, target_col, particiones, repeticiones, chunk_size=chunk_size)
+    
+    # 5. Mostrar información
+    primeras = list(conteos.values())[:len(particiones)]
+    mostrar_info_dataset(sum(primeras[1:], primeras[0]), target_col)
+    
+    # 6. Verificar distribuciones
+    verificar_distribuciones(conteos, target_col)
     
-    # 7. Guardar archivos
-    archivos = guardar_archivos(train_colab, train_local)
-    crear_info_file(train_colab, train_local, target_col)
+    # 7. Resumen de archivos
+    archivos = guardar_archivos(conteos)
+    crear_info_file(conteos, target_col, particiones, repeticiones)
     
     # 8. Resumen final
     print("\n🎉 DIVISIÓN COMPLETADA EXITOSAMENTE")
@@ -231,10 +390,11 @@ def main():
     for archivo in archivos + ['split_info.txt']:
         print(f"  - {archivo}")
     
-    print("\n💡 PRÓXIMOS PASOS:")
-    print("  1. Sube 'train_colab.csv' a Google Colab")
-    print("  2. Usa 'train_local.csv' en tu entorno local")
-    print("  3. Compara resultados entre ambos entornos")
+    if set(particiones) == set(PARTICIONES):
+        print("\n💡 PRÓXIMOS PASOS:")
+        print("  1. Sube 'train_colab.csv' a Google Colab")
+        print("  2. Usa 'train_local.csv' en tu entorno local")
+        print("  3. Compara resultados entre ambos entornos")
     print("="*50)
     
     return 0
@@ -250,5 +410,15 @@ if __name__ == "__main__":
     # INPUT_FILE = 'mi_dataset.csv'
     # TARGET_COLUMN = 'mi_target'
     
-    exit_code = main()
+    parser = argparse.ArgumentParser(description='Dividir dataset para competencia Neuro-Kup')
+    parser.add_argument('--particiones', type=int, help='K particiones iguales (train_part{k}.csv)')
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES, help='Divisiones independientes')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Filas por bloque')
+    args = parser.parse_args()
+    
+    particiones = None
+    if args.particiones:
+        particiones = {f'train_part{k}.csv': 1 / args.particiones for k in range(args.particiones)}
+    
+    exit_code = main(particiones, args.repeticiones, args.chunk_size)
     sys.exit(exit_code)
\ No newline at end of file